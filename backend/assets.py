@@ -0,0 +1,142 @@
+import os
+import json
+import stat
+import logging
+
+import anyio
+from markupsafe import Markup, escape
+from starlette.datastructures import Headers
+from starlette.responses import Response
+from starlette.staticfiles import StaticFiles
+from dotenv import load_dotenv
+
+# Load environment variables from .env file
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Fingerprinted static assets.
+#
+# `python build_assets.py` (see there) copies frontend/static to ASSET_BUILD_DIR
+# under content-hashed names, adds WebP/AVIF variants of images and .gz/.br
+# copies of text files, and writes a manifest mapping each source path to its
+# outputs. Templates resolve URLs through the manifest with asset_url() and
+# picture(); the build directory is served at /assets with immutable caching,
+# since a changed file gets a new name. Without a build (local development)
+# the helpers fall back to the plain /static URLs.
+_FRONTEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "frontend")
+STATIC_SOURCE_DIR = os.getenv("STATIC_SOURCE_DIR", os.path.join(_FRONTEND_DIR, "static"))
+ASSET_BUILD_DIR = os.getenv("ASSET_BUILD_DIR", os.path.join(_FRONTEND_DIR, "dist"))
+MANIFEST_NAME = "manifest.json"
+ASSET_URL_PREFIX = "/assets"
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+# Preferred first: a browser uses the first <source> type it supports
+IMAGE_FORMATS = (("avif", "image/avif"), ("webp", "image/webp"))
+# Served pre-compressed when the client accepts it, preferred first
+PRECOMPRESSED = (("br", ".br"), ("gzip", ".gz"))
+
+
+def accepts_encoding(accept_encoding: str, encoding: str) -> bool:
+    """True if an Accept-Encoding header lists this encoding with a non-zero q-value."""
+    for part in accept_encoding.split(","):
+        name, *params = part.split(";")
+        if name.strip().lower() != encoding:
+            continue
+        for param in params:
+            key, _, value = param.strip().partition("=")
+            if key.strip().lower() == "q":
+                try:
+                    return float(value) > 0
+                except ValueError:
+                    return False
+        return True
+    return False
+
+
+class AssetManifest:
+    """Source path (e.g. 'css/style.css') -> built files, loaded from the build's manifest.json."""
+
+    def __init__(self, build_dir: str = ASSET_BUILD_DIR):
+        self.build_dir = build_dir
+        self.entries = {}
+        self.load()
+
+    def load(self):
+        path = os.path.join(self.build_dir, MANIFEST_NAME)
+        try:
+            with open(path) as f:
+                self.entries = json.load(f)["assets"]
+        except FileNotFoundError:
+            logger.info(f"No asset manifest at {path}; serving unversioned /static URLs")
+            self.entries = {}
+
+    def url(self, path: str) -> str:
+        entry = self.entries.get(path)
+        if entry is None:
+            return f"/static/{path}"
+        return f"{ASSET_URL_PREFIX}/{entry['file']}"
+
+    def srcset(self, path: str, image_format: str = "webp") -> str:
+        """'<url> 480w, <url> 960w, ...' for one variant format, or '' if none was built."""
+        variants = self.entries.get(path, {}).get("variants", {}).get(image_format, [])
+        return ", ".join(f"{ASSET_URL_PREFIX}/{file} {width}w" for width, file in variants)
+
+    def picture(self, path: str, alt: str = "", sizes: str = "100vw", lazy: bool = True, **attrs) -> Markup:
+        """
+        A <picture> with AVIF/WebP sources at every built width and the
+        fingerprinted original as the <img> fallback. Extra keyword arguments
+        become <img> attributes (class_ for class).
+        """
+        entry = self.entries.get(path, {})
+        img_attrs = {"src": self.url(path), "alt": alt}
+        if "width" in entry:
+            # Intrinsic size lets the browser reserve space before the image arrives
+            img_attrs["width"], img_attrs["height"] = entry["width"], entry["height"]
+        if lazy:
+            img_attrs["loading"] = "lazy"
+            img_attrs["decoding"] = "async"
+        img_attrs.update({name.rstrip("_"): value for name, value in attrs.items()})
+
+        sources = []
+        for image_format, mime_type in IMAGE_FORMATS:
+            srcset = self.srcset(path, image_format)
+            if srcset:
+                sources.append(
+                    f'<source type="{mime_type}" srcset="{escape(srcset)}" sizes="{escape(sizes)}">'
+                )
+        img = "<img " + " ".join(f'{name}="{escape(value)}"' for name, value in img_attrs.items()) + ">"
+        if not sources:
+            return Markup(img)
+        return Markup("<picture>" + "".join(sources) + img + "</picture>")
+
+
+class PrecompressedStaticFiles(StaticFiles):
+    """
+    StaticFiles for the fingerprinted build: serves the .br/.gz sibling of a
+    file when the client accepts that encoding, and marks everything immutable.
+    """
+
+    async def get_response(self, path: str, scope) -> Response:
+        accept_encoding = Headers(scope=scope).get("accept-encoding", "")
+        response = None
+        for encoding, suffix in PRECOMPRESSED:
+            if not accepts_encoding(accept_encoding, encoding):
+                continue
+            full_path, stat_result = await anyio.to_thread.run_sync(self.lookup_path, path + suffix)
+            if stat_result is not None and stat.S_ISREG(stat_result.st_mode):
+                # file_response() answers If-None-Match / If-Modified-Since with a 304; the
+                # media type it guesses for "x.css.br" is that of "x.css"
+                response = self.file_response(full_path, stat_result, scope)
+                if response.status_code == 200:
+                    response.headers["Content-Encoding"] = encoding
+                break
+        if response is None:
+            response = await super().get_response(path, scope)
+        if response.status_code in (200, 304):
+            response.headers["Cache-Control"] = IMMUTABLE_CACHE_CONTROL
+            response.headers["Vary"] = "Accept-Encoding"
+        return response
+
+
+asset_manifest = AssetManifest()
@@ -0,0 +1,70 @@
+import os
+import sys
+import json
+import shutil
+import tempfile
+import statistics
+import subprocess
+
+# Cold-start benchmark for template compilation. Each run is a fresh Python
+# process (like a new worker after a deploy) that loads every template the
+# way the startup warm-up does, in three setups: no bytecode cache (the old
+# behaviour), an empty cache (the first worker after a template change) and
+# a warm cache (every other worker and restart). Reports the median time to
+# have all templates compiled.
+#
+#   BENCH_RUNS=10 python backend/bench_cold_start.py
+
+BENCH_RUNS = int(os.getenv("BENCH_RUNS", "10"))
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+TEMPLATE_DIR = os.path.join(BACKEND_DIR, "..", "frontend", "templates")
+
+WORKER = """
+import sys, json, time
+started = time.perf_counter()
+from jinja2 import Environment, FileSystemLoader
+from template_cache import StartupTimer, enable_bytecode_cache
+env = Environment(loader=FileSystemLoader(sys.argv[1]))
+if sys.argv[2]:
+    enable_bytecode_cache(env, sys.argv[2])
+timer = StartupTimer()
+timer.precompile(env)
+print(json.dumps({"seconds": time.perf_counter() - started, **timer.metrics(env)}))
+"""
+
+
+def run_worker(cache_dir: str) -> dict:
+    output = subprocess.run(
+        [sys.executable, "-c", WORKER, TEMPLATE_DIR, cache_dir],
+        cwd=BACKEND_DIR, check=True, capture_output=True, text=True,
+    ).stdout
+    return json.loads(output.splitlines()[-1])
+
+
+def report(label: str, results: list):
+    total = statistics.median(r["seconds"] for r in results)
+    compile_only = statistics.median(r["templates"]["seconds"] for r in results)
+    cache = results[-1]["bytecode_cache"] or {}
+    print(f"{label:<14} {total * 1000:7.1f} ms to compiled ({compile_only * 1000:6.1f} ms in templates), "
+          f"{cache.get('loaded', 0)} read from cache, {cache.get('compiled', 0)} compiled")
+
+
+def main():
+    cache_dir = tempfile.mkdtemp(prefix="bench_templates_")
+    try:
+        report("no cache", [run_worker("") for _ in range(BENCH_RUNS)])
+        empty = []
+        for _ in range(BENCH_RUNS):
+            shutil.rmtree(cache_dir)
+            empty.append(run_worker(cache_dir))
+        report("empty cache", empty)
+        report("warm cache", [run_worker(cache_dir) for _ in range(BENCH_RUNS)])
+        failed = empty[-1]["templates"]["failed"]
+        if failed:
+            print(f"Failed to compile: {', '.join(failed)}")
+    finally:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
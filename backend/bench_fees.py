@@ -0,0 +1,94 @@
+import os
+import sys
+import time
+import random
+import json
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from fees import FeeConfig
+
+# Benchmark and parity check for the fee engine. Replays random calculator
+# selections through a line-by-line port of the student page's calculateFee()
+# and through FeeSchedule (both driven by fee_config.json), checks they agree, and reports quotes
+# per second for both, plus full JSON-ready quotes as served by /api/quote.
+#
+#   BENCH_QUOTES=200000 python backend/bench_fees.py
+
+BENCH_QUOTES = int(os.getenv("BENCH_QUOTES", "200000"))
+BENCH_SEED = int(os.getenv("BENCH_SEED", "42"))
+
+SAMPLE_SUBJECTS = [
+    "Mathematics - 4024P", "Physics - 5054R", "Chemistry - 5070", "Biology - 5090",
+    "English Language - 1123", "Urdu - Class 3", "Mathematics - Class 5", "Islamiyat - Class 2",
+    "CAF-8 Audit and Assurance", "Audit & Assurance", "Economics - 2281", "Computer Science",
+]
+
+
+def make_reference_fee(tables):
+    """The calculator formula as written in student.html, evaluated naively."""
+    def reference_fee(area, board, subjects):
+        area_fee = tables["area_fees"].get(area, tables["default_area_fee"])
+        board_fee = tables["board_fees"].get(board, tables["default_board_fee"])
+        total = area_fee + board_fee
+        if board not in tables["board_fees"]:
+            total += len(subjects) * tables["standard_subject_fee"]
+        else:
+            cap = area_fee + board_fee
+            for subject in subjects:
+                if subject.split(" - ")[0] in tables["premium_subjects"]:
+                    fee = tables["premium_subject_fee"]
+                else:
+                    fee = tables["standard_subject_fee"]
+                total += min(fee, cap)
+        board_cap = tables["board_caps"].get(board)
+        if board_cap is not None and total > board_cap:
+            total = board_cap
+        return total
+    return reference_fee
+
+
+def random_selections(n, rng, tables):
+    areas = list(tables["area_fees"]) + ["Unknown Area"]
+    boards = list(tables["board_fees"]) + ["Others", "My Local Board"]
+    return [
+        (rng.choice(areas), rng.choice(boards), rng.sample(SAMPLE_SUBJECTS, rng.randint(0, 8)))
+        for _ in range(n)
+    ]
+
+
+def timed(label, fn, selections):
+    start = time.perf_counter()
+    for area, board, subjects in selections:
+        fn(area, board, subjects)
+    elapsed = time.perf_counter() - start
+    print(f"{label:<28} {len(selections) / elapsed:>12,.0f} quotes/s  ({elapsed * 1e6 / len(selections):.2f} us/quote)")
+
+
+def main():
+    rng = random.Random(BENCH_SEED)
+    config = FeeConfig(poll_seconds=0)
+    tables = json.loads(config.asset)
+    reference_fee = make_reference_fee(tables)
+    schedule = config.schedule
+    selections = random_selections(BENCH_QUOTES, rng, tables)
+
+    mismatches = [
+        (sel, reference_fee(*sel), schedule.total_fee(*sel))
+        for sel in selections[:20000]
+        if reference_fee(*sel) != schedule.total_fee(*sel)
+    ]
+    if mismatches:
+        for sel, expected, got in mismatches[:10]:
+            print(f"MISMATCH {sel}: reference={expected} engine={got}")
+        sys.exit(1)
+    print("Parity: engine matches the calculator formula")
+
+    timed("reference formula", reference_fee, selections)
+    timed("engine total_fee", schedule.total_fee, selections)
+    timed("engine quote (API payload)", schedule.quote, selections)
+    print(f"Subject classification cache: {schedule.is_premium.cache_info()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+import os
+import sys
+import json
+import gzip
+import shutil
+import hashlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from PIL import Image, features
+
+from assets import STATIC_SOURCE_DIR, ASSET_BUILD_DIR, MANIFEST_NAME
+
+# Static asset build: run before deploying (from backend/), or whenever
+# frontend/static changes.
+#
+#   python build_assets.py
+#
+# Every file under STATIC_SOURCE_DIR is copied to ASSET_BUILD_DIR as
+# <name>.<hash>.<ext>. Text assets also get .gz and, with the optional
+# `brotli` package, .br copies to serve pre-compressed. JPEG/PNG images get
+# WebP and (when Pillow has AVIF support) AVIF variants at each width in
+# IMAGE_WIDTHS below their own width. Outputs are named by content, so an
+# unchanged file is skipped on the next run, and a new manifest.json records
+# what the templates should link to. User uploads are not part of the build.
+HASH_LENGTH = 12
+IMAGE_WIDTHS = (480, 960, 1600)
+VARIANT_QUALITY = {"webp": 78, "avif": 55}
+COMPRESSIBLE = {".css", ".js", ".svg", ".json", ".txt"}
+RESIZABLE = {".jpg", ".jpeg", ".png"}
+SKIP_DIRS = {"uploads"}
+
+
+def content_hash(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()[:HASH_LENGTH]
+
+
+def _write_atomic(target: str, data: bytes):
+    temp = f"{target}.part"
+    with open(temp, "wb") as f:
+        f.write(data)
+    os.replace(temp, target)
+
+
+def compress_text(target: str):
+    """Write target.gz, and target.br if brotli is installed."""
+    with open(target, "rb") as f:
+        data = f.read()
+    if not os.path.exists(target + ".gz"):
+        # mtime=0 keeps the .gz bytes reproducible between builds
+        _write_atomic(target + ".gz", gzip.compress(data, compresslevel=9, mtime=0))
+    if not os.path.exists(target + ".br"):
+        try:
+            # Imported lazily so brotli is only needed for .br output
+            import brotli
+        except ImportError:
+            return
+        _write_atomic(target + ".br", brotli.compress(data, quality=11))
+
+
+def image_variants(source: str, stem: str, formats, build_dir: str = ASSET_BUILD_DIR) -> dict:
+    """
+    Write resized variants of one image and return
+    {"width", "height", "variants": {format: [[width, relative path], ...]}}.
+    Runs in a worker process.
+    """
+    with Image.open(source) as original:
+        width, height = original.size
+        # Keep transparency for PNGs; everything else is flattened to RGB
+        mode = "RGBA" if original.mode in ("RGBA", "LA", "P") and source.lower().endswith(".png") else "RGB"
+        image = original.convert(mode)
+        # Every breakpoint below the image's own width, plus its own width unless it is larger still
+        widths = [w for w in IMAGE_WIDTHS if w < width] + ([width] if width <= IMAGE_WIDTHS[-1] else [])
+        variants = {}
+        for image_format in formats:
+            variants[image_format] = []
+            for target_width in widths:
+                relative = f"{stem}.{target_width}w.{image_format}"
+                target = os.path.join(build_dir, relative)
+                if not os.path.exists(target):
+                    resized = image if target_width == width else image.resize(
+                        (target_width, round(height * target_width / width)), Image.LANCZOS
+                    )
+                    temp = f"{target}.part"
+                    resized.save(temp, image_format.upper(), quality=VARIANT_QUALITY[image_format])
+                    os.replace(temp, target)
+                variants[image_format].append([target_width, relative])
+    return {"width": width, "height": height, "variants": variants}
+
+
+def build(source_dir: str = STATIC_SOURCE_DIR, build_dir: str = ASSET_BUILD_DIR) -> dict:
+    formats = ["webp"] + (["avif"] if features.check("avif") else [])
+    if "avif" not in formats:
+        print("Pillow was built without AVIF support; writing WebP variants only")
+
+    assets = {}
+    image_jobs = {}
+    with ProcessPoolExecutor(mp_context=multiprocessing.get_context("spawn")) as pool:
+        for directory, dirnames, filenames in os.walk(source_dir):
+            dirnames[:] = [d for d in dirnames if d not in SKIP_DIRS and not d.startswith(".")]
+            for filename in sorted(filenames):
+                if filename.startswith("."):
+                    continue
+                source = os.path.join(directory, filename)
+                path = os.path.relpath(source, source_dir).replace(os.sep, "/")
+                base, ext = os.path.splitext(path)
+                stem = f"{base}.{content_hash(source)}"
+                hashed = f"{stem}{ext}"
+
+                target = os.path.join(build_dir, hashed)
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                if not os.path.exists(target):
+                    shutil.copyfile(source, target)
+                assets[path] = {"file": hashed}
+
+                if ext.lower() in COMPRESSIBLE:
+                    compress_text(target)
+                elif ext.lower() in RESIZABLE:
+                    image_jobs[path] = pool.submit(image_variants, source, stem, formats, build_dir)
+
+        for path, job in image_jobs.items():
+            assets[path].update(job.result())
+
+    manifest = {"assets": assets}
+    _write_atomic(os.path.join(build_dir, MANIFEST_NAME), json.dumps(manifest, indent=1, sort_keys=True).encode())
+    return manifest
+
+
+def report(manifest: dict, source_dir: str = STATIC_SOURCE_DIR, build_dir: str = ASSET_BUILD_DIR):
+    """Print source size against the smallest variant each browser would get."""
+    source_total = best_total = 0
+    for path, entry in manifest["assets"].items():
+        source_size = os.path.getsize(os.path.join(source_dir, path))
+        sizes = [os.path.getsize(os.path.join(build_dir, entry["file"]))]
+        for image_format, variants in entry.get("variants", {}).items():
+            # The widest variant, i.e. what a desktop browser downloads
+            sizes.append(os.path.getsize(os.path.join(build_dir, variants[-1][1])))
+        for suffix in (".br", ".gz"):
+            if os.path.exists(os.path.join(build_dir, entry["file"] + suffix)):
+                sizes.append(os.path.getsize(os.path.join(build_dir, entry["file"] + suffix)))
+        source_total += source_size
+        best_total += min(sizes)
+    print(f"{len(manifest['assets'])} assets: {source_total / 1e6:.1f} MB source, "
+          f"{best_total / 1e6:.1f} MB at the widest size in the best format")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] not in ("build", "report"):
+        print("Usage: python build_assets.py [build|report]")
+        sys.exit(2)
+    if len(sys.argv) > 1 and sys.argv[1] == "report":
+        with open(os.path.join(ASSET_BUILD_DIR, MANIFEST_NAME)) as f:
+            report(json.load(f))
+    else:
+        report(build())
@@ -1,5 +1,6 @@
 import os
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from dotenv import load_dotenv
@@ -17,6 +18,9 @@ db_name = os.getenv("DB_NAME")
 # Database connection URL constructed from environment variables
 DATABASE_URL = f"postgresql://{db_user}:{db_password}@{db_host}:{db_port}/{db_name}"
 
+# Async connection URL (asyncpg driver) used by the request handlers in main.py
+ASYNC_DATABASE_URL = f"postgresql+asyncpg://{db_user}:{db_password}@{db_host}:{db_port}/{db_name}"
+
 # Create SQLAlchemy engine
 engine = create_engine(
     DATABASE_URL,
@@ -26,13 +30,37 @@ engine = create_engine(
     pool_recycle=1800      # Recycle connections after 30 minutes to prevent stale connections
 )
 
+# Create async SQLAlchemy engine (same pool settings as the sync engine)
+async_engine = create_async_engine(
+    ASYNC_DATABASE_URL,
+    pool_size=20,
+    max_overflow=10,
+    pool_timeout=30,
+    pool_recycle=1800
+)
+
 # Create session factory
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
-# Base class for SQLAlchemy models
+# Create async session factory.
+# expire_on_commit=False so handlers can keep reading attributes after commit
+# without triggering an implicit (blocking) lazy load.
+AsyncSessionLocal = async_sessionmaker(
+    bind=async_engine,
+    class_=AsyncSession,
+    autoflush=False,
+    expire_on_commit=False
+)
+
+# Sync session dependency (used by scripts such as init_db.py and admin.py)
 def get_db():
     db = SessionLocal()
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+# Async session dependency for FastAPI request handlers
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
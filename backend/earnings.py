@@ -0,0 +1,254 @@
+import sys
+from collections import defaultdict
+from datetime import datetime, timezone
+
+from sqlalchemy import Date, cast, delete, func, literal_column, select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from models import StudentRegistration, LeadStatus, TutorMonthlyEarning
+
+# Tutor income: every matched lead earns its total_fee once per calendar month,
+# from the month it was created up to its end_date (or now, if still ongoing).
+#
+# The tutor_monthly_earnings rollup holds the result per (tutor, month). It is
+# refreshed for a single tutor whenever one of their leads changes state, and
+# extended into the new month for ongoing tuitions by the nightly job:
+#
+#   python earnings.py rebuild   # regenerate the whole rollup from scratch
+#   python earnings.py extend    # nightly: refresh tutors with ongoing tuitions
+#   python earnings.py parity    # compare SQL aggregation with the Python reference
+#
+# `parity` checks whatever data the configured database holds; the edge cases
+# (month ends, year rollover, end dates before the creation time of day) are
+# checked against a fixture by tests/test_earnings.py.
+#
+# Refreshes of the same tutor are serialized with a transaction-level advisory
+# lock: two lead transitions (or a transition and the nightly job) would
+# otherwise each compute the rows without seeing the other's uncommitted lead
+# change, and the later commit would store a stale sum.
+
+# First key of the two-key advisory lock, so the tutor id cannot collide with other advisory locks
+EARNINGS_LOCK_NAMESPACE = 6006
+EXTEND_BATCH = 100  # Tutors per transaction in the nightly job, so it holds few locks at a time
+
+
+def _lead_months(*conditions):
+    """
+    Subquery with one (tutor_id, month, total_fee) row per lead per month.
+
+    Each lead is expanded with generate_series starting at the first day of its
+    creation month (keeping the creation time of day) and stepping one month
+    while still <= end_date / now, exactly like the previous Python loop.
+    """
+    lead = StudentRegistration
+    series_start = (
+        func.date_trunc("month", lead.created_at)
+        + (lead.created_at - func.date_trunc("day", lead.created_at))
+    )
+    series_end = func.coalesce(lead.end_date, func.timezone("utc", func.now()))
+
+    return select(
+        lead.accepted_by_tutor_id.label("tutor_id"),
+        func.generate_series(series_start, series_end, literal_column("interval '1 month'")).label("month"),
+        lead.total_fee.label("total_fee"),
+    ).where(
+        lead.accepted_by_tutor_id.isnot(None),
+        lead.status == LeadStatus.TUTOR_MATCHED,
+        lead.created_at.isnot(None),
+        lead.total_fee.isnot(None),
+        *conditions,
+    ).subquery()
+
+
+def monthly_income_query(tutor_id: int):
+    """One grouped query returning (YYYY-MM, income) rows for a tutor, oldest first."""
+    lead_months = _lead_months(StudentRegistration.accepted_by_tutor_id == tutor_id)
+    month_key = func.to_char(lead_months.c.month, "YYYY-MM")
+    return (
+        select(month_key.label("month"), func.sum(lead_months.c.total_fee).label("income"))
+        .group_by(month_key)
+        .order_by(month_key)
+    )
+
+
+def rollup_statements(tutor_ids=None):
+    """
+    DELETE + INSERT ... SELECT statements that regenerate the rollup rows.
+
+    tutor_ids=None regenerates every tutor; otherwise only the given tutors.
+    Callers refreshing single tutors lock them first (lock_statements); the
+    upsert is a fallback so an unlocked rebuild cannot fail on a duplicate key.
+    """
+    conditions = []
+    delete_stmt = delete(TutorMonthlyEarning)
+    if tutor_ids is not None:
+        tutor_ids = list(tutor_ids)
+        conditions.append(StudentRegistration.accepted_by_tutor_id.in_(tutor_ids))
+        delete_stmt = delete_stmt.where(TutorMonthlyEarning.tutor_id.in_(tutor_ids))
+
+    lead_months = _lead_months(*conditions)
+    month_start = cast(func.date_trunc("month", lead_months.c.month), Date)
+    insert_stmt = insert(TutorMonthlyEarning).from_select(
+        ["tutor_id", "month", "income"],
+        select(lead_months.c.tutor_id, month_start, func.sum(lead_months.c.total_fee))
+        .group_by(lead_months.c.tutor_id, month_start),
+    )
+    insert_stmt = insert_stmt.on_conflict_do_update(
+        index_elements=[TutorMonthlyEarning.tutor_id, TutorMonthlyEarning.month],
+        set_={"income": insert_stmt.excluded.income},
+    )
+    return [delete_stmt, insert_stmt]
+
+
+def lock_statements(tutor_ids):
+    """pg_advisory_xact_lock per tutor, in id order so concurrent callers cannot deadlock."""
+    return [
+        select(func.pg_advisory_xact_lock(EARNINGS_LOCK_NAMESPACE, tutor_id))
+        for tutor_id in sorted(set(tutor_ids))
+    ]
+
+
+def ongoing_tutor_ids_query():
+    """Tutors with at least one matched tuition that has not ended."""
+    return (
+        select(StudentRegistration.accepted_by_tutor_id)
+        .where(
+            StudentRegistration.status == LeadStatus.TUTOR_MATCHED,
+            StudentRegistration.accepted_by_tutor_id.isnot(None),
+            StudentRegistration.end_date.is_(None),
+        )
+        .distinct()
+    )
+
+
+async def refresh_tutor_earnings(db: AsyncSession, tutor_id: int):
+    """Regenerate one tutor's rollup rows inside the caller's transaction (caller commits)."""
+    if tutor_id is None:
+        return
+    # The session does not autoflush, so push pending lead changes first
+    await db.flush()
+    for stmt in lock_statements([tutor_id]) + rollup_statements([tutor_id]):
+        await db.execute(stmt)
+
+
+async def get_monthly_income(db: AsyncSession, tutor_id: int) -> dict:
+    """Return {"YYYY-MM": income} for a tutor from the rollup, ordered by month."""
+    rows = (await db.execute(
+        select(TutorMonthlyEarning.month, TutorMonthlyEarning.income)
+        .where(TutorMonthlyEarning.tutor_id == tutor_id)
+        .order_by(TutorMonthlyEarning.month)
+    )).all()
+    return {row.month.strftime("%Y-%m"): row.income for row in rows}
+
+
+async def get_platform_monthly_revenue(db: AsyncSession) -> dict:
+    """Return {"YYYY-MM": income} summed over all tutors, ordered by month."""
+    rows = (await db.execute(
+        select(TutorMonthlyEarning.month, func.sum(TutorMonthlyEarning.income).label("income"))
+        .group_by(TutorMonthlyEarning.month)
+        .order_by(TutorMonthlyEarning.month)
+    )).all()
+    return {row.month.strftime("%Y-%m"): row.income for row in rows}
+
+
+def compute_monthly_income(leads, current_date: datetime) -> dict:
+    """Reference Python implementation (used by the parity check below)."""
+    monthly_income = defaultdict(float)
+    for lead in leads:
+        if lead.created_at and lead.total_fee is not None:
+            start_date = lead.created_at.replace(tzinfo=timezone.utc)
+            end_date = lead.end_date.replace(tzinfo=timezone.utc) if lead.end_date else current_date
+            iter_date = start_date.replace(day=1)
+            while iter_date <= end_date:
+                monthly_income[iter_date.strftime("%Y-%m")] += lead.total_fee
+                if iter_date.month == 12:
+                    iter_date = iter_date.replace(year=iter_date.year + 1, month=1)
+                else:
+                    iter_date = iter_date.replace(month=iter_date.month + 1)
+    return {month: monthly_income[month] for month in sorted(monthly_income)}
+
+
+def rebuild_rollup():
+    """Regenerate tutor_monthly_earnings from scratch."""
+    from database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        for stmt in rollup_statements():
+            db.execute(stmt)
+        db.commit()
+        print("Rebuilt tutor_monthly_earnings")
+    finally:
+        db.close()
+
+
+def extend_ongoing():
+    """Nightly job: carry ongoing tuitions into the current month."""
+    from database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        tutor_ids = db.execute(ongoing_tutor_ids_query()).scalars().all()
+        for start in range(0, len(tutor_ids), EXTEND_BATCH):
+            batch = tutor_ids[start:start + EXTEND_BATCH]
+            for stmt in lock_statements(batch) + rollup_statements(batch):
+                db.execute(stmt)
+            db.commit()
+        print(f"Refreshed earnings for {len(tutor_ids)} tutors with ongoing tuitions")
+    finally:
+        db.close()
+
+
+def parity_mismatches(db, tutor_ids) -> list:
+    """(tutor_id, python, sql) for each tutor whose SQL aggregation differs from the Python reference."""
+    mismatches = []
+    for tutor_id in tutor_ids:
+        if tutor_id is None:
+            continue
+        current_date = db.execute(select(func.now())).scalar().astimezone(timezone.utc)
+        leads = db.execute(
+            select(StudentRegistration).where(
+                StudentRegistration.accepted_by_tutor_id == tutor_id,
+                StudentRegistration.status == LeadStatus.TUTOR_MATCHED,
+            )
+        ).scalars().all()
+        expected = compute_monthly_income(leads, current_date)
+        actual = {row.month: row.income for row in db.execute(monthly_income_query(tutor_id))}
+        if expected != actual:
+            mismatches.append((tutor_id, expected, actual))
+    return mismatches
+
+
+def check_parity():
+    """Compare the SQL aggregation with the Python reference for every tutor with matched leads."""
+    from database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        tutor_ids = db.execute(
+            select(StudentRegistration.accepted_by_tutor_id)
+            .where(StudentRegistration.status == LeadStatus.TUTOR_MATCHED)
+            .distinct()
+        ).scalars().all()
+        mismatches = parity_mismatches(db, tutor_ids)
+        for tutor_id, expected, actual in mismatches:
+            print(f"Tutor {tutor_id}: python={expected} sql={actual}")
+        print(f"Checked {len(tutor_ids)} tutors, {len(mismatches)} mismatches")
+        return not mismatches
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    # Run from backend/
+    command = sys.argv[1] if len(sys.argv) > 1 else "parity"
+    if command == "rebuild":
+        rebuild_rollup()
+    elif command == "extend":
+        extend_ongoing()
+    elif command == "parity":
+        sys.exit(0 if check_parity() else 1)
+    else:
+        print("Usage: python earnings.py [rebuild|extend|parity]")
+        sys.exit(2)
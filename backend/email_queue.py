@@ -0,0 +1,266 @@
+import os
+import time
+import asyncio
+import logging
+from datetime import datetime, timedelta, timezone
+from email.message import EmailMessage
+
+from sqlalchemy import delete, func, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from dotenv import load_dotenv
+
+from database import AsyncSessionLocal
+from models import OutboundEmail, EmailStatus
+from mailer import mail_pool
+
+# Load environment variables from .env file
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Outbound email queue configuration
+EMAIL_QUEUE_WORKERS = int(os.getenv("EMAIL_QUEUE_WORKERS", "2"))
+EMAIL_QUEUE_BATCH_SIZE = int(os.getenv("EMAIL_QUEUE_BATCH_SIZE", "20"))
+EMAIL_QUEUE_MAX_ATTEMPTS = int(os.getenv("EMAIL_QUEUE_MAX_ATTEMPTS", "6"))
+EMAIL_QUEUE_BACKOFF_SECONDS = float(os.getenv("EMAIL_QUEUE_BACKOFF_SECONDS", "5"))
+EMAIL_QUEUE_POLL_SECONDS = float(os.getenv("EMAIL_QUEUE_POLL_SECONDS", "5"))
+# A claimed row not marked sent/failed within this time is picked up again (crashed worker)
+EMAIL_QUEUE_LEASE_SECONDS = float(os.getenv("EMAIL_QUEUE_LEASE_SECONDS", "120"))
+# Sent and failed rows (bodies already cleared) are deleted after this many days
+EMAIL_RETENTION_DAYS = float(os.getenv("EMAIL_RETENTION_DAYS", "7"))
+EMAIL_RETENTION_SWEEP_SECONDS = 3600
+EMAIL_RETENTION_BATCH = 5000
+
+OTP_SUBJECT = "Your TutEx OTP Verification Code"
+
+
+def utcnow() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def otp_body(otp: str) -> str:
+    return f"Your TutEx OTP code is: {otp}\nThis code is valid for 5 minutes."
+
+
+async def enqueue_email(db: AsyncSession, recipient: str, subject: str, body: str, kind: str = "otp"):
+    """
+    Add an email to the queue inside the caller's transaction (caller commits, then calls wake()).
+
+    If the recipient already has an unsent email of the same kind, that row is
+    rewritten instead, so rapid resends deliver only the newest code.
+    """
+    if not recipient:
+        raise ValueError("Email address is required to send OTP")
+
+    existing = (await db.execute(
+        select(OutboundEmail).where(
+            OutboundEmail.recipient == recipient,
+            OutboundEmail.kind == kind,
+            OutboundEmail.status == EmailStatus.PENDING.value,
+        ).with_for_update(skip_locked=True)
+    )).scalars().first()
+
+    if existing:
+        existing.subject = subject
+        existing.body = body
+        existing.next_attempt_at = utcnow()
+        email_queue.stats["deduplicated"] += 1
+        return existing
+
+    email = OutboundEmail(recipient=recipient, kind=kind, subject=subject, body=body)
+    db.add(email)
+    email_queue.stats["enqueued"] += 1
+    return email
+
+
+async def enqueue_otp_email(db: AsyncSession, recipient: str, otp: str):
+    return await enqueue_email(db, recipient, OTP_SUBJECT, otp_body(otp), kind="otp")
+
+
+class EmailQueue:
+    """In-process workers draining the outbound_emails table with retries and backoff."""
+
+    def __init__(self, workers: int = EMAIL_QUEUE_WORKERS, batch_size: int = EMAIL_QUEUE_BATCH_SIZE):
+        self.workers = workers
+        self.batch_size = batch_size
+        self._tasks = []
+        self._wakeup = None
+        self.stats = {
+            "enqueued": 0,
+            "deduplicated": 0,
+            "sent": 0,
+            "retried": 0,
+            "failed": 0,
+            "send_seconds_total": 0.0,
+            "send_seconds_max": 0.0,
+        }
+
+    def wake(self):
+        """Let an idle worker pick up newly committed emails without waiting for the next poll."""
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def _claim_batch(self) -> list:
+        now = utcnow()
+        async with AsyncSessionLocal() as db:
+            rows = (await db.execute(
+                select(OutboundEmail).where(
+                    or_(
+                        OutboundEmail.status == EmailStatus.PENDING.value,
+                        OutboundEmail.status == EmailStatus.SENDING.value,  # expired lease
+                    ),
+                    OutboundEmail.next_attempt_at <= now,
+                ).order_by(OutboundEmail.next_attempt_at)
+                .limit(self.batch_size)
+                .with_for_update(skip_locked=True)
+            )).scalars().all()
+            for row in rows:
+                row.status = EmailStatus.SENDING.value
+                row.attempts += 1
+                row.next_attempt_at = now + timedelta(seconds=EMAIL_QUEUE_LEASE_SECONDS)
+            await db.commit()
+            return [(row.id, row.recipient, row.subject, row.body, row.attempts) for row in rows]
+
+    async def _send_batch(self, batch: list):
+        email_user = os.getenv("EMAIL_USER")
+        messages = []
+        for email_id, recipient, subject, body, attempts in batch:
+            msg = EmailMessage()
+            msg["From"] = email_user
+            msg["To"] = recipient
+            msg["Subject"] = subject
+            msg.set_content(body)
+            messages.append(msg)
+
+        # The whole claimed batch goes out over one SMTP session
+        start = time.perf_counter()
+        errors = await mail_pool.send_many(messages)
+        # Latency per message is its share of the batch
+        elapsed = (time.perf_counter() - start) / len(messages)
+        self.stats["send_seconds_total"] += elapsed * len(messages)
+        self.stats["send_seconds_max"] = max(self.stats["send_seconds_max"], elapsed)
+
+        results = {}
+        for (email_id, recipient, *_), error in zip(batch, errors):
+            if error is None:
+                results[email_id] = None
+            else:
+                logger.error(f"Failed to send email {email_id} to {recipient}: {str(error)}")
+                results[email_id] = str(error)[:500]
+
+        # Record every outcome of the batch in one transaction
+        now = utcnow()
+        async with AsyncSessionLocal() as db:
+            rows = (await db.execute(
+                select(OutboundEmail).where(OutboundEmail.id.in_(list(results)))
+            )).scalars().all()
+            for row in rows:
+                error = results[row.id]
+                if error is None:
+                    row.status = EmailStatus.SENT.value
+                    row.sent_at = now
+                    row.last_error = None
+                    # The body is only needed to send it; OTP bodies contain the code
+                    row.body = None
+                    self.stats["sent"] += 1
+                elif row.attempts >= EMAIL_QUEUE_MAX_ATTEMPTS:
+                    row.status = EmailStatus.FAILED.value
+                    row.last_error = error
+                    row.body = None
+                    self.stats["failed"] += 1
+                else:
+                    # Exponential backoff: 5s, 10s, 20s, ... by default
+                    delay = EMAIL_QUEUE_BACKOFF_SECONDS * (2 ** (row.attempts - 1))
+                    row.status = EmailStatus.PENDING.value
+                    row.next_attempt_at = now + timedelta(seconds=delay)
+                    row.last_error = error
+                    self.stats["retried"] += 1
+            await db.commit()
+
+    async def _worker(self):
+        while True:
+            try:
+                batch = await self._claim_batch()
+                if batch:
+                    await self._send_batch(batch)
+                    continue
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Email queue worker error: {str(e)}")
+
+            # Nothing due: sleep until woken by an enqueue or the next poll
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=EMAIL_QUEUE_POLL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    async def purge_finished(self) -> int:
+        """Delete sent and failed rows older than EMAIL_RETENTION_DAYS, in batches."""
+        # next_attempt_at of a finished row is its last claim's lease, i.e. about when it finished,
+        # so the (status, next_attempt_at) index serves this
+        cutoff = utcnow() - timedelta(days=EMAIL_RETENTION_DAYS)
+        deleted = 0
+        while True:
+            async with AsyncSessionLocal() as db:
+                ids = select(OutboundEmail.id).where(
+                    OutboundEmail.status.in_([EmailStatus.SENT.value, EmailStatus.FAILED.value]),
+                    OutboundEmail.next_attempt_at < cutoff,
+                ).limit(EMAIL_RETENTION_BATCH).scalar_subquery()
+                result = await db.execute(delete(OutboundEmail).where(OutboundEmail.id.in_(ids)))
+                await db.commit()
+            deleted += result.rowcount
+            if result.rowcount < EMAIL_RETENTION_BATCH:
+                return deleted
+
+    async def _retention_loop(self):
+        while True:
+            try:
+                deleted = await self.purge_finished()
+                if deleted:
+                    logger.info(f"Deleted {deleted} finished outbound emails")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Outbound email retention sweep failed: {str(e)}")
+            await asyncio.sleep(EMAIL_RETENTION_SWEEP_SECONDS)
+
+    async def start(self):
+        self._wakeup = asyncio.Event()
+        for _ in range(self.workers):
+            self._tasks.append(asyncio.create_task(self._worker()))
+        self._tasks.append(asyncio.create_task(self._retention_loop()))
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def metrics(self, db: AsyncSession) -> dict:
+        """Queue depth per status plus send counters and latency."""
+        depth = dict((await db.execute(
+            select(OutboundEmail.status, func.count(OutboundEmail.id))
+            .where(OutboundEmail.status != EmailStatus.SENT.value)
+            .group_by(OutboundEmail.status)
+        )).all())
+        attempts = self.stats["sent"] + self.stats["retried"] + self.stats["failed"]
+        return {
+            "workers": self.workers,
+            "queue_depth": {
+                EmailStatus.PENDING.value: depth.get(EmailStatus.PENDING.value, 0),
+                EmailStatus.SENDING.value: depth.get(EmailStatus.SENDING.value, 0),
+                EmailStatus.FAILED.value: depth.get(EmailStatus.FAILED.value, 0),
+            },
+            "enqueued": self.stats["enqueued"],
+            "deduplicated": self.stats["deduplicated"],
+            "sent": self.stats["sent"],
+            "retried": self.stats["retried"],
+            "failed": self.stats["failed"],
+            "avg_send_latency_ms": (self.stats["send_seconds_total"] / attempts * 1000) if attempts else 0.0,
+            "max_send_latency_ms": self.stats["send_seconds_max"] * 1000,
+        }
+
+
+email_queue = EmailQueue()
@@ -0,0 +1,207 @@
+import os
+import json
+import asyncio
+from collections import deque
+from datetime import datetime, timezone
+
+# In-process publish/subscribe hub for live dashboard updates.
+#
+# Handlers publish after they commit; each connected client holds a
+# Subscription with its own bounded queue and an optional filter, so a publish
+# is one pass over the channel's subscribers and never touches the database.
+# The hub is per worker: with several workers, a client only sees events from
+# transitions handled by the worker it is connected to, and picks up the rest
+# on its next page load.
+#
+# Event ids are "<epoch>-<seq>": the epoch is drawn when the hub is created, so
+# an id from another worker or from before a restart is never mistaken for a
+# position in this hub's sequence. A client reconnecting with such an id (or one
+# older than the replay buffer) gets a "refresh" event and reloads its data.
+EVENT_QUEUE_SIZE = int(os.getenv("EVENT_QUEUE_SIZE", "100"))
+EVENT_REPLAY_SIZE = int(os.getenv("EVENT_REPLAY_SIZE", "256"))  # Recent events kept per channel for reconnects
+EVENT_HEARTBEAT_SECONDS = float(os.getenv("EVENT_HEARTBEAT_SECONDS", "15"))
+
+TUTOR_CHANNEL = "tutor"
+ADMIN_CHANNEL = "admin"
+
+
+class Subscription:
+    """One connected client: a bounded queue fed by the hub."""
+
+    def __init__(self, hub: "EventHub", channel: str, accepts=None, maxsize: int = EVENT_QUEUE_SIZE):
+        self.hub = hub
+        self.channel = channel
+        self.accepts = accepts
+        self.queue = asyncio.Queue(maxsize=maxsize)
+        self.overflowed = False
+
+    def offer(self, event: dict) -> bool:
+        if self.overflowed or (self.accepts is not None and not self.accepts(event)):
+            return False
+        try:
+            self.queue.put_nowait(event)
+            return True
+        except asyncio.QueueFull:
+            # A client this far behind would only render stale rows: cut it off
+            # once it drains what it has, and let it reconnect (EventSource retries)
+            self.overflowed = True
+            self.hub.stats["overflows"] += 1
+            return False
+
+    async def get(self, timeout: float = None):
+        """Next event, None on timeout; raises ConnectionResetError if the client fell behind."""
+        if self.overflowed and self.queue.empty():
+            raise ConnectionResetError("Subscriber fell behind")
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def close(self):
+        self.hub.unsubscribe(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class EventHub:
+    def __init__(self, replay_size: int = EVENT_REPLAY_SIZE):
+        self._subscribers = {}  # channel -> set of Subscription
+        self._recent = {}       # channel -> deque of recent events, for Last-Event-ID replay
+        self._evicted = {}      # channel -> seq of the newest event dropped from the replay buffer
+        self._replay_size = replay_size
+        self.epoch = os.urandom(4).hex()
+        self._seq = 0
+        self.stats = {"published": 0, "delivered": 0, "overflows": 0}
+
+    def subscribe(self, channel: str, accepts=None, last_event_id: str = None) -> Subscription:
+        """
+        Register a client. accepts(event) -> bool filters what it receives.
+
+        With last_event_id, events published since that id are queued first, so
+        a reconnecting client does not miss any. If they cannot be replayed, a
+        single "refresh" event is queued instead.
+        """
+        subscription = Subscription(self, channel, accepts)
+        if last_event_id:
+            seq = self._parse_id(last_event_id)
+            if seq is None or seq < self._evicted.get(channel, 0):
+                subscription.queue.put_nowait(self._refresh_event())
+            else:
+                for event in self._recent.get(channel, ()):
+                    if event["seq"] > seq:
+                        subscription.offer(event)
+        self._subscribers.setdefault(channel, set()).add(subscription)
+        return subscription
+
+    def _parse_id(self, event_id: str):
+        """Sequence number of one of this hub's event ids, None if it is not one."""
+        epoch, _, seq = event_id.partition("-")
+        if epoch != self.epoch or not seq.isdigit() or int(seq) > self._seq:
+            return None
+        return int(seq)
+
+    def _refresh_event(self) -> dict:
+        # Carries the current position, so the client's next reconnect replays from here
+        return {
+            "id": f"{self.epoch}-{self._seq}",
+            "seq": self._seq,
+            "type": "refresh",
+            "data": {},
+            "at": datetime.now(timezone.utc).isoformat(),
+        }
+
+    def unsubscribe(self, subscription: Subscription):
+        self._subscribers.get(subscription.channel, set()).discard(subscription)
+
+    def publish(self, channel: str, event_type: str, data: dict) -> dict:
+        self._seq += 1
+        event = {
+            "id": f"{self.epoch}-{self._seq}",
+            "seq": self._seq,
+            "type": event_type,
+            "data": data,
+            "at": datetime.now(timezone.utc).isoformat(),
+        }
+        recent = self._recent.setdefault(channel, deque(maxlen=self._replay_size))
+        if len(recent) == recent.maxlen:
+            # With EVENT_REPLAY_SIZE=0 the new event itself is dropped
+            self._evicted[channel] = recent[0]["seq"] if recent else event["seq"]
+        recent.append(event)
+        self.stats["published"] += 1
+        for subscription in list(self._subscribers.get(channel, ())):
+            if subscription.offer(event):
+                self.stats["delivered"] += 1
+        return event
+
+    def subscriber_count(self, channel: str = None) -> int:
+        if channel is not None:
+            return len(self._subscribers.get(channel, ()))
+        return sum(len(s) for s in self._subscribers.values())
+
+    def metrics(self) -> dict:
+        return {
+            "subscribers": {channel: len(subs) for channel, subs in self._subscribers.items()},
+            **self.stats,
+        }
+
+
+def lead_event_data(lead) -> dict:
+    """The fields a dashboard needs to render a lead row."""
+    return {
+        "id": lead.id,
+        "full_name": lead.full_name,
+        "area": lead.area,
+        "board": lead.board,
+        "subjects": lead.subjects,
+        "total_fee": lead.total_fee,
+    }
+
+
+def tutor_event_filter(tutor_id: int, area: str = None, board: str = None, subject: str = None):
+    """
+    What one tutor's feed receives: new leads matching their dashboard filters,
+    every lead_taken (so stale rows disappear), and their own match approvals.
+    """
+    subject = subject.strip() if subject else None
+
+    def accepts(event: dict) -> bool:
+        data = event["data"]
+        if event["type"] == "lead_available":
+            if area and data["area"] != area:
+                return False
+            if board and data["board"] != board:
+                return False
+            if subject and subject not in [s.strip() for s in (data["subjects"] or "").split(",")]:
+                return False
+            return True
+        if event["type"] == "match_approved":
+            return data["tutor_id"] == tutor_id
+        return True
+    return accepts
+
+
+def format_sse(event: dict) -> str:
+    """Serialise a hub event as one Server-Sent Events message."""
+    return f"id: {event['id']}\nevent: {event['type']}\ndata: {json.dumps(event['data'])}\n\n"
+
+
+def format_json(event: dict) -> str:
+    """
+    Serialise a hub event as one WebSocket text frame.
+
+    The text is kept on the event, so it is encoded once per publish rather
+    than once per connected socket.
+    """
+    frame = event.get("_frame")
+    if frame is None:
+        frame = event["_frame"] = json.dumps(
+            {"id": event["id"], "type": event["type"], "data": event["data"], "at": event["at"]}
+        )
+    return frame
+
+
+event_hub = EventHub()
@@ -0,0 +1,221 @@
+import os
+import json
+import asyncio
+import hashlib
+import logging
+from functools import lru_cache
+
+from dotenv import load_dotenv
+
+# Load environment variables from .env file
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Server-side fee engine. The tables and rules live in fee_config.json; the
+# server is the source of truth and recomputes the fee on submission instead
+# of trusting the posted total.
+FEE_CONFIG_PATH = os.getenv(
+    "FEE_CONFIG_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "fee_config.json")
+)
+# How often the config file is checked for changes (0 disables hot reload)
+FEE_CONFIG_POLL_SECONDS = float(os.getenv("FEE_CONFIG_POLL_SECONDS", "5"))
+FEE_QUOTE_CACHE_SIZE = int(os.getenv("FEE_QUOTE_CACHE_SIZE", "4096"))
+MAX_QUOTES_PER_REQUEST = 50
+
+FEE_AMOUNT_KEYS = ("default_area_fee", "default_board_fee", "premium_subject_fee", "standard_subject_fee")
+FEE_TABLE_KEYS = ("area_fees", "board_fees", "board_caps")
+
+
+class InvalidFeeConfig(ValueError):
+    """Raised when the fee config file is missing a key or holds a bad amount."""
+
+
+def _is_amount(value) -> bool:
+    return isinstance(value, int) and not isinstance(value, bool) and value >= 0
+
+
+def validate_fee_config(config) -> dict:
+    if not isinstance(config, dict):
+        raise InvalidFeeConfig("Fee config must be a JSON object")
+    for key in FEE_AMOUNT_KEYS:
+        if not _is_amount(config.get(key)):
+            raise InvalidFeeConfig(f"{key} must be a non-negative integer")
+    for key in FEE_TABLE_KEYS:
+        table = config.get(key)
+        if not isinstance(table, dict):
+            raise InvalidFeeConfig(f"{key} must be an object")
+        for name, value in table.items():
+            if not _is_amount(value):
+                raise InvalidFeeConfig(f"{key}[{name!r}] must be a non-negative integer")
+    premium = config.get("premium_subjects")
+    if not isinstance(premium, list) or not all(isinstance(s, str) for s in premium):
+        raise InvalidFeeConfig("premium_subjects must be a list of strings")
+    unknown_caps = set(config["board_caps"]) - set(config["board_fees"])
+    if unknown_caps:
+        raise InvalidFeeConfig(f"board_caps names unknown boards: {sorted(unknown_caps)}")
+    return config
+
+
+def subject_name(subject: str) -> str:
+    """'Mathematics - 4024P' -> 'Mathematics' (the premium check ignores the code)."""
+    return subject.split(" - ")[0]
+
+
+class FeeSchedule:
+    """
+    The fee tables compiled into lookup structures.
+
+    Every (area, board) pair is resolved up front to its base fee, capped
+    premium/standard subject rates and board cap, and each subject string is
+    classified once, so a quote is a couple of dictionary lookups per subject.
+    """
+
+    def __init__(self, config: dict, version: str = None):
+        config = validate_fee_config(config)
+        self.version = version
+        self.area_fees = dict(config["area_fees"])
+        self.board_fees = dict(config["board_fees"])
+        self.board_caps = dict(config["board_caps"])
+        self.premium_subjects = frozenset(config["premium_subjects"])
+        self.premium_subject_fee = config["premium_subject_fee"]
+        self.standard_subject_fee = config["standard_subject_fee"]
+        self._rates = {}
+        area_items = list(self.area_fees.items()) + [(None, config["default_area_fee"])]
+        board_items = list(self.board_fees.items()) + [(None, config["default_board_fee"])]
+        for area, area_fee in area_items:
+            for board, board_fee in board_items:
+                self._rates[(area, board)] = self._compile(area_fee, board_fee, board)
+        self.is_premium = lru_cache(maxsize=FEE_QUOTE_CACHE_SIZE)(self._is_premium)
+
+    def _compile(self, area_fee: int, board_fee: int, board):
+        base = area_fee + board_fee
+        if board is None:
+            # "Others": every subject is charged the standard fee with no per-subject cap
+            return base, self.standard_subject_fee, self.standard_subject_fee, None
+        # No single subject may cost more than the area + board base fee
+        return (
+            base,
+            min(self.premium_subject_fee, base),
+            min(self.standard_subject_fee, base),
+            self.board_caps.get(board),
+        )
+
+    def _is_premium(self, subject: str) -> bool:
+        return subject_name(subject) in self.premium_subjects
+
+    def rates(self, area: str, board: str):
+        rates = self._rates.get((area, board))
+        if rates is None:
+            area_key = area if area in self.area_fees else None
+            board_key = board if board in self.board_fees else None
+            rates = self._rates[(area_key, board_key)]
+        return rates
+
+    def price(self, area: str, board: str, subjects):
+        """Return (total_fee, base_fee, premium_count, standard_count, capped)."""
+        base, premium_rate, standard_rate, cap = self.rates(area, board)
+        is_premium = self.is_premium
+        premium = standard = 0
+        for subject in subjects:
+            if is_premium(subject):
+                premium += 1
+            else:
+                standard += 1
+        total = base + premium * premium_rate + standard * standard_rate
+        capped = cap is not None and total > cap
+        return (cap if capped else total), base, premium, standard, capped
+
+    def total_fee(self, area: str, board: str, subjects) -> int:
+        return self.price(area, board, subjects)[0]
+
+    def quote(self, area: str, board: str, subjects) -> dict:
+        subjects = [s.strip() for s in subjects if s.strip()]
+        total, base, premium, standard, capped = self.price(area, board, subjects)
+        return {
+            "area": area,
+            "board": board,
+            "subjects": len(subjects),
+            "base_fee": base,
+            "premium_subjects": premium,
+            "standard_subjects": standard,
+            "capped": capped,
+            "total_fee": total,
+            "fee_version": self.version,
+        }
+
+
+class FeeConfig:
+    """
+    The live fee schedule plus its JSON asset, reloaded when the file changes.
+
+    The asset is the canonical JSON of the config and its version is a hash of
+    those bytes, so clients can cache /fees/<version>.json forever and only
+    revalidate the small pointer at /api/fees.
+    """
+
+    def __init__(self, path: str = FEE_CONFIG_PATH, poll_seconds: float = FEE_CONFIG_POLL_SECONDS):
+        self.path = path
+        self.poll_seconds = poll_seconds
+        self._mtime = None
+        self._watcher = None
+        # Fail fast: a worker must not start with a broken fee table
+        self._load()
+
+    def _load(self):
+        mtime = os.stat(self.path).st_mtime_ns
+        with open(self.path, "rb") as f:
+            config = validate_fee_config(json.load(f))
+        asset = json.dumps(config, sort_keys=True, separators=(",", ":"), ensure_ascii=False).encode()
+        version = hashlib.sha256(asset).hexdigest()[:16]
+        # Build everything first, then publish with plain attribute assignments
+        schedule = FeeSchedule(config, version)
+        self.schedule, self.asset, self.version = schedule, asset, version
+        self._mtime = mtime
+
+    @property
+    def etag(self) -> str:
+        return f'"{self.version}"'
+
+    @property
+    def asset_url(self) -> str:
+        return f"/fees/{self.version}.json"
+
+    def reload_if_changed(self) -> bool:
+        """Swap in the file's tables if it changed; a bad edit keeps the current schedule."""
+        previous = self.version
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except OSError as e:
+            logger.error(f"Fee config reload failed, keeping version {previous}: {str(e)}")
+            return False
+        if mtime == self._mtime:
+            return False
+        try:
+            self._load()
+        except (OSError, ValueError) as e:
+            # InvalidFeeConfig and json.JSONDecodeError are both ValueErrors.
+            # Remember the bad file's mtime so the error is logged once, not every poll.
+            self._mtime = mtime
+            logger.error(f"Fee config reload failed, keeping version {previous}: {str(e)}")
+            return False
+        if self.version != previous:
+            logger.info(f"Fee config reloaded: {previous} -> {self.version}")
+        return True
+
+    async def _watch_loop(self):
+        while True:
+            await asyncio.sleep(self.poll_seconds)
+            self.reload_if_changed()
+
+    async def start(self):
+        if self.poll_seconds > 0 and self._watcher is None:
+            self._watcher = asyncio.create_task(self._watch_loop())
+
+    async def close(self):
+        if self._watcher is not None:
+            self._watcher.cancel()
+            self._watcher = None
+
+
+fee_config = FeeConfig()
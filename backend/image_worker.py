@@ -0,0 +1,157 @@
+import os
+import time
+import asyncio
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from sqlalchemy import and_, or_, select, update
+from dotenv import load_dotenv
+
+from database import AsyncSessionLocal
+from models import User
+from thumbnails import render_derivatives
+from uploads import UPLOAD_ROOT
+
+# Load environment variables from .env file
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Background thumbnails for CNIC scans.
+#
+# Signup only queues the tutor's id; WebP thumbnails and review-sized previews
+# are rendered later in a process pool (image decoding and resizing hold the
+# GIL, so threads would stall the event loop's process), and their paths are
+# written to the user row. A periodic sweep re-queues anything missing, which
+# covers signups from before this existed, jobs dropped on a full queue and
+# jobs lost in a restart.
+IMAGE_WORKERS = int(os.getenv("IMAGE_WORKERS", "2"))
+IMAGE_QUEUE_SIZE = int(os.getenv("IMAGE_QUEUE_SIZE", "1000"))
+IMAGE_SWEEP_SECONDS = float(os.getenv("IMAGE_SWEEP_SECONDS", "300"))  # 0 sweeps once at startup only
+IMAGE_SWEEP_BATCH = 200
+
+CNIC_SIDES = ("front", "back")
+
+
+def missing_derivatives():
+    """Users with an uploaded CNIC side that has no thumbnail yet."""
+    return or_(*[
+        and_(getattr(User, f"cnic_{side}_path") != None, getattr(User, f"cnic_{side}_thumb_path") == None)
+        for side in CNIC_SIDES
+    ])
+
+
+class ImageProcessor:
+    def __init__(self, workers: int = IMAGE_WORKERS, queue_size: int = IMAGE_QUEUE_SIZE,
+                 sweep_seconds: float = IMAGE_SWEEP_SECONDS):
+        self.workers = workers
+        self.sweep_seconds = sweep_seconds
+        self._queue = asyncio.Queue(maxsize=queue_size)
+        self._queued = set()  # User ids waiting or in progress
+        self._failed = set()  # Unreadable images, not retried until restart
+        self._executor = None
+        self._tasks = []
+        self.stats = {"processed": 0, "failed": 0, "dropped": 0, "seconds": 0.0}
+
+    def submit(self, user_id: int) -> bool:
+        """Queue a user's CNIC images; False if the queue is full (the next sweep retries)."""
+        if user_id in self._queued:
+            return True
+        try:
+            self._queue.put_nowait(user_id)
+        except asyncio.QueueFull:
+            self.stats["dropped"] += 1
+            return False
+        self._queued.add(user_id)
+        return True
+
+    async def start(self):
+        if self._executor is not None:
+            return
+        # spawn, not fork: the parent runs an event loop and thread pools that must not be copied
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+        )
+        self._tasks = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+        self._tasks.append(asyncio.create_task(self._sweep_loop()))
+
+    async def close(self):
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    async def sweep(self) -> int:
+        stmt = select(User.id).where(missing_derivatives())
+        if self._failed:
+            stmt = stmt.where(User.id.notin_(self._failed))
+        async with AsyncSessionLocal() as db:
+            user_ids = (await db.execute(stmt.order_by(User.id).limit(IMAGE_SWEEP_BATCH))).scalars().all()
+        return sum(self.submit(user_id) for user_id in user_ids)
+
+    async def _sweep_loop(self):
+        while True:
+            try:
+                queued = await self.sweep()
+                if queued:
+                    logger.info(f"Queued CNIC thumbnails for {queued} tutor(s)")
+            except Exception as e:
+                logger.error(f"CNIC thumbnail sweep failed: {str(e)}")
+            if self.sweep_seconds <= 0:
+                return
+            await asyncio.sleep(self.sweep_seconds)
+
+    async def _work(self):
+        while True:
+            user_id = await self._queue.get()
+            try:
+                await self._process(user_id)
+            except Exception as e:
+                self._failed.add(user_id)
+                self.stats["failed"] += 1
+                logger.error(f"CNIC thumbnails failed for user {user_id}: {str(e)}")
+            finally:
+                self._queued.discard(user_id)
+
+    async def _process(self, user_id: int):
+        # Read the paths and let the connection go: rendering takes far longer than the query
+        async with AsyncSessionLocal() as db:
+            row = (await db.execute(
+                select(*[getattr(User, f"cnic_{side}_{kind}") for side in CNIC_SIDES for kind in ("path", "thumb_path")])
+                .where(User.id == user_id)
+            )).one_or_none()
+        if row is None:
+            return
+
+        loop = asyncio.get_running_loop()
+        started = time.perf_counter()
+        values = {}
+        for side in CNIC_SIDES:
+            path, thumb_path = getattr(row, f"cnic_{side}_path"), getattr(row, f"cnic_{side}_thumb_path")
+            if path and not thumb_path:
+                rendered = await loop.run_in_executor(self._executor, render_derivatives, UPLOAD_ROOT, path)
+                values[f"cnic_{side}_thumb_path"] = rendered["thumb"]
+                values[f"cnic_{side}_preview_path"] = rendered["preview"]
+        if values:
+            async with AsyncSessionLocal() as db:
+                await db.execute(update(User).where(User.id == user_id).values(**values))
+                await db.commit()
+        self.stats["processed"] += 1
+        self.stats["seconds"] += time.perf_counter() - started
+
+    def metrics(self) -> dict:
+        processed = self.stats["processed"]
+        return {
+            "workers": self.workers,
+            "queue_depth": self._queue.qsize(),
+            "in_progress": len(self._queued) - self._queue.qsize(),
+            **self.stats,
+            "avg_seconds": self.stats["seconds"] / processed if processed else 0.0,
+            "unreadable_users": len(self._failed),
+        }
+
+
+image_processor = ImageProcessor()
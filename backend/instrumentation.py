@@ -0,0 +1,259 @@
+import os
+import hmac
+import time
+import threading
+from bisect import bisect_left
+from contextvars import ContextVar
+
+from sqlalchemy import event
+from dotenv import load_dotenv
+
+# Load environment variables from .env file
+load_dotenv()
+
+# Request and SQL instrumentation.
+#
+# RequestMetricsMiddleware times every HTTP request and records it under its
+# route template ("/api/lead/{lead_id}", not the concrete URL, so label
+# cardinality stays bounded), together with the status code. SQLAlchemy
+# cursor events on both engines add each query and its duration to the
+# request it ran for (found through a context variable, which SQLAlchemy
+# carries into its async greenlets and Starlette into its thread pool), so a
+# route that issues a query per row shows up as a high queries-per-request
+# histogram. Everything is exported in the Prometheus text format at /metrics,
+# and each response gets a Server-Timing header with its app and DB time
+# (shown in the browser's network panel).
+#
+# Like the other in-process metrics, the numbers are per worker process.
+SERVER_TIMING = os.getenv("SERVER_TIMING", "true").lower() == "true"
+# Bearer token for Prometheus scrapes of /metrics; without it only an admin session may read them
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+
+
+class RequestTiming:
+    """What one request has spent so far; shared with the threads and greenlets it runs queries in."""
+    __slots__ = ("queries", "db_seconds", "finished", "scope", "root_path")
+
+    def __init__(self, scope=None, root_path: str = ""):
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.finished = False
+        self.scope = scope
+        self.root_path = root_path
+
+
+_current = ContextVar("request_timing", default=None)
+
+
+class Histogram:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)  # Non-cumulative; summed up when exported
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        index = bisect_left(self.buckets, value)
+        if index < len(self.buckets):
+            self.counts[index] += 1
+        self.sum += value
+        self.count += 1
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(**labels) -> str:
+    return ",".join(f'{name}="{_escape(value)}"' for name, value in labels.items())
+
+
+def _format_number(value) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class RequestMetrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.requests = {}      # (method, route, status) -> count
+        self.latency = {}       # (method, route) -> Histogram of seconds
+        self.db_queries = {}    # route -> Histogram of queries per request
+        self.db_seconds = {}    # route -> Histogram of DB seconds per request
+        self.background = RequestTiming()
+
+    def record_request(self, method: str, route: str, status: int, seconds: float, timing: RequestTiming):
+        with self._lock:
+            key = (method, route, status)
+            self.requests[key] = self.requests.get(key, 0) + 1
+            if (method, route) not in self.latency:
+                self.latency[(method, route)] = Histogram(LATENCY_BUCKETS)
+            self.latency[(method, route)].observe(seconds)
+            if route not in self.db_queries:
+                self.db_queries[route] = Histogram(QUERY_COUNT_BUCKETS)
+                self.db_seconds[route] = Histogram(LATENCY_BUCKETS)
+            self.db_queries[route].observe(timing.queries)
+            self.db_seconds[route].observe(timing.db_seconds)
+
+    def record_query(self, seconds: float):
+        timing = _current.get()
+        # Tasks started by a request inherit its context and may outlive it
+        if timing is None or timing.finished:
+            with self._lock:
+                timing = self.background
+                timing.queries += 1
+                timing.db_seconds += seconds
+            return
+        timing.queries += 1
+        timing.db_seconds += seconds
+
+    def _histogram_lines(self, name: str, histograms: dict, label_names: tuple) -> list:
+        lines = []
+        for key, histogram in sorted(histograms.items()):
+            labels = dict(zip(label_names, key if isinstance(key, tuple) else (key,)))
+            cumulative = 0
+            for bound, count in zip(histogram.buckets, histogram.counts):
+                cumulative += count
+                lines.append(f"{name}_bucket{{{_labels(**labels, le=_format_number(float(bound)))}}} {cumulative}")
+            lines.append(f'{name}_bucket{{{_labels(**labels, le="+Inf")}}} {histogram.count}')
+            lines.append(f"{name}_sum{{{_labels(**labels)}}} {_format_number(float(histogram.sum))}")
+            lines.append(f"{name}_count{{{_labels(**labels)}}} {histogram.count}")
+        return lines
+
+    def prometheus(self) -> str:
+        """All metrics in the Prometheus text exposition format (version 0.0.4)."""
+        with self._lock:
+            lines = [
+                "# HELP tutex_http_requests_in_flight Requests currently being handled, including open event streams.",
+                "# TYPE tutex_http_requests_in_flight gauge",
+                f"tutex_http_requests_in_flight {self.in_flight}",
+                "# HELP tutex_http_requests_total Finished requests by route and status code.",
+                "# TYPE tutex_http_requests_total counter",
+            ]
+            for (method, route, status), count in sorted(self.requests.items()):
+                lines.append(f"tutex_http_requests_total{{{_labels(method=method, route=route, status=status)}}} {count}")
+            lines += [
+                "# HELP tutex_http_request_duration_seconds Time from request to the end of the response body.",
+                "# TYPE tutex_http_request_duration_seconds histogram",
+            ]
+            lines += self._histogram_lines("tutex_http_request_duration_seconds", self.latency, ("method", "route"))
+            lines += [
+                "# HELP tutex_db_queries_per_request SQL statements executed per request.",
+                "# TYPE tutex_db_queries_per_request histogram",
+            ]
+            lines += self._histogram_lines("tutex_db_queries_per_request", self.db_queries, ("route",))
+            lines += [
+                "# HELP tutex_db_seconds_per_request Time spent executing SQL per request.",
+                "# TYPE tutex_db_seconds_per_request histogram",
+            ]
+            lines += self._histogram_lines("tutex_db_seconds_per_request", self.db_seconds, ("route",))
+            lines += [
+                "# HELP tutex_db_background_queries_total SQL statements executed outside any request.",
+                "# TYPE tutex_db_background_queries_total counter",
+                f"tutex_db_background_queries_total {self.background.queries}",
+                "# HELP tutex_db_background_seconds_total Time spent executing SQL outside any request.",
+                "# TYPE tutex_db_background_seconds_total counter",
+                f"tutex_db_background_seconds_total {_format_number(float(self.background.db_seconds))}",
+            ]
+        return "\n".join(lines) + "\n"
+
+
+def instrument_engine(engine):
+    """Time every statement on a (sync) Engine; pass async_engine.sync_engine for the async one."""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info["query_started"].pop()
+        request_metrics.record_query(time.perf_counter() - started)
+
+    @event.listens_for(engine, "handle_error")
+    def handle_error(exception_context):
+        # A failed statement never reaches after_cursor_execute; drop its start time
+        conn = exception_context.connection
+        if conn is not None and conn.info.get("query_started"):
+            conn.info["query_started"].pop()
+
+
+def route_label(scope, root_path: str) -> str:
+    """The matched route's path template, '<mount>/*' for mounted apps, or 'unmatched'."""
+    route = scope.get("route")
+    if route is not None:
+        return route.path
+    # Mount() does not set a route but extends root_path with its prefix
+    mount_path = scope.get("root_path", "")[len(root_path):]
+    if mount_path:
+        return f"{mount_path}/*"
+    return "unmatched"
+
+
+def current_route() -> str:
+    """Route label of the request the calling code runs for, or 'background'."""
+    timing = _current.get()
+    if timing is None or timing.finished or timing.scope is None:
+        return "background"
+    return route_label(timing.scope, timing.root_path)
+
+
+def server_timing(app_seconds: float, timing: RequestTiming) -> str:
+    return (f'app;dur={app_seconds * 1000:.1f}, '
+            f'db;dur={timing.db_seconds * 1000:.1f};desc="{timing.queries} queries"')
+
+
+def metrics_token_ok(authorization: str) -> bool:
+    """True if the Authorization header carries METRICS_TOKEN as a bearer token."""
+    if not METRICS_TOKEN:
+        return False
+    scheme, _, token = authorization.partition(" ")
+    return scheme.lower() == "bearer" and hmac.compare_digest(token.strip(), METRICS_TOKEN)
+
+
+class RequestMetricsMiddleware:
+    """ASGI middleware recording latency, status and SQL use of each HTTP request."""
+
+    def __init__(self, app, metrics=None):
+        self.app = app
+        self.metrics = metrics or request_metrics
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        root_path = scope.get("root_path", "")
+        timing = RequestTiming(scope, root_path)
+        token = _current.set(timing)
+        started = time.perf_counter()
+        status = 500  # Unless a response starts before an exception escapes
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if SERVER_TIMING:
+                    headers = list(message.get("headers", []))
+                    headers.append((b"server-timing", server_timing(time.perf_counter() - started, timing).encode()))
+                    message = {**message, "headers": headers}
+            await send(message)
+
+        self.metrics.in_flight += 1
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            self.metrics.in_flight -= 1
+            timing.finished = True
+            _current.reset(token)
+            self.metrics.record_request(
+                scope["method"], route_label(scope, root_path), status, time.perf_counter() - started, timing
+            )
+
+
+request_metrics = RequestMetrics()
@@ -0,0 +1,83 @@
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from models import StudentRegistration, LeadStatus
+
+# Lead status transitions as single conditional UPDATE ... RETURNING statements.
+#
+# The old handlers loaded the row, checked lead.status in Python, mutated and
+# committed: two round trips and a read-modify-write race, so two tutors could
+# both "accept" the same lead. Here the status check and the write are one
+# statement. The row is locked by a FOR UPDATE sub-select; for tutor accepts it
+# is SKIP LOCKED, so losers of a race return immediately instead of queueing
+# behind the winner's lock.
+
+
+async def transition_lead(
+    db: AsyncSession,
+    lead_id: int,
+    from_status: LeadStatus,
+    to_status: LeadStatus,
+    skip_locked: bool = False,
+    **values,
+):
+    """
+    Move a lead from from_status to to_status, setting any extra column values.
+
+    Returns the updated row (id, full_name, area, board, subjects, total_fee,
+    created_at, accepted_by_tutor_id, previous_tutor_id), or None if the lead does not
+    exist, is not in from_status, or (with skip_locked) another transaction is
+    changing it right now. The caller commits.
+    """
+    locked = (
+        select(StudentRegistration.id, StudentRegistration.accepted_by_tutor_id.label("previous_tutor_id"))
+        .where(StudentRegistration.id == lead_id, StudentRegistration.status == from_status)
+        .with_for_update(skip_locked=skip_locked)
+        .subquery()
+    )
+    stmt = (
+        update(StudentRegistration)
+        .where(StudentRegistration.id == locked.c.id)
+        .values(status=to_status, **values)
+        .returning(
+            StudentRegistration.id,
+            StudentRegistration.full_name,
+            StudentRegistration.area,
+            StudentRegistration.board,
+            StudentRegistration.subjects,
+            StudentRegistration.total_fee,
+            StudentRegistration.created_at,
+            StudentRegistration.accepted_by_tutor_id,
+            locked.c.previous_tutor_id,
+        )
+        .execution_options(synchronize_session=False)
+    )
+    return (await db.execute(stmt)).first()
+
+
+async def accept_lead_for_tutor(db: AsyncSession, lead_id: int, tutor_id: int):
+    """Exactly one of many concurrent tutors wins an available lead."""
+    return await transition_lead(
+        db, lead_id, LeadStatus.VERIFIED_AVAILABLE, LeadStatus.PENDING_TUTOR_APPROVAL,
+        skip_locked=True, accepted_by_tutor_id=tutor_id,
+    )
+
+
+async def approve_match(db: AsyncSession, lead_id: int):
+    return await transition_lead(db, lead_id, LeadStatus.PENDING_TUTOR_APPROVAL, LeadStatus.TUTOR_MATCHED)
+
+
+async def reject_match(db: AsyncSession, lead_id: int):
+    """Release the lead back to the pool; previous_tutor_id names the rejected tutor."""
+    return await transition_lead(
+        db, lead_id, LeadStatus.PENDING_TUTOR_APPROVAL, LeadStatus.VERIFIED_AVAILABLE,
+        accepted_by_tutor_id=None,
+    )
+
+
+async def verify_pending_lead(db: AsyncSession, lead_id: int, deducted_fee: float):
+    """Publish a lead, taking the admin's deduction off its fee in the same statement."""
+    return await transition_lead(
+        db, lead_id, LeadStatus.PENDING_ADMIN_VERIFICATION, LeadStatus.VERIFIED_AVAILABLE,
+        total_fee=StudentRegistration.total_fee - deducted_fee,
+    )
@@ -0,0 +1,192 @@
+import os
+import time
+import asyncio
+import logging
+from email.message import EmailMessage
+
+import aiosmtplib
+from dotenv import load_dotenv
+
+# Load environment variables from .env file
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# SMTP configuration. Point SMTP_HOST/SMTP_PORT at a local aiosmtpd instance
+# (SMTP_START_TLS=false, no EMAIL_PASSWORD) to exercise the pool without Gmail.
+SMTP_HOST = os.getenv("SMTP_HOST", "smtp.gmail.com")
+SMTP_PORT = int(os.getenv("SMTP_PORT", "587"))
+SMTP_START_TLS = os.getenv("SMTP_START_TLS", "true").lower() == "true"
+SMTP_USE_TLS = os.getenv("SMTP_USE_TLS", "false").lower() == "true"
+SMTP_TIMEOUT = float(os.getenv("SMTP_TIMEOUT", "30"))
+SMTP_POOL_SIZE = int(os.getenv("SMTP_POOL_SIZE", "2"))
+# Idle connections are NOOP-pinged this often so the server does not drop them
+SMTP_KEEPALIVE_SECONDS = float(os.getenv("SMTP_KEEPALIVE_SECONDS", "60"))
+# Reconnect after this many messages on one session (servers cap messages per session)
+SMTP_MAX_MESSAGES_PER_CONNECTION = int(os.getenv("SMTP_MAX_MESSAGES_PER_CONNECTION", "100"))
+
+
+class PooledConnection:
+    """One long-lived SMTP session, authenticated once and reused for many messages."""
+
+    def __init__(self, pool: "SMTPPool"):
+        self.pool = pool
+        self.smtp = None
+        self.last_used = 0.0
+        self.messages_sent = 0
+
+    @property
+    def is_connected(self) -> bool:
+        return self.smtp is not None and self.smtp.is_connected
+
+    async def connect(self):
+        await self.close()
+        self.smtp = aiosmtplib.SMTP(
+            hostname=self.pool.hostname,
+            port=self.pool.port,
+            use_tls=self.pool.use_tls,
+            start_tls=self.pool.start_tls,
+            timeout=self.pool.timeout,
+        )
+        await self.smtp.connect()
+        if self.pool.username and self.pool.password:
+            await self.smtp.login(self.pool.username, self.pool.password)
+        self.last_used = time.monotonic()
+        self.messages_sent = 0
+
+    async def ensure_ready(self):
+        """Reconnect if the session is closed, stale or has used up its message budget."""
+        if not self.is_connected or self.messages_sent >= self.pool.max_messages_per_connection:
+            await self.connect()
+        elif time.monotonic() - self.last_used > self.pool.keepalive_seconds:
+            await self.keepalive()
+
+    async def keepalive(self):
+        try:
+            await self.smtp.noop()
+            self.last_used = time.monotonic()
+        except aiosmtplib.SMTPException:
+            await self.connect()
+
+    async def send(self, message: EmailMessage):
+        await self.ensure_ready()
+        try:
+            await self.smtp.send_message(message)
+        except (aiosmtplib.SMTPServerDisconnected, aiosmtplib.SMTPConnectError, ConnectionError):
+            # The server dropped us between messages: reconnect once and retry
+            await self.connect()
+            await self.smtp.send_message(message)
+        self.last_used = time.monotonic()
+        self.messages_sent += 1
+
+    async def close(self):
+        if self.smtp is None:
+            return
+        try:
+            if self.smtp.is_connected:
+                await self.smtp.quit()
+        except aiosmtplib.SMTPException:
+            self.smtp.close()
+        finally:
+            self.smtp = None
+
+
+class SMTPPool:
+    """A fixed-size pool of SMTP sessions shared by every request in the worker."""
+
+    def __init__(
+        self,
+        hostname: str = SMTP_HOST,
+        port: int = SMTP_PORT,
+        username: str = None,
+        password: str = None,
+        start_tls: bool = SMTP_START_TLS,
+        use_tls: bool = SMTP_USE_TLS,
+        timeout: float = SMTP_TIMEOUT,
+        size: int = SMTP_POOL_SIZE,
+        keepalive_seconds: float = SMTP_KEEPALIVE_SECONDS,
+        max_messages_per_connection: int = SMTP_MAX_MESSAGES_PER_CONNECTION,
+    ):
+        self.hostname = hostname
+        self.port = port
+        self.username = username if username is not None else os.getenv("EMAIL_USER")
+        self.password = password if password is not None else os.getenv("EMAIL_PASSWORD")
+        self.start_tls = start_tls
+        self.use_tls = use_tls
+        self.timeout = timeout
+        self.size = size
+        self.keepalive_seconds = keepalive_seconds
+        self.max_messages_per_connection = max_messages_per_connection
+        self._connections = [PooledConnection(self) for _ in range(size)]
+        self._idle = None
+        self._keepalive_task = None
+
+    def _idle_queue(self) -> asyncio.Queue:
+        # Created lazily so the queue binds to the running event loop
+        if self._idle is None:
+            self._idle = asyncio.Queue()
+            for connection in self._connections:
+                self._idle.put_nowait(connection)
+        return self._idle
+
+    async def send(self, message: EmailMessage):
+        [error] = await self.send_many([message])
+        if error is not None:
+            raise error
+
+    async def send_many(self, messages) -> list:
+        """
+        Send several messages over a single pooled session.
+
+        Returns one entry per message: None if it was sent, else the exception.
+        A failed message does not stop the rest of the batch.
+        """
+        idle = self._idle_queue()
+        connection = await idle.get()
+        errors = []
+        try:
+            for message in messages:
+                try:
+                    await connection.send(message)
+                    errors.append(None)
+                except Exception as e:
+                    # Leave the session closed; the next message reconnects it
+                    await connection.close()
+                    errors.append(e)
+        finally:
+            idle.put_nowait(connection)
+        return errors
+
+    async def _keepalive_loop(self):
+        idle = self._idle_queue()
+        while True:
+            await asyncio.sleep(self.keepalive_seconds)
+            for _ in range(idle.qsize()):
+                connection = idle.get_nowait()
+                try:
+                    if connection.is_connected and time.monotonic() - connection.last_used > self.keepalive_seconds:
+                        await connection.keepalive()
+                except Exception as e:
+                    logger.warning(f"SMTP keepalive failed: {str(e)}")
+                    await connection.close()
+                finally:
+                    idle.put_nowait(connection)
+
+    async def start(self):
+        """Open one session up front and start the keepalive task."""
+        if self._keepalive_task is None:
+            self._keepalive_task = asyncio.create_task(self._keepalive_loop())
+        try:
+            await self._connections[0].connect()
+        except Exception as e:
+            logger.warning(f"Could not pre-connect to SMTP server: {str(e)}")
+
+    async def close(self):
+        if self._keepalive_task is not None:
+            self._keepalive_task.cancel()
+            self._keepalive_task = None
+        for connection in self._connections:
+            await connection.close()
+
+
+mail_pool = SMTPPool()
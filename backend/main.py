@@ -1,12 +1,11 @@
 # Python Standard Library
-import os
-import re
+import asyncio
 import logging
 import shutil
 import random
-from datetime import datetime, timedelta, timezone
-from email.message import EmailMessage
+from datetime import datetime, timezone
 from typing import Literal, Optional
+from urllib.parse import urlsplit
 from collections import defaultdict
 
 from datetime import datetime
@@ -19,22 +18,49 @@ from fastapi import APIRouter, Depends, Request, status, Query, HTTPException
 
 
 # Third-Party Libraries
-import aiofiles
-import aiosmtplib
-from fastapi import Depends, FastAPI, Form, File, HTTPException, Request, status, UploadFile
-from fastapi.responses import JSONResponse, RedirectResponse
+from fastapi import Depends, FastAPI, Form, File, HTTPException, Request, status, UploadFile, WebSocket, WebSocketDisconnect
+from fastapi.responses import JSONResponse, RedirectResponse, Response, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
-from passlib.context import CryptContext
 from pydantic import BaseModel, EmailStr
+from sqlalchemy import delete, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from starlette.middleware.sessions import SessionMiddleware
 from dotenv import load_dotenv
 
 # Local Application Imports
-from database import SessionLocal
+from database import SessionLocal, AsyncSessionLocal, get_async_db, engine, async_engine
 # Update imports in main.py
-from models import User, StudentRegistration, LeadStatus, TuitionStatus, FeeDeduction
+from models import (
+    User, StudentRegistration, LeadStatus, TuitionStatus, FeeDeduction, LeadSubject, split_subjects,
+    LEAD_SORT_KEYS, TUTOR_SORT_KEYS,
+)
+from passwords import password_service, PasswordServiceBusy
+from earnings import get_monthly_income, get_platform_monthly_revenue, refresh_tutor_earnings
+from pagination import InvalidCursor, clamp_limit, keyset_paginate, page_from_rows, DEFAULT_PAGE_SIZE
+from overview import admin_overview_cache, overview_feed
+from mailer import mail_pool
+from email_queue import email_queue, enqueue_otp_email
+from otp_store import otp_store, OTPPurpose, OTPResult
+from fees import fee_config, MAX_QUOTES_PER_REQUEST
+from matchmaking import matchmaker, MATCH_DEFAULT_LIMIT, MATCH_MAX_LIMIT
+from lead_transitions import accept_lead_for_tutor, approve_match, reject_match, verify_pending_lead
+from uploads import (
+    UploadBatch, UploadGone, UploadRejected, UploadTooLarge, RequestSizeLimitMiddleware,
+    CNIC_MAX_BYTES, FORM_OVERHEAD_BYTES,
+)
+from image_worker import image_processor
+from assets import asset_manifest, PrecompressedStaticFiles, ASSET_BUILD_DIR, ASSET_URL_PREFIX
+from page_cache import PageCache
+from template_cache import FirstResponseTimer, enable_bytecode_cache, startup_timer
+from instrumentation import RequestMetricsMiddleware, instrument_engine, metrics_token_ok, request_metrics
+from slow_queries import slow_query_log, SLOW_QUERY_BUFFER
+from profiler import ProfilerMiddleware, profile_store, PROFILER_ENABLED
+from events import (
+    event_hub, format_sse, format_json, lead_event_data, tutor_event_filter,
+    TUTOR_CHANNEL, ADMIN_CHANNEL, EVENT_HEARTBEAT_SECONDS,
+)
 
 # SlowAPI for rate limiting
 from slowapi import Limiter, _rate_limit_exceeded_handler
@@ -60,6 +86,11 @@ load_dotenv()
 # --- APPLICATION SETUP ---
 app = FastAPI()
 
+# Admin-triggered request profiles (see profiler.py). Added before SessionMiddleware
+# so that it runs inside it and can see the session; not installed unless enabled.
+if PROFILER_ENABLED:
+    app.add_middleware(ProfilerMiddleware)
+
 # Add SessionMiddleware
 app.add_middleware(SessionMiddleware, secret_key="a_very_secret_key")
 
@@ -69,14 +100,119 @@ app.state.limiter = limiter
 app.add_middleware(SlowAPIMiddleware)
 app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
 
+# Oversized signups are refused before the multipart parser spools them (see uploads.py)
+app.add_middleware(RequestSizeLimitMiddleware, limits={"/signup": 2 * CNIC_MAX_BYTES + FORM_OVERHEAD_BYTES})
+
+# Records how long after startup this worker sent its first response (see template_cache.py)
+app.add_middleware(FirstResponseTimer, timer=startup_timer)
+
+# Time every statement for the per-request SQL metrics (see instrumentation.py)
+instrument_engine(engine)
+instrument_engine(async_engine.sync_engine)
+
+# Statements over SLOW_QUERY_MS are logged and kept for /api/admin/slow_queries (see slow_queries.py).
+# Installed after instrument_engine: listeners run in registration order, so the
+# statement's time is recorded before a sampled EXPLAIN ANALYZE runs it again.
+slow_query_log.install(engine)
+slow_query_log.install(async_engine.sync_engine)
+
+# Per-route latency, status codes and SQL time, served at /metrics (see instrumentation.py).
+# Added last so it is the outermost middleware and times all of the others too.
+app.add_middleware(RequestMetricsMiddleware)
+
 # Mount static files
 app.mount("/static", StaticFiles(directory="../backend/static"), name="static")
 
+# Fingerprinted, pre-compressed build of frontend/static (see assets.py / build_assets.py)
+app.mount(ASSET_URL_PREFIX, PrecompressedStaticFiles(directory=ASSET_BUILD_DIR, check_dir=False), name="assets")
+
 # Configure templates
 templates = Jinja2Templates(directory="../frontend/templates")
-
-# Configure password hashing
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+enable_bytecode_cache(templates.env)
+templates.env.globals["asset_url"] = asset_manifest.url
+templates.env.globals["picture"] = asset_manifest.picture
+
+# Public pages are rendered once per login state and served from memory (see page_cache.py)
+page_cache = PageCache(templates, "../frontend/templates")
+
+# Password hashing runs on a bounded thread pool (see passwords.py)
+@app.on_event("shutdown")
+async def shutdown_password_service():
+    password_service.shutdown()
+
+# OTP emails go through a pool of long-lived SMTP sessions (see mailer.py)
+@app.on_event("startup")
+async def startup_mail_pool():
+    await mail_pool.start()
+
+@app.on_event("startup")
+async def startup_email_queue():
+    await email_queue.start()
+
+# Stop the queue workers before closing the SMTP sessions they use
+@app.on_event("shutdown")
+async def shutdown_email_queue():
+    await email_queue.stop()
+
+@app.on_event("shutdown")
+async def shutdown_mail_pool():
+    await mail_pool.close()
+
+# OTP codes and attempt counters live in the OTP store, not in PostgreSQL (see otp_store.py)
+@app.on_event("startup")
+async def startup_otp_store():
+    await otp_store.start()
+
+@app.on_event("shutdown")
+async def shutdown_otp_store():
+    await otp_store.close()
+
+# Fee tables are loaded from fee_config.json at import and hot-reloaded on change (see fees.py)
+@app.on_event("startup")
+async def startup_fee_config():
+    await fee_config.start()
+
+@app.on_event("shutdown")
+async def shutdown_fee_config():
+    await fee_config.close()
+
+# Open leads are indexed in memory for tutor recommendations (see matchmaking.py)
+@app.on_event("startup")
+async def startup_matchmaker():
+    await matchmaker.start()
+
+@app.on_event("shutdown")
+async def shutdown_matchmaker():
+    await matchmaker.close()
+
+# CNIC thumbnails are rendered in a process pool after signup (see image_worker.py)
+@app.on_event("startup")
+async def startup_image_processor():
+    await image_processor.start()
+
+@app.on_event("shutdown")
+async def shutdown_image_processor():
+    await image_processor.close()
+
+# Rendered public pages are dropped when a template or the asset build changes (see page_cache.py)
+@app.on_event("startup")
+async def startup_page_cache():
+    await page_cache.start()
+
+@app.on_event("shutdown")
+async def shutdown_page_cache():
+    await page_cache.close()
+
+# Open admin tabs get overview counts pushed after changes (see overview.py)
+@app.on_event("shutdown")
+async def shutdown_overview_feed():
+    await overview_feed.close()
+
+# Templates are compiled before the worker accepts requests; registered last so "ready" covers every startup hook
+@app.on_event("startup")
+async def startup_precompile_templates():
+    await asyncio.to_thread(startup_timer.precompile, templates.env)
+    startup_timer.mark("ready")
 
 # Configure logging
 logging.basicConfig(level=logging.DEBUG)
@@ -100,6 +236,18 @@ def get_flashed_messages(request: Request, with_categories=False):
         return [(msg["category"], msg["message"]) for msg in messages]
     return [msg["message"] for msg in messages]
 
+def raise_for_otp_result(result: OTPResult):
+    """Map a failed OTP store check onto the HTTP error the OTP routes return."""
+    if result == OTPResult.LOCKED:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Too many incorrect attempts. Please wait a while and request a new OTP."
+        )
+    if result == OTPResult.INVALID:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid OTP")
+    if result == OTPResult.EXPIRED:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="OTP expired")
+
 # --- Login Dependency (only for protected routes) ---
 def require_login(request: Request):
     if 'user' not in request.session:
@@ -132,39 +280,24 @@ class StudentForm(BaseModel):
     phone_number: str
     email: EmailStr
     address: str
-    total_fee: float
+    total_fee: Optional[float] = None
 
-# --- EMAIL SENDING ---
-async def send_otp_email(to_email: str, otp: str):
-    if not to_email:
-        raise ValueError("Email address is required to send OTP")
-
-    email_user = os.getenv("EMAIL_USER")
-    email_password = os.getenv("EMAIL_PASSWORD")
+class QuoteItem(BaseModel):
+    area: str
+    board: str
+    subjects: list[str] = []
 
-    if not email_user or not email_password:
-        logger.error("Email credentials are not set in the environment.")
-        return False
+class QuoteBatch(BaseModel):
+    quotes: list[QuoteItem]
 
-    msg = EmailMessage()
-    msg["From"] = email_user
-    msg["To"] = to_email
-    msg["Subject"] = "Your TutEx OTP Verification Code"
-    msg.set_content(f"Your TutEx OTP code is: {otp}\nThis code is valid for 5 minutes.")
+class ProfileArm(BaseModel):
+    path: str
+    username: Optional[str] = None
+    count: int = 1
 
-    try:
-        await aiosmtplib.send(
-            msg,
-            hostname="smtp.gmail.com",
-            port=587,
-            start_tls=True,
-            username=email_user,
-            password=email_password,
-        )
-        return True
-    except Exception as e:
-        logger.error(f"Failed to send email: {str(e)}")
-        return False
+# --- EMAIL SENDING ---
+# OTP emails are queued in the outbound_emails table in the same transaction as
+# the OTP itself and delivered by background workers (see email_queue.py).
 
 # --- API ENDPOINTS ---
 # Add to the API ENDPOINTS section in main.py
@@ -174,7 +307,7 @@ async def update_tuition_status(
     # ⭐️ RENAMED the parameter to 'new_status' to avoid conflict
     # The Query(alias="status") part means it still reads the 'status' from the URL
     new_status: TuitionStatus = Query(..., alias="status"),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     request: Request = None,
 ):
     if "user" not in request.session:
@@ -189,7 +322,7 @@ async def update_tuition_status(
             detail="Unauthorized"
         )
     
-    lead = db.query(StudentRegistration).filter(StudentRegistration.id == lead_id).first()
+    lead = await db.get(StudentRegistration, lead_id)
 
     if not lead:
         raise HTTPException(
@@ -200,17 +333,21 @@ async def update_tuition_status(
     # Use the new parameter name here
     lead.tuition_status = new_status
     lead.end_date = datetime.now(timezone.utc) # Using timezone-aware datetime
-    db.commit()
+    await refresh_tutor_earnings(db, lead.accepted_by_tutor_id)
+    await db.commit()
+    matchmaker.tutor_changed(lead.accepted_by_tutor_id)
+
+    # Admin notification: the matched-leads queue and tuition counts update live
+    overview_feed.changed()
+    await publish_admin_lead(db, "tuition_status_changed", lead.id)
 
-    # Admin notification logic can be added here
-    
     # This redirect now works correctly
     return RedirectResponse(url="/tutor_dashboard", status_code=status.HTTP_303_SEE_OTHER)
 
 @app.get("/tutor_dashboard", name="tutor_dashboard")
 async def get_tutor_dashboard_page(
     request: Request,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     area: Optional[str] = None,
     board: Optional[str] = None,
     subject: Optional[str] = None,
@@ -219,65 +356,55 @@ async def get_tutor_dashboard_page(
         return RedirectResponse(url="/login", status_code=status.HTTP_303_SEE_OTHER)
 
     user_info = request.session["user"]
-    tutor = db.query(User).filter(User.username == user_info["username"]).first()
+    tutor = (await db.execute(
+        select(User).where(User.username == user_info["username"])
+    )).scalars().first()
 
     if not tutor:
         return RedirectResponse(url="/login?error=Tutor+profile+not+found", status_code=status.HTTP_303_SEE_OTHER)
 
     # Fetch all leads assigned to this tutor
-    assigned_leads = db.query(StudentRegistration).filter(
-        StudentRegistration.accepted_by_tutor_id == tutor.id,
-        StudentRegistration.status == LeadStatus.TUTOR_MATCHED
-    ).all()
-
-    # --- ⭐️ IMPROVED INCOME CALCULATION LOGIC ⭐️ ---
-    monthly_income = defaultdict(float)
-    current_date = datetime.now(timezone.utc)
-
-    for lead in assigned_leads:
-        if lead.created_at and lead.total_fee is not None:
-            start_date = lead.created_at.replace(tzinfo=timezone.utc)
-            
-            # If the tuition has an end date, use it; otherwise, use the current date
-            end_date = lead.end_date.replace(tzinfo=timezone.utc) if lead.end_date else current_date
-
-            iter_date = start_date.replace(day=1)
-            
-            while iter_date <= end_date:
-                month_year_key = iter_date.strftime("%Y-%m")
-                monthly_income[month_year_key] += lead.total_fee
-                
-                next_month = iter_date.month + 1
-                next_year = iter_date.year
-                if next_month > 12:
-                    next_month = 1
-                    next_year += 1
-                iter_date = iter_date.replace(year=next_year, month=next_month)
+    assigned_leads = (await db.execute(
+        select(StudentRegistration).where(
+            StudentRegistration.accepted_by_tutor_id == tutor.id,
+            StudentRegistration.status == LeadStatus.TUTOR_MATCHED
+        )
+    )).scalars().all()
 
+    # --- Income: read from the precomputed tutor_monthly_earnings rollup (see earnings.py) ---
+    monthly_income = await get_monthly_income(db, tutor.id)
     total_earnings = sum(monthly_income.values())
-    
-    # --- Chart Data Preparation (this part is now correct) ---
-    sorted_months = sorted(monthly_income.keys())
-    chart_labels = [datetime.strptime(my, "%Y-%m").strftime("%b %Y") for my in sorted_months]
-    chart_data = [monthly_income[my] for my in sorted_months]
-    # --- END OF IMPROVED LOGIC ---
+
+    # --- Chart Data Preparation (months arrive sorted from the query) ---
+    chart_labels = [datetime.strptime(my, "%Y-%m").strftime("%b %Y") for my in monthly_income]
+    chart_data = list(monthly_income.values())
 
     # Fetch other lead categories
-    available_leads_query = db.query(StudentRegistration).filter(
+    available_leads_query = select(StudentRegistration).where(
         StudentRegistration.status == LeadStatus.VERIFIED_AVAILABLE
     )
     if area:
-        available_leads_query = available_leads_query.filter(StudentRegistration.area == area)
+        available_leads_query = available_leads_query.where(StudentRegistration.area == area)
     if board:
-        available_leads_query = available_leads_query.filter(StudentRegistration.board == board)
+        available_leads_query = available_leads_query.where(StudentRegistration.board == board)
     if subject:
-        available_leads_query = available_leads_query.filter(StudentRegistration.subjects.contains(subject))
-    available_leads = available_leads_query.all()
-
-    pending_leads = db.query(StudentRegistration).filter(
-        StudentRegistration.accepted_by_tutor_id == tutor.id,
-        StudentRegistration.status == LeadStatus.PENDING_TUTOR_APPROVAL
-    ).all()
+        # Exact match through the indexed lead_subjects table (no LIKE scan, no substring false matches)
+        available_leads_query = available_leads_query.join(
+            LeadSubject, LeadSubject.lead_id == StudentRegistration.id
+        ).where(LeadSubject.subject == subject.strip())
+    available_leads = (await db.execute(available_leads_query)).scalars().all()
+
+    # Best matches for this tutor first, the rest in their original order
+    recommended = await matchmaker.recommend(db, tutor.id, MATCH_DEFAULT_LIMIT)
+    recommended_ids = {lead.id: rank for rank, (lead, _, _) in enumerate(recommended)}
+    available_leads = sorted(available_leads, key=lambda lead: recommended_ids.get(lead.id, len(recommended_ids)))
+
+    pending_leads = (await db.execute(
+        select(StudentRegistration).where(
+            StudentRegistration.accepted_by_tutor_id == tutor.id,
+            StudentRegistration.status == LeadStatus.PENDING_TUTOR_APPROVAL
+        )
+    )).scalars().all()
 
     context = {
         "request": request,
@@ -286,6 +413,7 @@ async def get_tutor_dashboard_page(
         "role": user_info["user_type"],
         "tutor": tutor,
         "available_leads": available_leads,
+        "recommended_ids": recommended_ids,
         "pending_leads": pending_leads,
         "assigned_leads": assigned_leads,
         "selected_area": area,
@@ -313,23 +441,29 @@ async def get_tutor_dashboard_page(
 async def accept_lead(
     request: Request,
     lead_id: int,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     if 'user' not in request.session:
         return RedirectResponse(url="/login", status_code=status.HTTP_303_SEE_OTHER)
 
     user_info = request.session["user"]
-    tutor = db.query(User).filter(User.username == user_info["username"]).first()
+    tutor = (await db.execute(
+        select(User).where(User.username == user_info["username"])
+    )).scalars().first()
 
     if not tutor:
         flash(request, "Tutor profile not found.", "danger")
         return RedirectResponse(url=request.url_for('tutor_dashboard'), status_code=status.HTTP_303_SEE_OTHER)
 
-    lead = db.query(StudentRegistration).filter(StudentRegistration.id == lead_id).first()
-    if lead and lead.status == LeadStatus.VERIFIED_AVAILABLE:
-        lead.status = LeadStatus.PENDING_TUTOR_APPROVAL
-        lead.accepted_by_tutor_id = tutor.id
-        db.commit()
+    # One conditional UPDATE: exactly one tutor wins, the rest see "taken" (see lead_transitions.py)
+    lead = await accept_lead_for_tutor(db, lead_id, tutor.id)
+    if lead:
+        await db.commit()
+        matchmaker.lead_taken(lead.id)
+        matchmaker.tutor_changed(tutor.id)
+        event_hub.publish(TUTOR_CHANNEL, "lead_taken", {"id": lead.id})
+        overview_feed.changed()
+        await publish_admin_lead(db, "lead_accepted", lead.id)
         flash(request, "Lead accepted successfully! It is now pending admin approval.", "success")
     else:
         flash(request, "Lead could not be accepted. It may have been taken by another tutor.", "warning")
@@ -337,20 +471,108 @@ async def accept_lead(
     # Redirect back to the tutor dashboard
     return RedirectResponse(url=request.url_for('tutor_dashboard'), status_code=status.HTTP_303_SEE_OTHER)
 
+
+@app.get("/api/tutor/recommendations")
+async def get_tutor_recommendations(
+    request: Request,
+    limit: int = Query(MATCH_DEFAULT_LIMIT),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    API endpoint returning the logged-in tutor's best-matching available leads, best first.
+    """
+    if 'user' not in request.session:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Login required")
+
+    tutor_id = (await db.execute(
+        select(User.id).where(User.username == request.session["user"]["username"])
+    )).scalar()
+    if tutor_id is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Tutor profile not found")
+
+    limit = max(1, min(limit, MATCH_MAX_LIMIT))
+    recommended = await matchmaker.recommend(db, tutor_id, limit)
+
+    # Another worker may have handed a lead out since our last resync: confirm with one PK lookup
+    still_open = set((await db.execute(
+        select(StudentRegistration.id).where(
+            StudentRegistration.id.in_([lead.id for lead, _, _ in recommended]),
+            StudentRegistration.status == LeadStatus.VERIFIED_AVAILABLE
+        )
+    )).scalars().all())
+    results = []
+    for lead, score, reasons in recommended:
+        if lead.id not in still_open:
+            matchmaker.lead_taken(lead.id)
+            continue
+        results.append({**lead.to_dict(), "score": round(score, 4), "reasons": reasons})
+
+    return {"tutor_id": tutor_id, "recommendations": results}
+
+
+@app.get("/api/tutor/events")
+async def tutor_event_stream(
+    request: Request,
+    area: Optional[str] = None,
+    board: Optional[str] = None,
+    subject: Optional[str] = None,
+):
+    """
+    Server-Sent Events feed of lead_available / lead_taken / match_approved for the tutor dashboard.
+    """
+    if 'user' not in request.session:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Login required")
+
+    # Short-lived session: a stream can stay open for hours and must not pin a DB connection
+    async with AsyncSessionLocal() as db:
+        tutor_id = (await db.execute(
+            select(User.id).where(User.username == request.session["user"]["username"])
+        )).scalar()
+    if tutor_id is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Tutor profile not found")
+
+    last_event_id = request.headers.get("last-event-id")
+
+    async def stream():
+        # Subscribed inside the generator so the subscription is always released with it
+        with event_hub.subscribe(
+            TUTOR_CHANNEL,
+            tutor_event_filter(tutor_id, area, board, subject),
+            last_event_id=last_event_id,
+        ) as subscription:
+            yield "retry: 3000\n\n"
+            while not await request.is_disconnected():
+                try:
+                    event = await subscription.get(timeout=EVENT_HEARTBEAT_SECONDS)
+                except ConnectionResetError:
+                    break
+                # A comment line keeps proxies from closing an idle stream
+                yield format_sse(event) if event else ": keepalive\n\n"
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 # --- Admin Panel Routes ---
 
 
 
 @app.post("/reject_tutor_match/{lead_id}", name="reject_tutor_match")
-async def reject_tutor_match(request: Request, lead_id: int, db: Session = Depends(get_db)):
+async def reject_tutor_match(request: Request, lead_id: int, db: AsyncSession = Depends(get_async_db)):
     if 'user' not in request.session or request.session.get('user', {}).get('user_type') != 'admin':
         return RedirectResponse(url="/login?error=Admin access required", status_code=status.HTTP_303_SEE_OTHER)
 
-    lead = db.query(StudentRegistration).filter(StudentRegistration.id == lead_id).first()
-    if lead and lead.status == LeadStatus.PENDING_TUTOR_APPROVAL:
-        lead.status = LeadStatus.VERIFIED_AVAILABLE
-        lead.accepted_by_tutor_id = None  # Remove the association with the tutor
-        db.commit()
+    # Back to VERIFIED_AVAILABLE and remove the association with the tutor
+    lead = await reject_match(db, lead_id)
+    if lead:
+        await db.commit()
+        overview_feed.changed()
+        matchmaker.tutor_changed(lead.previous_tutor_id)
+        matchmaker.lead_available(lead)
+        event_hub.publish(TUTOR_CHANNEL, "lead_available", lead_event_data(lead))
+        await publish_admin_lead(db, "match_rejected", lead.id)
         flash(request, "Tutor match rejected. The lead is now available again.", "success")
     else:
         flash(request, "Lead not found or already processed.", "error")
@@ -361,9 +583,9 @@ async def reject_tutor_match(request: Request, lead_id: int, db: Session = Depen
 # In backend/main.py, replace the old get_lead_details function with this one
 
 @app.get("/api/lead/{lead_id}", name="get_lead_details")
-async def get_lead_details(lead_id: int, db: Session = Depends(get_db)):
+async def get_lead_details(lead_id: int, db: AsyncSession = Depends(get_async_db)):
     """API endpoint to get the full details of a student lead."""
-    lead = db.query(StudentRegistration).filter(StudentRegistration.id == lead_id).first()
+    lead = await db.get(StudentRegistration, lead_id)
     
     if not lead:
         raise HTTPException(status_code=404, detail="Lead not found")
@@ -392,51 +614,263 @@ async def admin_logout(request: Request):
     return RedirectResponse(url="/login", status_code=status.HTTP_303_SEE_OTHER)
 
 
-@app.get("/admin", name="admin")
-async def get_admin_page(request: Request, db: Session = Depends(get_db)):
-    if 'user' not in request.session or request.session.get('user', {}).get('user_type') != 'admin':
-        return RedirectResponse(url="/login?error=Admin access required", status_code=status.HTTP_303_SEE_OTHER)
+# --- Admin list endpoints (keyset-paginated) ---
 
-    # Fetch data for the Control Panel (existing queries)
-    unverified_leads = db.query(StudentRegistration).filter(
+# Filters defining each admin lead tab
+ADMIN_LEAD_TABS = {
+    "unverified": [
         StudentRegistration.status == LeadStatus.PENDING_ADMIN_VERIFICATION,
-        StudentRegistration.is_verified == True
-    ).all()
+        StudentRegistration.is_verified == True,
+    ],
+    "pending": [StudentRegistration.status == LeadStatus.PENDING_TUTOR_APPROVAL],
+    "available": [StudentRegistration.status == LeadStatus.VERIFIED_AVAILABLE],
+    "matched": [StudentRegistration.status == LeadStatus.TUTOR_MATCHED],
+    "all": [],
+}
 
-    pending_requests = db.query(StudentRegistration, User).join(
-        User, StudentRegistration.accepted_by_tutor_id == User.id
-    ).filter(
-        StudentRegistration.status == LeadStatus.PENDING_TUTOR_APPROVAL
-    ).all()
+# Sortable columns (expression-indexed, see models.py)
+ADMIN_LEAD_SORTS = LEAD_SORT_KEYS
+ADMIN_TUTOR_SORTS = TUTOR_SORT_KEYS
 
-    available_leads = db.query(StudentRegistration).filter(
-        StudentRegistration.status == LeadStatus.VERIFIED_AVAILABLE
-    ).all()
 
-    matched_leads = db.query(StudentRegistration, User).join(
+def lead_row(lead: StudentRegistration, tutor_name: Optional[str] = None) -> dict:
+    return {
+        "id": lead.id,
+        "full_name": lead.full_name,
+        "email": lead.email,
+        "phone_number": lead.phone_number,
+        "area": lead.area,
+        "board": lead.board,
+        "total_fee": lead.total_fee,
+        "status": lead.status.value,
+        "tuition_status": lead.tuition_status,
+        "tutor_name": tutor_name,
+        "created_at": lead.created_at.isoformat() if lead.created_at else None,
+    }
+
+
+def tutor_row(tutor: User) -> dict:
+    return {
+        "id": tutor.id,
+        "username": tutor.username,
+        "full_name": tutor.full_name,
+        "email": tutor.email,
+        "phone_number": tutor.phone_number,
+        "last_qualification": tutor.last_qualification,
+        "cnic_front_thumb_path": tutor.cnic_front_thumb_path,
+    }
+
+
+# The admin dashboard queue (ADMIN_LEAD_TABS key) a lead's status puts it in
+ADMIN_QUEUES = {
+    LeadStatus.PENDING_ADMIN_VERIFICATION: "unverified",
+    LeadStatus.PENDING_TUTOR_APPROVAL: "pending",
+    LeadStatus.VERIFIED_AVAILABLE: "available",
+    LeadStatus.TUTOR_MATCHED: "matched",
+}
+
+
+async def publish_admin_lead(db: AsyncSession, event_type: str, lead_id: int):
+    """
+    Push a lead's current row to open admin tabs, which move it to its new queue.
+
+    Call after committing. The row is read once here and shared by every tab;
+    with no admin tab connected nothing is queried.
+    """
+    if not event_hub.subscriber_count(ADMIN_CHANNEL):
+        return
+    row = (await db.execute(
+        select(StudentRegistration, User.full_name.label("tutor_name")).outerjoin(
+            User, StudentRegistration.accepted_by_tutor_id == User.id
+        ).where(StudentRegistration.id == lead_id)
+        # Transitions update with synchronize_session=False: never reuse a stale identity-map copy
+        .execution_options(populate_existing=True)
+    )).first()
+    if row is None:
+        return
+    lead = row.StudentRegistration
+    queue = ADMIN_QUEUES.get(lead.status)
+    if queue == "unverified" and not lead.is_verified:
+        queue = None  # Still waiting for the student's OTP
+    event_hub.publish(ADMIN_CHANNEL, event_type, {"lead": lead_row(lead, row.tutor_name), "queue": queue})
+
+
+@app.get("/api/admin/leads/{tab}", name="admin_leads")
+async def get_admin_leads(
+    request: Request,
+    tab: str,
+    db: AsyncSession = Depends(get_async_db),
+    cursor: Optional[str] = None,
+    limit: int = DEFAULT_PAGE_SIZE,
+    sort: str = "created_at",
+    order: Literal["asc", "desc"] = "desc",
+    area: Optional[str] = None,
+    board: Optional[str] = None,
+    lead_status: Optional[LeadStatus] = Query(None, alias="status"),
+    search: Optional[str] = None,
+):
+    """
+    API endpoint returning one keyset-paginated page of leads for an admin tab.
+    """
+    if 'user' not in request.session or request.session.get('user', {}).get('user_type') != 'admin':
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin access required")
+    if tab not in ADMIN_LEAD_TABS:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Unknown tab")
+    if sort not in ADMIN_LEAD_SORTS:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Unsupported sort field")
+
+    limit = clamp_limit(limit)
+    sort_expr = ADMIN_LEAD_SORTS[sort]
+    stmt = select(
+        StudentRegistration, User.full_name.label("tutor_name"), sort_expr.label("sort_value")
+    ).outerjoin(
         User, StudentRegistration.accepted_by_tutor_id == User.id
-    ).filter(
-        StudentRegistration.status == LeadStatus.TUTOR_MATCHED
-    ).all()
-        
-    # --- NEW QUERIES ---
-    # Fetch all users who are tutors
-    all_tutors = db.query(User).filter(User.user_type == 'Tutor').all()
-    
-    # Fetch all student registrations
-    all_students = db.query(StudentRegistration).all()
-    all_tutors = db.query(User).filter(User.user_type == 'Tutor').all()
-    # --- END NEW QUERIES ---
+    ).where(*ADMIN_LEAD_TABS[tab])
+
+    if area:
+        stmt = stmt.where(StudentRegistration.area == area)
+    if board:
+        stmt = stmt.where(StudentRegistration.board == board)
+    if lead_status:
+        stmt = stmt.where(StudentRegistration.status == lead_status)
+    if search:
+        pattern = f"{search.strip()}%"
+        stmt = stmt.where(or_(
+            StudentRegistration.full_name.ilike(pattern),
+            StudentRegistration.email.ilike(pattern),
+        ))
+
+    try:
+        stmt = keyset_paginate(stmt, sort_expr, StudentRegistration.id, cursor, limit, order == "desc")
+    except InvalidCursor as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+    rows, next_cursor = page_from_rows(
+        (await db.execute(stmt)).all(), limit,
+        lambda row: (row.sort_value, row.StudentRegistration.id),
+    )
+    return {
+        "items": [lead_row(row.StudentRegistration, row.tutor_name) for row in rows],
+        "next_cursor": next_cursor,
+    }
+
+
+@app.get("/api/admin/tutors", name="admin_tutors")
+async def get_admin_tutors(
+    request: Request,
+    db: AsyncSession = Depends(get_async_db),
+    cursor: Optional[str] = None,
+    limit: int = DEFAULT_PAGE_SIZE,
+    sort: str = "username",
+    order: Literal["asc", "desc"] = "asc",
+    search: Optional[str] = None,
+):
+    """
+    API endpoint returning one keyset-paginated page of registered tutors.
+    """
+    if 'user' not in request.session or request.session.get('user', {}).get('user_type') != 'admin':
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin access required")
+    if sort not in ADMIN_TUTOR_SORTS:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Unsupported sort field")
+
+    limit = clamp_limit(limit)
+    sort_expr = ADMIN_TUTOR_SORTS[sort]
+    stmt = select(User, sort_expr.label("sort_value")).where(User.user_type == 'Tutor')
+    if search:
+        pattern = f"{search.strip()}%"
+        stmt = stmt.where(or_(User.username.ilike(pattern), User.full_name.ilike(pattern)))
+
+    try:
+        stmt = keyset_paginate(stmt, sort_expr, User.id, cursor, limit, order == "desc")
+    except InvalidCursor as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+    rows, next_cursor = page_from_rows(
+        (await db.execute(stmt)).all(), limit,
+        lambda row: (row.sort_value, row.User.id),
+    )
+    return {
+        "items": [tutor_row(row.User) for row in rows],
+        "next_cursor": next_cursor,
+    }
+
+
+@app.get("/api/admin/overview", name="admin_overview")
+async def get_admin_overview(request: Request, db: AsyncSession = Depends(get_async_db)):
+    """
+    API endpoint returning the admin overview counts and fee totals (cached snapshot).
+    """
+    if 'user' not in request.session or request.session.get('user', {}).get('user_type') != 'admin':
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin access required")
+
+    return await admin_overview_cache.get(db)
+
+
+@app.websocket("/ws/admin")
+async def admin_socket(websocket: WebSocket):
+    """
+    WebSocket feed for the admin panel: lead rows moving between queues, tutor
+    verifications and overview counts, pushed as they happen.
+    """
+    # Browsers send the session cookie cross-site on a WebSocket handshake, so also check the Origin
+    origin = websocket.headers.get("origin")
+    if (websocket.session.get('user', {}).get('user_type') != 'admin'
+            or (origin and urlsplit(origin).netloc != websocket.headers.get("host"))):
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+
+    await websocket.accept()
+    with event_hub.subscribe(ADMIN_CHANNEL) as subscription:
+        # Counts as of now; after a reconnect the page reloads its open tables itself
+        async with AsyncSessionLocal() as db:
+            overview = await admin_overview_cache.get(db)
+        await websocket.send_json({"type": "overview", "data": overview})
+
+        async def wait_closed():
+            # The page never sends anything; reading is how a close is noticed
+            try:
+                while True:
+                    await websocket.receive_text()
+            except WebSocketDisconnect:
+                pass
+
+        closed = asyncio.create_task(wait_closed())
+        try:
+            while True:
+                next_event = asyncio.create_task(subscription.get(timeout=EVENT_HEARTBEAT_SECONDS))
+                await asyncio.wait({next_event, closed}, return_when=asyncio.FIRST_COMPLETED)
+                if closed.done():
+                    next_event.cancel()
+                    break
+                event = next_event.result()
+                # A ping frame keeps proxies from closing an idle socket
+                await websocket.send_text(format_json(event) if event else '{"type": "ping"}')
+        except ConnectionResetError:
+            # Too far behind to catch up event by event: the page reconnects and reloads
+            await websocket.close(code=status.WS_1013_TRY_AGAIN_LATER)
+        except (WebSocketDisconnect, RuntimeError):
+            pass
+        finally:
+            closed.cancel()
+
+
+@app.get("/admin", name="admin")
+async def get_admin_page(request: Request, db: AsyncSession = Depends(get_async_db)):
+    if 'user' not in request.session or request.session.get('user', {}).get('user_type') != 'admin':
+        return RedirectResponse(url="/login?error=Admin access required", status_code=status.HTTP_303_SEE_OTHER)
+
+    # Only counts are needed for the landing view (one cached aggregate query);
+    # the tables load their rows page by page from the /api/admin/leads/* and
+    # /api/admin/tutors endpoints.
+    overview = await admin_overview_cache.get(db)
 
     context = {
         "request": request,
         "session": request.session,
-        "unverified_leads": unverified_leads,
-        "pending_requests": pending_requests,
-        "available_leads": available_leads,
-        "matched_leads": matched_leads,
-        "all_tutors": all_tutors,          # Add tutors to context
-        "all_students": all_students,      # Add students to context
+        "unverified_count": overview["awaiting_admin_verification"],
+        "pending_count": overview["pending_tutor_approvals"],
+        "tutors_count": overview["tutors"]["total"],
+        "students_count": overview["total_leads"],
         "get_flashed_messages": get_flashed_messages,
     }
     return templates.TemplateResponse("admin.html", context)
@@ -445,20 +879,24 @@ async def get_admin_page(request: Request, db: Session = Depends(get_db)):
 async def verify_lead(
     request: Request,
     lead_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     deducted_fee: float = Form(0.0)  # New field for the deducted fee
 ):
     if 'user' not in request.session or request.session.get('user', {}).get('user_type') != 'admin':
         return RedirectResponse(url="/login?error=Admin access required", status_code=status.HTTP_303_SEE_OTHER)
 
     admin_user = request.session.get("user")
-    admin_id = db.query(User).filter(User.username == admin_user["username"]).first().id if admin_user else None
+    admin_id = (await db.execute(
+        select(User.id).where(User.username == admin_user["username"])
+    )).scalar() if admin_user else None
 
 
-    lead = db.query(StudentRegistration).filter(StudentRegistration.id == lead_id).first()
+    # Update the lead's fee and status in one conditional statement, so a
+    # double-submitted form cannot apply the deduction twice
+    lead = await verify_pending_lead(db, lead_id, deducted_fee)
     if lead:
-        original_fee = lead.total_fee
-        final_fee = original_fee - deducted_fee
+        final_fee = lead.total_fee
+        original_fee = final_fee + deducted_fee
 
         # Log the deduction
         deduction_record = FeeDeduction(
@@ -470,28 +908,33 @@ async def verify_lead(
         )
         db.add(deduction_record)
 
-        # Update the lead's fee and status
-        lead.total_fee = final_fee
-        lead.status = LeadStatus.VERIFIED_AVAILABLE
-        db.commit()
+        await refresh_tutor_earnings(db, lead.accepted_by_tutor_id)
+        await db.commit()
+        overview_feed.changed()
+        matchmaker.lead_available(lead)
+        event_hub.publish(TUTOR_CHANNEL, "lead_available", lead_event_data(lead))
+        await publish_admin_lead(db, "lead_published", lead.id)
 
         flash(request, f"Lead verified successfully! Final fee is now Rs. {final_fee:.0f}.", "success")
     else:
-        flash(request, "Lead not found.", "error")
+        flash(request, "Lead not found or already verified.", "error")
 
     return RedirectResponse(url="/admin", status_code=status.HTTP_303_SEE_OTHER)    
 
 @app.post("/approve_tutor_match/{lead_id}", name="approve_tutor_match")
-async def approve_tutor_match(request: Request, lead_id: int, db: Session = Depends(get_db)):
+async def approve_tutor_match(request: Request, lead_id: int, db: AsyncSession = Depends(get_async_db)):
     if 'user' not in request.session or request.session.get('user', {}).get('user_type') != 'admin':
         return RedirectResponse(url="/login?error=Admin access required", status_code=status.HTTP_303_SEE_OTHER)
 
-    lead = db.query(StudentRegistration).filter(StudentRegistration.id == lead_id).first()
-    
-    if lead and lead.status == LeadStatus.PENDING_TUTOR_APPROVAL:
-        # Set the status to TUTOR_MATCHED
-        lead.status = LeadStatus.TUTOR_MATCHED
-        db.commit()
+    # Set the status to TUTOR_MATCHED, only if it is still pending approval
+    lead = await approve_match(db, lead_id)
+    if lead:
+        await refresh_tutor_earnings(db, lead.accepted_by_tutor_id)
+        await db.commit()
+        overview_feed.changed()
+        matchmaker.tutor_changed(lead.accepted_by_tutor_id)
+        event_hub.publish(TUTOR_CHANNEL, "match_approved", {**lead_event_data(lead), "tutor_id": lead.accepted_by_tutor_id})
+        await publish_admin_lead(db, "match_approved", lead.id)
         flash(request, "Tutor match approved successfully!", "success")
     else:
         flash(request, "Lead not found or its status was not pending approval.", "error")
@@ -499,10 +942,70 @@ async def approve_tutor_match(request: Request, lead_id: int, db: Session = Depe
     return RedirectResponse(url="/admin", status_code=status.HTTP_303_SEE_OTHER)
 
 
+@app.get("/api/quote")
+async def get_quote(
+    request: Request,
+    area: str = Query(...),
+    board: str = Query(...),
+    subjects: list[str] = Query([])
+):
+    """
+    API endpoint to price one (area, board, subjects) combination for the student calculator.
+    """
+    # Fees are hot-reloaded, so caches must revalidate; a quote (per URL) only
+    # changes with the fee version, which is therefore its ETag
+    schedule = fee_config.schedule
+    etag = f'"{schedule.version}"'
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return JSONResponse(content=schedule.quote(area, board, subjects), headers=headers)
+
+
+@app.post("/api/quote")
+async def post_quotes(batch: QuoteBatch):
+    """
+    API endpoint to price several (area, board, subjects) combinations in one call.
+    """
+    if len(batch.quotes) > MAX_QUOTES_PER_REQUEST:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"At most {MAX_QUOTES_PER_REQUEST} quotes per request"
+        )
+    # One schedule for the whole batch, even if the config reloads mid-request
+    schedule = fee_config.schedule
+    return {"quotes": [schedule.quote(q.area, q.board, q.subjects) for q in batch.quotes]}
+
+
+@app.get("/api/fees")
+async def get_fee_config_pointer(request: Request):
+    """
+    API endpoint that names the current fee table asset; cheap to revalidate with If-None-Match.
+    """
+    headers = {"ETag": fee_config.etag, "Cache-Control": "no-cache"}
+    if request.headers.get("if-none-match") == fee_config.etag:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return JSONResponse(content={"version": fee_config.version, "url": fee_config.asset_url}, headers=headers)
+
+
+@app.get("/fees/{version}.json")
+async def get_fee_config_asset(request: Request, version: str):
+    """
+    Content-hashed fee tables. A given version never changes, so it may be cached forever.
+    """
+    if version != fee_config.version:
+        # Superseded version: point the client at the current tables
+        return RedirectResponse(url=fee_config.asset_url, status_code=status.HTTP_302_FOUND, headers={"Cache-Control": "no-cache"})
+    headers = {"ETag": fee_config.etag, "Cache-Control": "public, max-age=31536000, immutable"}
+    if request.headers.get("if-none-match") == fee_config.etag:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(content=fee_config.asset, media_type="application/json", headers=headers)
+
+
 @app.post("/student/submit")
 async def submit_student_form(
     request: Request,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     area: str = Form(...),
     board: str = Form(...),
     subjects: list[str] = Form(...),
@@ -510,7 +1013,7 @@ async def submit_student_form(
     phone_number: str = Form(...),
     email: EmailStr = Form(...),
     address: str = Form(...),
-    total_fee: float = Form(...)
+    total_fee: Optional[float] = Form(None)  # Ignored: the fee is recomputed server-side
 ):
     # Manually create the Pydantic model instance for validation and use
     try:
@@ -533,11 +1036,11 @@ async def submit_student_form(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Please select at least one subject"
         )
-    if form.total_fee < 0:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Total fee cannot be negative"
-        )
+
+    # Never trust the posted total: price the lead from the fee tables
+    total_fee = fee_config.schedule.total_fee(form.area, form.board, form.subjects)
+    if form.total_fee is not None and form.total_fee != total_fee:
+        logger.warning(f"Posted fee {form.total_fee} for {form.email} differs from computed fee {total_fee}")
     
     # Check if email is already registered
     # if db.query(StudentRegistration).filter(StudentRegistration.email == form.email).first():
@@ -548,7 +1051,6 @@ async def submit_student_form(
     
     # Generate OTP
     otp = str(random.randint(100000, 999999))
-    otp_created_at = datetime.now(timezone.utc)
     
     # Create student registration record
     registration = StudentRegistration(
@@ -559,43 +1061,40 @@ async def submit_student_form(
         address=form.address,
         board=form.board,
         subjects=",".join(form.subjects),  # Store as comma-separated string
-        total_fee=form.total_fee,
-        is_verified=False,
-        otp=otp,
-        otp_created_at=otp_created_at
+        total_fee=total_fee,
+        is_verified=False
     )
     
     try:
         db.add(registration)
-        db.commit()
-        db.refresh(registration)
+        await db.flush()
+        db.add_all([
+            LeadSubject(lead_id=registration.id, subject=subject)
+            for subject in split_subjects(registration.subjects)
+        ])
+        # Queue the OTP email in the same transaction as the registration
+        await enqueue_otp_email(db, form.email, otp)
+        await db.commit()
+        await db.refresh(registration)
+        await otp_store.issue(OTPPurpose.STUDENT_REGISTRATION, form.email, otp)
+        email_queue.wake()
         logger.debug(f"Student registration created for {form.email}")
-        
-        # Send OTP email
-        try:
-            await send_otp_email(form.email, otp)
-            flash(request, "OTP sent to your email", "success")
-            # Store email in session for OTP verification
-            request.session["student_email"] = form.email
-            return JSONResponse(
-                status_code=status.HTTP_201_CREATED,
-                content={
-                    "status": "success",
-                    "message": "Form submitted, OTP sent",
-                    "next_step": "verify"
-                }
-            )
-        except Exception as e:
-            logger.error(f"Failed to send OTP email: {str(e)}")
-            db.delete(registration)
-            db.commit()
-            raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail="Failed to send OTP"
-            )
+
+        flash(request, "OTP sent to your email", "success")
+        # Store email in session for OTP verification
+        request.session["student_email"] = form.email
+        return JSONResponse(
+            status_code=status.HTTP_201_CREATED,
+            content={
+                "status": "success",
+                "message": "Form submitted, OTP sent",
+                "total_fee": total_fee,
+                "next_step": "verify"
+            }
+        )
     except Exception as e:
         logger.error(f"Database error: {str(e)}")
-        db.rollback()
+        await db.rollback()
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Database error: {str(e)}"
@@ -607,91 +1106,41 @@ async def student_verify_otp(
     request: Request,
     email: str = Form(...),
     otp: str = Form(...),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    print("\n===============================")
-    print("🚀 Incoming Student OTP Verification Request")
-    print("===============================")
-    print(f"📧 Email Received: {email}")
-    print(f"🔢 OTP Received: {otp}")
-    print(f"🕒 Current Server Time (UTC): {datetime.now(timezone.utc)}")
+    logger.debug(f"Student OTP verification request for {email}")
 
     # Input validation
-    print("🔍 Step 1: Validating Inputs...")
     if not email or not otp or len(otp) != 6:
-        print("❌ Validation Failed: Missing or Invalid OTP Format")
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Invalid OTP format"
         )
-    print("✅ Inputs Validated")
+
+    # Check the code (and the brute-force counter) before touching the database
+    raise_for_otp_result(await otp_store.verify(OTPPurpose.STUDENT_REGISTRATION, email, otp))
 
     # Fetch registration
-    print("🔍 Step 2: Querying StudentRegistration Table...")
-    registration = db.query(StudentRegistration).filter(
-        StudentRegistration.email == email,
-        StudentRegistration.is_verified == False
-    ).order_by(StudentRegistration.created_at.desc()).first()
+    registration = (await db.execute(
+        select(StudentRegistration).where(
+            StudentRegistration.email == email,
+            StudentRegistration.is_verified == False
+        ).order_by(StudentRegistration.created_at.desc())
+    )).scalars().first()
     
     if not registration:
-        print(f"❌ Email not found in registrations: {email}")
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Email not registered"
         )
-    print(f"✅ Registration Found: ID={registration.id}")
-    print(f"   - Is Verified: {registration.is_verified}")
-    print(f"   - Stored OTP: {registration.otp}")
-    print(f"   - OTP Timestamp: {registration.otp_created_at}")
-
-    # Already verified
-    print("🔍 Step 3: Checking Verification Status...")
-    if registration.is_verified:
-        print("❌ Account is already verified, no action needed")
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Account already verified"
-        )
-    print("✅ Account is not yet verified")
-
-    # Check OTP match
-    print("🔍 Step 4: Matching OTP...")
-    if registration.otp != otp:
-        print(f"❌ OTP mismatch - Expected: {registration.otp}, Got: {otp}")
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Invalid OTP"
-        )
-    print("✅ OTP matches")
-
-    # Check OTP expiration
-    print("🔍 Step 5: Checking OTP Expiry...")
-    otp_created_at_utc = registration.otp_created_at.replace(tzinfo=timezone.utc)
-    now_utc = datetime.now(timezone.utc)
-    time_difference = now_utc - otp_created_at_utc
-    print(f"🕒 OTP Age: {time_difference.total_seconds()} seconds")
-
-    if time_difference > timedelta(minutes=5):
-        print("❌ OTP has expired")
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="OTP expired"
-        )
-    print("✅ OTP is valid and within time limit")
 
     # Mark as verified
-    print("🔧 Step 6: Updating Verification Status in DB...")
     registration.is_verified = True
-    registration.otp = None
-    registration.otp_created_at = None
-
-    print("📦 Committing changes to database...")
-    db.commit()
-    print("✅ Changes committed successfully")
-
-    print("🎉 ✅ Student verification successful")
-    print(f"   - ID: {registration.id}")
-    print(f"   - Verified at: {now_utc}")
+    await db.commit()
+    logger.debug(f"Student registration {registration.id} verified")
+    # A new lead in the admin "New Leads" queue
+    overview_feed.changed()
+    await publish_admin_lead(db, "lead_verified", registration.id)
 
     return JSONResponse(
         status_code=status.HTTP_200_OK,
@@ -702,9 +1151,11 @@ async def student_verify_otp(
 @app.post("/student/resend-otp")
 async def student_resend_otp(
     email: str = Form(...),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    registration = db.query(StudentRegistration).filter(StudentRegistration.email == email).first()
+    registration = (await db.execute(
+        select(StudentRegistration).where(StudentRegistration.email == email)
+    )).scalars().first()
     if not registration:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -719,22 +1170,16 @@ async def student_resend_otp(
 
     # Generate new OTP
     new_otp = str(random.randint(100000, 999999))
-    registration.otp = new_otp
-    registration.otp_created_at = datetime.now(timezone.utc)
-    db.commit()
+    await otp_store.issue(OTPPurpose.STUDENT_REGISTRATION, email, new_otp)
 
-    # Send new OTP
-    try:
-        await send_otp_email(email, new_otp)
-        return JSONResponse(
-            status_code=status.HTTP_200_OK,
-            content={"status": "success", "message": "New OTP sent successfully"}
-        )
-    except Exception as e:
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Failed to send OTP: {str(e)}"
-        )
+    # Queue new OTP (collapses with any still-unsent OTP for this email)
+    await enqueue_otp_email(db, email, new_otp)
+    await db.commit()
+    email_queue.wake()
+    return JSONResponse(
+        status_code=status.HTTP_200_OK,
+        content={"status": "success", "message": "New OTP sent successfully"}
+    )
     
     # Add to the API ENDPOINTS section in main.py
 
@@ -744,7 +1189,7 @@ async def student_resend_otp(
 @app.get("/student/summary")
 async def get_student_summary(
     request: Request,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     # Get the email of the most recently verified student from the session
     email = request.session.get("student_email")
@@ -754,9 +1199,11 @@ async def get_student_summary(
     
     # Fetch the most recent registration for that email
     # This ensures we show the correct summary if a user registers multiple times
-    registration = db.query(StudentRegistration).filter(
-        StudentRegistration.email == email
-    ).order_by(StudentRegistration.created_at.desc()).first()
+    registration = (await db.execute(
+        select(StudentRegistration).where(
+            StudentRegistration.email == email
+        ).order_by(StudentRegistration.created_at.desc())
+    )).scalars().first()
 
     if not registration:
         # This is a fallback, in case the registration isn't found
@@ -798,12 +1245,12 @@ async def signup(
     last_qualification: str = Form(...),
     cnic_front: UploadFile = File(...),
     cnic_back: UploadFile = File(...),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     logger.debug(f"Received tutor signup request for username: {username}")
 
     # Check if username exists
-    if db.query(User).filter(User.username == username).first():
+    if (await db.execute(select(User.id).where(User.username == username))).first():
         logger.warning(f"Username {username} already exists")
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -812,42 +1259,41 @@ async def signup(
     
     # Generate OTP
     otp = str(random.randint(100000, 999999))
-    otp_created_at = datetime.now(timezone.utc)
     
-    # Handle file uploads
-    cnic_front_path = None
-    cnic_back_path = None
+    # Stream the CNIC images to disk in chunks, hashed and size-checked as they go;
+    # the batch removes them again if the signup fails further down
+    uploads = UploadBatch()
     try:
-        # Sanitize filenames
-        front_filename = re.sub(r'[^a-zA-Z0-9._-]', '_', cnic_front.filename)
-        back_filename = re.sub(r'[^a-zA-Z0-9._-]', '_', cnic_back.filename)
-        
-        # Save files
-        cnic_front_path = os.path.join("uploads", f"{username}_cnic_front_{front_filename}")
-        cnic_back_path = os.path.join("uploads", f"{username}_cnic_back_{back_filename}")
-        
-        front_abs_path = os.path.join("static", cnic_front_path)
-        back_abs_path = os.path.join("static", cnic_back_path)
-        
-        os.makedirs(os.path.dirname(front_abs_path), exist_ok=True)
-        
-        async with aiofiles.open(front_abs_path, "wb") as f:
-            await f.write(await cnic_front.read())
-        async with aiofiles.open(back_abs_path, "wb") as f:
-            await f.write(await cnic_back.read())
-            
+        cnic_front_path = (await uploads.save(cnic_front, "cnic")).path
+        cnic_back_path = (await uploads.save(cnic_back, "cnic")).path
+    except UploadTooLarge as e:
+        await uploads.discard()
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=str(e))
+    except UploadRejected as e:
+        await uploads.discard()
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
     except Exception as e:
+        await uploads.discard()
         logger.error(f"Failed to save CNIC files: {str(e)}")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Failed to save CNIC files: {str(e)}"
         )
 
+    try:
+        hashed_password = await password_service.hash(password)
+    except PasswordServiceBusy:
+        await uploads.discard()
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Server is busy, please try again in a moment."
+        )
+
     try:
         # Create user with OTP data
         user = User(
             username=username,
-            hashed_password=pwd_context.hash(password),
+            hashed_password=hashed_password,
             user_type="Tutor",
             full_name=full_name,
             phone_number=phone_number,
@@ -856,23 +1302,21 @@ async def signup(
             last_qualification=last_qualification,
             cnic_front_path=cnic_front_path,
             cnic_back_path=cnic_back_path,
-            otp=otp,
-            otp_created_at=otp_created_at,
             is_verified=False
         )
         
+        # Keeps a failing signup with the same images from removing them before we commit
+        await uploads.claim(db)
         db.add(user)
-        db.commit()
-        db.refresh(user)
+        # Queue the OTP email in the same transaction as the new user
+        await enqueue_otp_email(db, email, otp)
+        await db.commit()
+        await db.refresh(user)
+        await otp_store.issue(OTPPurpose.TUTOR_SIGNUP, email, otp)
+        email_queue.wake()
+        image_processor.submit(user.id)
         logger.debug(f"Tutor {username} added to database")
-        
-        # Send OTP email
-        try:
-            await send_otp_email(email, otp)
-        except Exception as e:
-            logger.error(f"Failed to send OTP email: {str(e)}")
-            # Don't fail registration if email fails
-            
+
         return JSONResponse(
             status_code=status.HTTP_201_CREATED,
             content={
@@ -881,15 +1325,16 @@ async def signup(
                 "next_step": "verify"
             }
         )
-        
+
+    except UploadGone as e:
+        # Release the path locks first: discard() takes them in its own session
+        await db.rollback()
+        await uploads.discard()
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
     except Exception as e:
         logger.error(f"Database error: {str(e)}")
-        # Cleanup files if they were created
-        if cnic_front_path and os.path.exists(front_abs_path):
-            os.remove(front_abs_path)
-        if cnic_back_path and os.path.exists(back_abs_path):
-            os.remove(back_abs_path)
-            
+        await db.rollback()
+        await uploads.discard()
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Database error: {str(e)}"
@@ -899,76 +1344,48 @@ async def signup(
 async def verify_otp(
     email: str = Form(...),
     otp: str = Form(...),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    # Print received data
-    print("\n=== Received OTP Verification Request ===")
-    print(f"Email: {email}")
-    print(f"OTP: {otp}")
-    print(f"Current time: {datetime.now(timezone.utc)}")
+    logger.debug(f"Tutor OTP verification request for {email}")
 
     # Input validation
     if not email or not otp or len(otp) != 6:
-        print("!!! Validation failed - Invalid OTP format")
         raise HTTPException(
             status_code=400,
             detail="Invalid OTP format"
         )
 
-    user = db.query(User).filter(User.email == email).first()
+    # Check the code (and the brute-force counter) before touching the database
+    raise_for_otp_result(await otp_store.verify(OTPPurpose.TUTOR_SIGNUP, email, otp))
+
+    user = (await db.execute(select(User).where(User.email == email))).scalars().first()
     if not user:
-        print(f"!!! User not found for email: {email}")
         raise HTTPException(
             status_code=400,
             detail="Email not registered"
         )
 
-    print(f"User found: ID={user.id}, Verified={user.is_verified}")
-    print(f"Stored OTP: {user.otp}, OTP Created At: {user.otp_created_at}")
-
     if user.is_verified:
-        print("!!! Account already verified")
         raise HTTPException(
             status_code=400,
             detail=" We found an existing account on this email, Kindly use another email or try to login into that account"
         )
 
-    if user.otp != otp:
-        print(f"!!! OTP mismatch. Expected: {user.otp}, Received: {otp}")
-        raise HTTPException(
-            status_code=400,
-            detail="Invalid OTP"
-        )
-
-    # Convert stored datetime to UTC before comparison
-    otp_created_at_utc = user.otp_created_at.replace(tzinfo=timezone.utc)
-    time_difference = datetime.now() - user.otp_created_at
-    print(f"OTP Age: {time_difference.total_seconds()} seconds")
-
-    if time_difference > timedelta(minutes=5):
-        print("!!! OTP expired")
-        raise HTTPException(
-            status_code=400,
-            detail="OTP expired"
-        )
-
     # Mark as verified
     user.is_verified = True
-    user.otp = None
-    user.otp_created_at = None
-    db.commit()
-
-    print("=== Verification successful ===")
-    print(f"User {user.id} marked as verified at {datetime.now(timezone.utc)}")
+    await db.commit()
+    logger.debug(f"User {user.id} marked as verified")
+    overview_feed.changed()
+    event_hub.publish(ADMIN_CHANNEL, "tutor_verified", {"tutor": tutor_row(user)})
 
     return {"status": "verified", "message": "Account verified successfully"}
 
 @app.post("/resend-otp")
 async def resend_otp(
     email: str = Form(...),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    user = db.query(User).filter(User.email == email).first()
+    user = (await db.execute(select(User).where(User.email == email))).scalars().first()
     if not user:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -983,22 +1400,16 @@ async def resend_otp(
 
     # Generate new OTP
     new_otp = str(random.randint(100000, 999999))
-    user.otp = new_otp
-    user.otp_created_at = datetime.now(timezone.utc)
-    db.commit()
+    await otp_store.issue(OTPPurpose.TUTOR_SIGNUP, email, new_otp)
 
-    # Send new OTP
-    try:
-        await send_otp_email(email, new_otp)
-        return JSONResponse(
-            status_code=status.HTTP_200_OK,
-            content={"status": "success", "message": "New OTP sent successfully"}
-        )
-    except Exception as e:
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Failed to send OTP: {str(e)}"
-        )
+    # Queue new OTP (collapses with any still-unsent OTP for this email)
+    await enqueue_otp_email(db, email, new_otp)
+    await db.commit()
+    email_queue.wake()
+    return JSONResponse(
+        status_code=status.HTTP_200_OK,
+        content={"status": "success", "message": "New OTP sent successfully"}
+    )
 
 @app.get("/login", name="login")
 async def get_login_page(request: Request, error: Optional[str] = None):
@@ -1009,12 +1420,19 @@ async def login_post(
     username: str = Form(...),
     password: str = Form(...),
     user_type: str = Form(...),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    user = db.query(User).filter(User.username == username).first()
+    user = (await db.execute(select(User).where(User.username == username))).scalars().first()
     
     # Check credentials
-    if not user or not pwd_context.verify(password, user.hashed_password):
+    try:
+        password_ok = bool(user) and await password_service.verify(password, user.hashed_password)
+    except PasswordServiceBusy:
+        return RedirectResponse(
+            url="/login?error=Too many login attempts right now, please try again in a moment",
+            status_code=status.HTTP_303_SEE_OTHER
+        )
+    if not password_ok:
         return RedirectResponse(
             url="/login?error=Invalid username or password", 
             status_code=status.HTTP_303_SEE_OTHER
@@ -1160,36 +1578,169 @@ async def get_tutor_dashboard_page(
 # --- Public Page Routes ---
 @app.get("/", name="home")
 async def root(request: Request):
-    return templates.TemplateResponse("home.html", {"request": request, "session": request.session})
+    return page_cache.response(request, "home.html")
 
 @app.get("/student", name="student")
 async def get_student_page(request: Request):
     user = request.session.get("user", {"username": "Guest", "user_type": "guest"})
-    return templates.TemplateResponse("student.html", {"request": request, "session": request.session, "user": user["username"], "role": user["user_type"]})
+    return templates.TemplateResponse("student.html", {"request": request, "session": request.session, "user": user["username"], "role": user["user_type"], "fee_config_url": fee_config.asset_url})
 
 @app.get("/courses", name="courses")
 async def get_courses_page(request: Request):
-    return templates.TemplateResponse("courses.html", {"request": request, "session": request.session})
+    return page_cache.response(request, "courses.html")
 
 @app.get("/how_it_works", name="how_it_works")
 async def get_how_it_works_page(request: Request):
-    return templates.TemplateResponse("how_it_works.html", {"request": request, "session": request.session})
+    return page_cache.response(request, "how_it_works.html")
 
 @app.get("/contact", name="contact")
 async def get_contact_page(request: Request):
-    return templates.TemplateResponse("contact.html", {"request": request, "session": request.session})
+    return page_cache.response(request, "contact.html")
 
 @app.get("/termandconditions", name="termandconditions")
 async def get_termandconditions_page(request: Request):
-    return templates.TemplateResponse("termandconditions.html", {"request": request, "session": request.session})
+    return page_cache.response(request, "termandconditions.html")
 
 
 # --- NEW: Admin User Management API Endpoints ---
 
+@app.get("/api/admin/password_metrics", name="password_metrics")
+async def get_password_metrics(request: Request):
+    """
+    API endpoint exposing queue depth and latency of the password hashing pool.
+    """
+    if 'user' not in request.session or request.session.get('user', {}).get('user_type') != 'admin':
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin access required")
+
+    return password_service.metrics()
+
+@app.get("/metrics", name="metrics", include_in_schema=False)
+async def get_metrics(request: Request):
+    """
+    Prometheus endpoint for request latency, status codes and SQL time per route.
+    Scrapers authenticate with METRICS_TOKEN as a bearer token; admins can use their session.
+    """
+    is_admin = request.session.get('user', {}).get('user_type') == 'admin'
+    if not is_admin and not metrics_token_ok(request.headers.get("authorization", "")):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Metrics access required")
+
+    return Response(content=request_metrics.prometheus(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.get("/api/admin/profiles", name="profiles")
+async def get_profiles(request: Request):
+    """
+    API endpoint listing stored request profiles and armed paths.
+    """
+    if 'user' not in request.session or request.session.get('user', {}).get('user_type') != 'admin':
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin access required")
+
+    return {"enabled": PROFILER_ENABLED, "armed": profile_store.list_armed(), "profiles": profile_store.list()}
+
+@app.post("/api/admin/profiles/arm", name="arm_profile")
+async def arm_profile(request: Request, arm: ProfileArm):
+    """
+    API endpoint to profile the next requests to a path, e.g. one tutor's
+    dashboard or an OTP step, whoever makes them.
+    """
+    if 'user' not in request.session or request.session.get('user', {}).get('user_type') != 'admin':
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin access required")
+    if not PROFILER_ENABLED:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Profiler is disabled (set PROFILER_ENABLED=true)")
+    if not 1 <= arm.count <= 10:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="count must be between 1 and 10")
+
+    profile_store.arm(arm.path, arm.username, arm.count)
+    return {"armed": profile_store.list_armed()}
+
+@app.get("/api/admin/profiles/{profile_id}", name="download_profile")
+async def download_profile(
+    request: Request,
+    profile_id: str,
+    profile_format: Literal["speedscope", "collapsed"] = Query("speedscope", alias="format"),
+):
+    """
+    API endpoint downloading a stored profile as speedscope JSON or folded stacks.
+    """
+    if 'user' not in request.session or request.session.get('user', {}).get('user_type') != 'admin':
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin access required")
+
+    profile = profile_store.get(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Profile not found")
+    body, media_type, filename = profile.export(profile_format)
+    return Response(content=body, media_type=media_type,
+                    headers={"Content-Disposition": f'attachment; filename="{filename}"'})
+
+@app.get("/api/admin/slow_queries", name="slow_queries")
+async def get_slow_queries(request: Request, limit: int = Query(SLOW_QUERY_BUFFER, ge=1, le=SLOW_QUERY_BUFFER)):
+    """
+    API endpoint listing recent slow SQL statements (with sampled query plans)
+    and the slowest statements by total time.
+    """
+    if 'user' not in request.session or request.session.get('user', {}).get('user_type') != 'admin':
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin access required")
+
+    return slow_query_log.snapshot(limit)
+
+@app.get("/api/admin/startup_metrics", name="startup_metrics")
+async def get_startup_metrics(request: Request):
+    """
+    API endpoint exposing this worker's cold-start timings and template compile counts.
+    """
+    if 'user' not in request.session or request.session.get('user', {}).get('user_type') != 'admin':
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin access required")
+
+    return startup_timer.metrics(templates.env)
+
+@app.get("/api/admin/page_cache_metrics", name="page_cache_metrics")
+async def get_page_cache_metrics(request: Request):
+    """
+    API endpoint exposing hit/miss counts of the public page cache.
+    """
+    if 'user' not in request.session or request.session.get('user', {}).get('user_type') != 'admin':
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin access required")
+
+    return page_cache.metrics()
+
+@app.get("/api/admin/image_metrics", name="image_metrics")
+async def get_image_metrics(request: Request):
+    """
+    API endpoint exposing queue depth and timings of the CNIC thumbnail workers.
+    """
+    if 'user' not in request.session or request.session.get('user', {}).get('user_type') != 'admin':
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin access required")
+
+    return image_processor.metrics()
+
+@app.get("/api/admin/email_metrics", name="email_metrics")
+async def get_email_metrics(request: Request, db: AsyncSession = Depends(get_async_db)):
+    """
+    API endpoint exposing outbound email queue depth, retries and send latency.
+    """
+    if 'user' not in request.session or request.session.get('user', {}).get('user_type') != 'admin':
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin access required")
+
+    return await email_queue.metrics(db)
+
+@app.get("/api/admin/revenue", name="admin_revenue")
+async def get_admin_revenue(request: Request, db: AsyncSession = Depends(get_async_db)):
+    """
+    API endpoint returning platform income per month from the earnings rollup.
+    """
+    if 'user' not in request.session or request.session.get('user', {}).get('user_type') != 'admin':
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin access required")
+
+    monthly_revenue = await get_platform_monthly_revenue(db)
+    return {
+        "months": list(monthly_revenue.keys()),
+        "income": list(monthly_revenue.values()),
+        "total": sum(monthly_revenue.values()),
+    }
+
 @app.get("/api/user/{username}", name="get_user_details")
 async def get_user_details(
     username: str,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     request: Request = None
 ):
     """
@@ -1198,7 +1749,7 @@ async def get_user_details(
     if 'user' not in request.session or request.session.get('user', {}).get('user_type') != 'admin':
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin access required")
 
-    user = db.query(User).filter(User.username == username).first()
+    user = (await db.execute(select(User).where(User.username == username))).scalars().first()
     if not user or user.user_type != 'Tutor':
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Tutor not found")
 
@@ -1211,13 +1762,18 @@ async def get_user_details(
         "last_qualification": user.last_qualification,
         "fathers_name": user.fathers_name,
         "cnic_front_path": user.cnic_front_path,
-        "cnic_back_path": user.cnic_back_path
+        "cnic_back_path": user.cnic_back_path,
+        # Downscaled WebP copies, None until the image worker has rendered them
+        "cnic_front_thumb_path": user.cnic_front_thumb_path,
+        "cnic_front_preview_path": user.cnic_front_preview_path,
+        "cnic_back_thumb_path": user.cnic_back_thumb_path,
+        "cnic_back_preview_path": user.cnic_back_preview_path,
     }
 
 @app.post("/api/user/update", name="update_user_details")
 async def update_user_details(
     request: Request,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     user_id: int = Form(...),
     full_name: str = Form(...),
     email: str = Form(...),
@@ -1230,7 +1786,7 @@ async def update_user_details(
     if 'user' not in request.session or request.session.get('user', {}).get('user_type') != 'admin':
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin access required")
 
-    user_to_update = db.query(User).filter(User.id == user_id).first()
+    user_to_update = await db.get(User, user_id)
     if not user_to_update:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
 
@@ -1238,7 +1794,7 @@ async def update_user_details(
     user_to_update.email = email
     user_to_update.phone_number = phone_number
     user_to_update.last_qualification = last_qualification
-    db.commit()
+    await db.commit()
     
     flash(request, f"Successfully updated details for tutor: {user_to_update.username}", "success")
     return RedirectResponse(url="/admin", status_code=status.HTTP_303_SEE_OTHER)
@@ -1247,7 +1803,7 @@ async def update_user_details(
 @app.post("/api/user/delete", name="delete_user")
 async def delete_user(
     request: Request,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     user_id: int = Form(...)
 ):
     """
@@ -1256,7 +1812,7 @@ async def delete_user(
     if 'user' not in request.session or request.session.get('user', {}).get('user_type') != 'admin':
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin access required")
 
-    user_to_delete = db.query(User).filter(User.id == user_id).first()
+    user_to_delete = await db.get(User, user_id)
     if not user_to_delete:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
 
@@ -1265,8 +1821,8 @@ async def delete_user(
         flash(request, "Error: Admin accounts cannot be deleted.", "danger")
         return RedirectResponse(url="/admin", status_code=status.HTTP_303_SEE_OTHER)
         
-    db.delete(user_to_delete)
-    db.commit()
+    await db.delete(user_to_delete)
+    await db.commit()
 
     flash(request, f"Successfully deleted tutor: {user_to_delete.username}", "success")
     return RedirectResponse(url="/admin", status_code=status.HTTP_303_SEE_OTHER)
@@ -1276,7 +1832,7 @@ async def delete_user(
 @app.get("/api/student/{email}", name="get_student_details")
 async def get_student_details(
     email: str,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     request: Request = None
 ):
     """
@@ -1285,7 +1841,9 @@ async def get_student_details(
     if 'user' not in request.session or request.session.get('user', {}).get('user_type') != 'admin':
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin access required")
 
-    student = db.query(StudentRegistration).filter(StudentRegistration.email == email).first()
+    student = (await db.execute(
+        select(StudentRegistration).where(StudentRegistration.email == email)
+    )).scalars().first()
     if not student:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Student not found")
 
@@ -1305,7 +1863,7 @@ async def get_student_details(
 @app.post("/api/student/update", name="update_student_details")
 async def update_student_details(
     request: Request,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     student_id: int = Form(...),
     full_name: str = Form(...),
     email: str = Form(...),
@@ -1321,7 +1879,7 @@ async def update_student_details(
     if 'user' not in request.session or request.session.get('user', {}).get('user_type') != 'admin':
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin access required")
 
-    student_to_update = db.query(StudentRegistration).filter(StudentRegistration.id == student_id).first()
+    student_to_update = await db.get(StudentRegistration, student_id)
     if not student_to_update:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Student not found")
 
@@ -1336,7 +1894,12 @@ async def update_student_details(
     student_to_update.area = area
     student_to_update.board = board
     student_to_update.subjects = subjects
-    db.commit()
+    await db.execute(delete(LeadSubject).where(LeadSubject.lead_id == student_to_update.id))
+    db.add_all([
+        LeadSubject(lead_id=student_to_update.id, subject=subject)
+        for subject in split_subjects(subjects)
+    ])
+    await db.commit()
     
     flash(request, f"Successfully updated details for student: {student_to_update.full_name}", "success")
     return RedirectResponse(url="/admin", status_code=status.HTTP_303_SEE_OTHER)
@@ -1345,7 +1908,7 @@ async def update_student_details(
 @app.post("/api/student/delete", name="delete_student")
 async def delete_student(
     request: Request,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     student_id: int = Form(...)
 ):
     """
@@ -1354,7 +1917,7 @@ async def delete_student(
     if 'user' not in request.session or request.session.get('user', {}).get('user_type') != 'admin':
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin access required")
 
-    student_to_delete = db.query(StudentRegistration).filter(StudentRegistration.id == student_id).first()
+    student_to_delete = await db.get(StudentRegistration, student_id)
     if not student_to_delete:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Student not found")
 
@@ -1363,8 +1926,12 @@ async def delete_student(
         flash(request, f"Error: Cannot delete registration for {student_to_delete.full_name} as it has a pending or confirmed tutor match.", "danger")
         return RedirectResponse(url="/admin", status_code=status.HTTP_303_SEE_OTHER)
 
-    db.delete(student_to_delete)
-    db.commit()
+    await db.delete(student_to_delete)
+    await db.commit()
+    matchmaker.lead_taken(student_id)
+    event_hub.publish(TUTOR_CHANNEL, "lead_taken", {"id": student_id})
+    overview_feed.changed()
+    event_hub.publish(ADMIN_CHANNEL, "lead_deleted", {"id": student_id})
 
     flash(request, f"Successfully deleted registration for student: {student_to_delete.full_name}", "success")
     return RedirectResponse(url="/admin", status_code=status.HTTP_303_SEE_OTHER)
@@ -1374,86 +1941,68 @@ async def delete_student(
 @app.post("/forgot-password")
 async def forgot_password(
     email: EmailStr = Form(...),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    user = db.query(User).filter(User.email == email).first()
+    user = (await db.execute(select(User).where(User.email == email))).scalars().first()
     if not user:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="User with this email does not exist."
         )
 
-    # Generate OTP and set expiration
+    # Generate OTP (expires after OTP_TTL_SECONDS in the OTP store)
     otp = str(random.randint(100000, 999999))
-    otp_created_at = datetime.now(timezone.utc)
-    
-    user.otp = otp
-    user.otp_created_at = otp_created_at
-    db.commit()
+    await otp_store.issue(OTPPurpose.PASSWORD_RESET, email, otp)
 
-    # Send OTP email
-    try:
-        await send_otp_email(email, otp)
-        return JSONResponse(
-            status_code=status.HTTP_200_OK,
-            content={"message": "An OTP has been sent to your email address."}
-        )
-    except Exception as e:
-        logger.error(f"Failed to send password reset OTP email: {str(e)}")
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail="Failed to send OTP email. Please try again later."
-        )
+    # Queue OTP email
+    await enqueue_otp_email(db, email, otp)
+    await db.commit()
+    email_queue.wake()
+    return JSONResponse(
+        status_code=status.HTTP_200_OK,
+        content={"message": "An OTP has been sent to your email address."}
+    )
 
 @app.post("/reset-password")
 async def reset_password(
     email: EmailStr = Form(...),
     otp: str = Form(...),
     new_password: str = Form(...),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    user = db.query(User).filter(User.email == email).first()
-    if not user:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Invalid request. User not found."
-        )
-
-    # Verify OTP
-    if not user.otp or user.otp != otp:
+    # Verify OTP (and the brute-force counter) before touching the database
+    result = await otp_store.verify(OTPPurpose.PASSWORD_RESET, email, otp)
+    if result == OTPResult.LOCKED:
+        raise_for_otp_result(result)
+    if result == OTPResult.INVALID:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Invalid or incorrect OTP."
         )
-
-    # --- CORRECTED SECTION FOR TIMEZONE-SAFE CHECK ---
-    # Verify OTP expiration
-    if not user.otp_created_at:
+    if result == OTPResult.EXPIRED:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Could not verify OTP time. Please request a new one."
+            detail="OTP has expired. Please request a new one."
         )
 
-    # Make the stored time aware of its UTC timezone before comparing
-    otp_creation_time_utc = user.otp_created_at.replace(tzinfo=timezone.utc)
-    current_time_utc = datetime.now(timezone.utc)
-
-    if (current_time_utc - otp_creation_time_utc) > timedelta(minutes=5):
-        # Clear the expired OTP from the database
-        user.otp = None
-        user.otp_created_at = None
-        db.commit()
+    user = (await db.execute(select(User).where(User.email == email))).scalars().first()
+    if not user:
         raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="OTP has expired. Please request a new one."
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Invalid request. User not found."
         )
-    # --- END OF CORRECTION ---
 
     # Update password
-    user.hashed_password = pwd_context.hash(new_password)
-    user.otp = None  # Clear OTP after use
-    user.otp_created_at = None
-    db.commit()
+    try:
+        user.hashed_password = await password_service.hash(new_password)
+    except PasswordServiceBusy:
+        # The code was consumed by verify(); give it back so the user can retry
+        await otp_store.issue(OTPPurpose.PASSWORD_RESET, email, otp)
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Server is busy, please try again in a moment."
+        )
+    await db.commit()
 
     return JSONResponse(
         status_code=status.HTTP_200_OK,
@@ -0,0 +1,361 @@
+import os
+import math
+import time
+import heapq
+import asyncio
+import logging
+from collections import Counter
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from dotenv import load_dotenv
+
+from database import AsyncSessionLocal
+from models import StudentRegistration, LeadStatus, TuitionStatus, split_subjects
+from fees import subject_name
+
+# Load environment variables from .env file
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Tutor-lead matchmaking. Tutors have no declared areas/boards/subjects, so a
+# tutor's profile is learned from the leads they have taken (pending, ongoing,
+# completed; dropped tuitions count for less). Open leads are kept in memory
+# with inverted indexes, and each tutor's ranked candidate list is cached and
+# patched incrementally as leads become available or are taken.
+MATCH_CANDIDATES = int(os.getenv("MATCH_CANDIDATES", "100"))  # Cached candidates per tutor
+MATCH_DEFAULT_LIMIT = 10
+MATCH_MAX_LIMIT = 50
+# Candidate lists older than this are rescored (lead freshness decays over time)
+MATCH_REBUILD_SECONDS = float(os.getenv("MATCH_REBUILD_SECONDS", "300"))
+# Full reload of open leads, so changes made by other workers are picked up
+MATCH_RESYNC_SECONDS = float(os.getenv("MATCH_RESYNC_SECONDS", "60"))
+
+AREA_WEIGHT = 3.0
+BOARD_WEIGHT = 2.0
+SUBJECT_WEIGHT = 2.5
+FRESHNESS_WEIGHT = 1.0
+FRESHNESS_HALF_LIFE_DAYS = 7.0
+# Each active tuition makes locality matter more: busy tutors should not cross the city
+LOAD_LOCALITY_BOOST = 0.25
+DROPPED_HISTORY_WEIGHT = 0.5
+
+
+def utcnow() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+@dataclass
+class LeadFeatures:
+    id: int
+    area: str
+    board: str
+    subjects: frozenset
+    total_fee: float
+    created_at: datetime
+    created_ts: float = 0.0  # created_at as epoch seconds, for fast freshness math
+
+    def __post_init__(self):
+        self.created_ts = self.created_at.replace(tzinfo=timezone.utc).timestamp()
+
+    @classmethod
+    def from_row(cls, lead) -> "LeadFeatures":
+        return cls(
+            id=lead.id,
+            area=lead.area,
+            board=lead.board,
+            subjects=frozenset(subject_name(s) for s in split_subjects(lead.subjects)),
+            total_fee=lead.total_fee or 0.0,
+            created_at=lead.created_at or utcnow(),
+        )
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "area": self.area,
+            "board": self.board,
+            "subjects": sorted(self.subjects),
+            "total_fee": self.total_fee,
+            "created_at": self.created_at.isoformat(),
+        }
+
+
+@dataclass
+class TutorProfile:
+    areas: Counter = field(default_factory=Counter)
+    boards: Counter = field(default_factory=Counter)
+    subjects: Counter = field(default_factory=Counter)
+    history: float = 0.0  # Weighted number of past and current leads
+    load: int = 0         # Pending approvals plus ongoing tuitions
+
+    @property
+    def is_new(self) -> bool:
+        return self.history == 0
+
+
+async def load_tutor_profile(db: AsyncSession, tutor_id: int) -> TutorProfile:
+    rows = (await db.execute(
+        select(
+            StudentRegistration.area,
+            StudentRegistration.board,
+            StudentRegistration.subjects,
+            StudentRegistration.status,
+            StudentRegistration.tuition_status,
+        ).where(
+            StudentRegistration.accepted_by_tutor_id == tutor_id,
+            StudentRegistration.status.in_([LeadStatus.PENDING_TUTOR_APPROVAL, LeadStatus.TUTOR_MATCHED]),
+        )
+    )).all()
+
+    profile = TutorProfile()
+    for area, board, subjects, lead_status, tuition_status in rows:
+        weight = DROPPED_HISTORY_WEIGHT if tuition_status == TuitionStatus.DROPPED.value else 1.0
+        profile.history += weight
+        profile.areas[area] += weight
+        profile.boards[board] += weight
+        for subject in {subject_name(s) for s in split_subjects(subjects)}:
+            profile.subjects[subject] += weight
+        if lead_status == LeadStatus.PENDING_TUTOR_APPROVAL or tuition_status in (None, TuitionStatus.ONGOING.value):
+            profile.load += 1
+    return profile
+
+
+def _freshness(age_seconds: float) -> float:
+    return FRESHNESS_WEIGHT * math.pow(0.5, max(age_seconds, 0) / 86400 / FRESHNESS_HALF_LIFE_DAYS)
+
+
+def score_lead(profile: TutorProfile, lead: LeadFeatures, now: datetime) -> tuple:
+    """Return (score, reasons) for one tutor/lead pair; higher is better."""
+    reasons = []
+    score = 0.0
+    if profile.history:
+        area_share = profile.areas.get(lead.area, 0) / profile.history
+        if area_share:
+            score += AREA_WEIGHT * area_share * (1 + LOAD_LOCALITY_BOOST * profile.load)
+            reasons.append("area")
+        board_share = profile.boards.get(lead.board, 0) / profile.history
+        if board_share:
+            score += BOARD_WEIGHT * board_share
+            reasons.append("board")
+        if lead.subjects:
+            taught = sum(1 for s in lead.subjects if s in profile.subjects)
+            if taught:
+                score += SUBJECT_WEIGHT * taught / len(lead.subjects)
+                reasons.append("subjects")
+    score += _freshness(now.replace(tzinfo=timezone.utc).timestamp() - lead.created_ts)
+    return score, reasons
+
+
+def make_scorer(profile: TutorProfile, now: datetime):
+    """
+    Same ranking as score_lead, specialised to one profile for bulk scoring.
+
+    The per-area/per-board terms are looked up from precomputed tables instead
+    of being recomputed for every lead.
+    """
+    now_ts = now.replace(tzinfo=timezone.utc).timestamp()
+    if not profile.history:
+        return lambda lead: _freshness(now_ts - lead.created_ts)
+    area_terms = {
+        area: AREA_WEIGHT * count / profile.history * (1 + LOAD_LOCALITY_BOOST * profile.load)
+        for area, count in profile.areas.items()
+    }
+    board_terms = {board: BOARD_WEIGHT * count / profile.history for board, count in profile.boards.items()}
+    taught = frozenset(profile.subjects)
+
+    def score(lead):
+        total = area_terms.get(lead.area, 0.0) + board_terms.get(lead.board, 0.0)
+        if lead.subjects:
+            total += SUBJECT_WEIGHT * len(lead.subjects & taught) / len(lead.subjects)
+        return total + _freshness(now_ts - lead.created_ts)
+    return score
+
+
+class Matchmaker:
+    """Per-worker index of open leads plus cached top-K candidate lists per tutor."""
+
+    def __init__(self, candidates: int = MATCH_CANDIDATES):
+        self.candidates = candidates
+        self._leads = {}  # lead_id -> LeadFeatures
+        self._by_area = {}
+        self._by_board = {}
+        self._by_subject = {}
+        self._profiles = {}    # tutor_id -> TutorProfile
+        self._lists = {}       # tutor_id -> (built_at, [(score, lead_id), ...] best first)
+        self._listed_in = {}   # lead_id -> {tutor_id, ...} whose list holds it
+        self._resync_task = None
+        self.stats = {"builds": 0, "patches": 0, "resyncs": 0}
+
+    # --- Open lead index ---
+
+    def _index(self, lead: LeadFeatures):
+        self._leads[lead.id] = lead
+        self._by_area.setdefault(lead.area, set()).add(lead.id)
+        self._by_board.setdefault(lead.board, set()).add(lead.id)
+        for subject in lead.subjects:
+            self._by_subject.setdefault(subject, set()).add(lead.id)
+
+    def _unindex(self, lead_id: int):
+        lead = self._leads.pop(lead_id, None)
+        if lead is None:
+            return
+        self._by_area.get(lead.area, set()).discard(lead_id)
+        self._by_board.get(lead.board, set()).discard(lead_id)
+        for subject in lead.subjects:
+            self._by_subject.get(subject, set()).discard(lead_id)
+
+    async def load(self, db: AsyncSession):
+        """Replace the index with the current VERIFIED_AVAILABLE leads."""
+        rows = (await db.execute(
+            select(
+                StudentRegistration.id,
+                StudentRegistration.area,
+                StudentRegistration.board,
+                StudentRegistration.subjects,
+                StudentRegistration.total_fee,
+                StudentRegistration.created_at,
+            ).where(StudentRegistration.status == LeadStatus.VERIFIED_AVAILABLE)
+        )).all()
+        self._leads, self._by_area, self._by_board, self._by_subject = {}, {}, {}, {}
+        for row in rows:
+            self._index(LeadFeatures.from_row(row))
+        # Other workers may have changed assignments too: start every tutor afresh
+        self._profiles, self._lists, self._listed_in = {}, {}, {}
+        self.stats["resyncs"] += 1
+
+    # --- Incremental updates, called by the handlers after they commit ---
+
+    def lead_available(self, lead):
+        """A lead entered VERIFIED_AVAILABLE: index it and offer it to every cached list."""
+        features = LeadFeatures.from_row(lead)
+        self.lead_taken(features.id)  # Never list the same lead twice
+        self._index(features)
+        now = utcnow()
+        for tutor_id, (built_at, ranked) in self._lists.items():
+            score = make_scorer(self._profiles[tutor_id], now)(features)
+            if len(ranked) < self.candidates or score > ranked[-1][0]:
+                ranked.append((score, features.id))
+                ranked.sort(key=lambda item: item[0], reverse=True)
+                self._listed_in.setdefault(features.id, set()).add(tutor_id)
+                if len(ranked) > self.candidates:
+                    _, dropped = ranked.pop()
+                    self._listed_in.get(dropped, set()).discard(tutor_id)
+                self.stats["patches"] += 1
+
+    def lead_taken(self, lead_id: int):
+        """A lead left VERIFIED_AVAILABLE (accepted or deleted)."""
+        self._unindex(lead_id)
+        for tutor_id in self._listed_in.pop(lead_id, set()):
+            entry = self._lists.get(tutor_id)
+            if entry is None:
+                continue
+            ranked = [item for item in entry[1] if item[1] != lead_id]
+            if len(ranked) < min(self.candidates, len(self._leads)) // 2:
+                # Too depleted to trust: rebuild on next request
+                self._drop_list(tutor_id)
+            else:
+                self._lists[tutor_id] = (entry[0], ranked)
+                self.stats["patches"] += 1
+
+    def tutor_changed(self, tutor_id: int):
+        """The tutor's history or load changed: forget their profile and list."""
+        if tutor_id is None:
+            return
+        self._profiles.pop(tutor_id, None)
+        self._drop_list(tutor_id)
+
+    def _drop_list(self, tutor_id: int):
+        entry = self._lists.pop(tutor_id, None)
+        if entry is not None:
+            for _, lead_id in entry[1]:
+                self._listed_in.get(lead_id, set()).discard(tutor_id)
+
+    # --- Recommendations ---
+
+    def _candidate_ids(self, profile: TutorProfile):
+        if profile.is_new:
+            return self._leads.keys()
+        ids = set()
+        for area in profile.areas:
+            ids |= self._by_area.get(area, set())
+        for board in profile.boards:
+            ids |= self._by_board.get(board, set())
+        for subject in profile.subjects:
+            ids |= self._by_subject.get(subject, set())
+        if len(ids) < self.candidates:
+            # Not enough overlap with past work: fall back to everything open
+            return self._leads.keys()
+        return ids
+
+    def _build(self, tutor_id: int, profile: TutorProfile):
+        score = make_scorer(profile, utcnow())
+        leads = self._leads
+        scored = ((score(leads[lead_id]), lead_id) for lead_id in self._candidate_ids(profile))
+        ranked = heapq.nlargest(self.candidates, scored, key=lambda item: item[0])
+        self._drop_list(tutor_id)
+        self._lists[tutor_id] = (time.monotonic(), ranked)
+        for _, lead_id in ranked:
+            self._listed_in.setdefault(lead_id, set()).add(tutor_id)
+        self.stats["builds"] += 1
+        return ranked
+
+    async def recommend(self, db: AsyncSession, tutor_id: int, limit: int = MATCH_DEFAULT_LIMIT) -> list:
+        """Top leads for a tutor as [(LeadFeatures, score, reasons)], best first."""
+        profile = self._profiles.get(tutor_id)
+        if profile is None:
+            profile = await load_tutor_profile(db, tutor_id)
+            self._profiles[tutor_id] = profile
+
+        entry = self._lists.get(tutor_id)
+        if entry is None or time.monotonic() - entry[0] > MATCH_REBUILD_SECONDS:
+            ranked = self._build(tutor_id, profile)
+        else:
+            ranked = entry[1]
+
+        now = utcnow()
+        results = []
+        for _, lead_id in ranked[:limit]:
+            lead = self._leads.get(lead_id)
+            if lead is None:
+                continue
+            score, reasons = score_lead(profile, lead, now)
+            results.append((lead, score, reasons))
+        return results
+
+    # --- Lifecycle ---
+
+    async def _resync_loop(self):
+        while True:
+            await asyncio.sleep(MATCH_RESYNC_SECONDS)
+            try:
+                async with AsyncSessionLocal() as db:
+                    await self.load(db)
+            except Exception as e:
+                logger.error(f"Matchmaker resync failed: {str(e)}")
+
+    async def start(self):
+        try:
+            async with AsyncSessionLocal() as db:
+                await self.load(db)
+        except Exception as e:
+            logger.error(f"Matchmaker initial load failed: {str(e)}")
+        if self._resync_task is None:
+            self._resync_task = asyncio.create_task(self._resync_loop())
+
+    async def close(self):
+        if self._resync_task is not None:
+            self._resync_task.cancel()
+            self._resync_task = None
+
+    def metrics(self) -> dict:
+        return {
+            "open_leads": len(self._leads),
+            "cached_tutors": len(self._lists),
+            **self.stats,
+        }
+
+
+matchmaker = Matchmaker()
@@ -0,0 +1,155 @@
+import sys
+import os
+
+# Add Tutex/ to sys.path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.schema import CreateIndex
+from backend.models import ADMIN_SORT_INDEXES, Base
+
+# Schema changes for databases created before the change landed in models.py.
+# Every migration is idempotent and recorded in schema_migrations, so running
+# this script repeatedly is safe:  python backend/migrations.py
+#
+# Migrations marked `concurrent` run on an autocommit connection instead of in
+# a transaction, so they can build indexes with CREATE INDEX CONCURRENTLY: a
+# plain CREATE INDEX blocks every write to the table for the whole build,
+# which on a live student_registrations table means minutes of failed signups.
+
+# Hot-query indexes declared on User and StudentRegistration
+HOT_QUERY_INDEXES = (
+    "ix_users_email",
+    "ix_student_registrations_tutor_status",
+    "ix_student_registrations_status_area",
+    "ix_student_registrations_status_board",
+    "ix_student_registrations_status_is_verified",
+    "ix_student_registrations_email_created_at",
+)
+
+
+def find_index(name: str):
+    for table in Base.metadata.tables.values():
+        for index in table.indexes:
+            if index.name == name:
+                return index
+    raise KeyError(name)
+
+
+def create_index_concurrently(conn, index):
+    """
+    CREATE INDEX CONCURRENTLY IF NOT EXISTS on an autocommit connection.
+
+    An interrupted concurrent build leaves an INVALID index behind that IF NOT
+    EXISTS would keep; it is dropped and built again.
+    """
+    valid = conn.execute(text(
+        "SELECT i.indisvalid FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid WHERE c.relname = :name"
+    ), {"name": index.name}).scalar()
+    if valid is False:
+        conn.exec_driver_sql(f'DROP INDEX CONCURRENTLY IF EXISTS "{index.name}"')
+    ddl = str(CreateIndex(index, if_not_exists=True).compile(dialect=conn.dialect))
+    conn.exec_driver_sql(ddl.replace("CREATE INDEX", "CREATE INDEX CONCURRENTLY", 1))
+
+
+def concurrent(migration):
+    migration.concurrent = True
+    return migration
+
+
+def create_lead_subjects(conn):
+    """Create the lead_subjects table and backfill it from the comma-separated subjects column."""
+    Base.metadata.tables["lead_subjects"].create(bind=conn, checkfirst=True)
+    conn.execute(text("""
+        INSERT INTO lead_subjects (lead_id, subject)
+        SELECT DISTINCT sr.id, trim(s.subject)
+        FROM student_registrations sr
+        CROSS JOIN LATERAL unnest(string_to_array(sr.subjects, ',')) AS s(subject)
+        WHERE sr.subjects IS NOT NULL AND trim(s.subject) <> ''
+        ON CONFLICT DO NOTHING
+    """))
+
+
+@concurrent
+def create_hot_query_indexes(conn):
+    """Create the composite indexes declared on User and StudentRegistration."""
+    for name in HOT_QUERY_INDEXES:
+        create_index_concurrently(conn, find_index(name))
+
+
+def create_tutor_monthly_earnings(conn):
+    """Create the tutor_monthly_earnings rollup and fill it from existing matched leads."""
+    Base.metadata.tables["tutor_monthly_earnings"].create(bind=conn, checkfirst=True)
+    # earnings.py uses the flat backend/ imports, like main.py
+    sys.path.append(os.path.abspath(os.path.dirname(__file__)))
+    from earnings import rollup_statements
+    for stmt in rollup_statements():
+        conn.execute(stmt)
+
+
+def create_outbound_emails(conn):
+    """Create the persisted outbound email queue."""
+    Base.metadata.tables["outbound_emails"].create(bind=conn, checkfirst=True)
+
+
+def add_cnic_derivative_columns(conn):
+    """Add the thumbnail/preview path columns; image_worker.py backfills them on startup."""
+    for column in (
+        "cnic_front_thumb_path", "cnic_front_preview_path", "cnic_back_thumb_path", "cnic_back_preview_path"
+    ):
+        conn.execute(text(f"ALTER TABLE users ADD COLUMN IF NOT EXISTS {column} VARCHAR"))
+
+
+def clear_finished_email_bodies(conn):
+    """Let outbound_emails.body be NULL and clear it on rows already sent or failed."""
+    conn.execute(text("ALTER TABLE outbound_emails ALTER COLUMN body DROP NOT NULL"))
+    conn.execute(text("UPDATE outbound_emails SET body = NULL WHERE status IN ('sent', 'failed')"))
+
+
+@concurrent
+def create_admin_sort_indexes(conn):
+    """Create the (sort key, id) indexes behind the admin list endpoints."""
+    for index in ADMIN_SORT_INDEXES:
+        create_index_concurrently(conn, index)
+
+
+MIGRATIONS = [
+    ("0001_create_lead_subjects", create_lead_subjects),
+    ("0002_create_hot_query_indexes", create_hot_query_indexes),
+    ("0003_create_tutor_monthly_earnings", create_tutor_monthly_earnings),
+    ("0004_create_outbound_emails", create_outbound_emails),
+    ("0005_add_cnic_derivative_columns", add_cnic_derivative_columns),
+    ("0006_clear_finished_email_bodies", clear_finished_email_bodies),
+    ("0007_create_admin_sort_indexes", create_admin_sort_indexes),
+]
+
+
+def run_migrations():
+    from backend.database import DATABASE_URL
+
+    engine = create_engine(DATABASE_URL)
+    with engine.begin() as conn:
+        conn.execute(text(
+            "CREATE TABLE IF NOT EXISTS schema_migrations ("
+            "name VARCHAR PRIMARY KEY, applied_at TIMESTAMP DEFAULT now())"
+        ))
+        applied = {row[0] for row in conn.execute(text("SELECT name FROM schema_migrations"))}
+
+    for name, migration in MIGRATIONS:
+        if name in applied:
+            continue
+        concurrent_build = getattr(migration, "concurrent", False)
+        if concurrent_build:
+            # Idempotent, so being interrupted before it is recorded below is harmless
+            with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+                migration(conn)
+        with engine.begin() as conn:
+            if not concurrent_build:
+                migration(conn)
+            conn.execute(text("INSERT INTO schema_migrations (name) VALUES (:name)"), {"name": name})
+        print(f"Applied migration {name}")
+
+
+if __name__ == "__main__":
+    run_migrations()
+    print("Database migrations complete")
@@ -2,21 +2,42 @@
 
 from sqlalchemy import (
     Column,
+    func,
+    literal_column,
     Integer,
     String,
     Boolean,
+    Date,
     DateTime,
     Float,
     Enum,
     ForeignKey,
+    Index,
 )
 from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.types import TypeDecorator
 from datetime import datetime, timezone
 import enum
 
 Base = declarative_base()
 
 
+class UTCDateTime(TypeDecorator):
+    """
+    Naive-UTC DATETIME column that also accepts timezone-aware values.
+
+    Handlers assign datetime.now(timezone.utc); psycopg2 silently dropped the
+    offset, but asyncpg rejects aware values for "timestamp without time zone".
+    """
+    impl = DateTime
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if value is not None and value.tzinfo is not None:
+            value = value.astimezone(timezone.utc).replace(tzinfo=None)
+        return value
+
+
 class TuitionStatus(str, enum.Enum):
     ONGOING = "ongoing"
     COMPLETED = "completed"
@@ -46,10 +67,20 @@ class User(Base):
     register_as_parent = Column(String)
     cnic_front_path = Column(String)
     cnic_back_path = Column(String)
+    # WebP derivatives written by image_worker.py after signup (NULL until then)
+    cnic_front_thumb_path = Column(String, nullable=True)
+    cnic_front_preview_path = Column(String, nullable=True)
+    cnic_back_thumb_path = Column(String, nullable=True)
+    cnic_back_preview_path = Column(String, nullable=True)
     otp = Column(String, nullable=True)
-    otp_created_at = Column(DateTime, nullable=True)
+    otp_created_at = Column(UTCDateTime, nullable=True)
     is_verified = Column(Boolean, default=False)
 
+    __table_args__ = (
+        # Login OTP / password-reset lookups
+        Index("ix_users_email", "email"),
+    )
+
 
 class StudentRegistration(Base):
     __tablename__ = "student_registrations"
@@ -65,8 +96,8 @@ class StudentRegistration(Base):
     total_fee = Column(Float)
     is_verified = Column(Boolean, default=False)
     otp = Column(String, nullable=True)
-    otp_created_at = Column(DateTime, nullable=True)
-    created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+    otp_created_at = Column(UTCDateTime, nullable=True)
+    created_at = Column(UTCDateTime, default=lambda: datetime.now(timezone.utc))
     status = Column(
         Enum(LeadStatus),
         default=LeadStatus.PENDING_ADMIN_VERIFICATION,
@@ -74,7 +105,75 @@ class StudentRegistration(Base):
     )
     accepted_by_tutor_id = Column(Integer, ForeignKey("users.id"), nullable=True)
     tuition_status = Column(String, default=TuitionStatus.ONGOING)
-    end_date = Column(DateTime, nullable=True)
+    end_date = Column(UTCDateTime, nullable=True)
+
+    __table_args__ = (
+        # Tutor dashboard: a tutor's pending / matched leads
+        Index("ix_student_registrations_tutor_status", "accepted_by_tutor_id", "status"),
+        # Available leads filtered by area or board
+        Index("ix_student_registrations_status_area", "status", "area"),
+        Index("ix_student_registrations_status_board", "status", "board"),
+        # Admin panel: verified leads awaiting admin verification
+        Index("ix_student_registrations_status_is_verified", "status", "is_verified"),
+        # Student OTP routes: latest registration for an email
+        Index("ix_student_registrations_email_created_at", "email", "created_at"),
+    )
+
+# Admin list sort keys (see pagination.py). NULLs are coalesced so (key, id)
+# keyset comparisons stay total. The fallbacks are SQL literals rather than bind
+# parameters so the planner matches the queries to the expression indexes below.
+LEAD_SORT_KEYS = {
+    "created_at": func.coalesce(
+        StudentRegistration.created_at, literal_column("'1970-01-01'::timestamp", UTCDateTime)
+    ),
+    "full_name": func.coalesce(StudentRegistration.full_name, literal_column("''", String)),
+    "area": func.coalesce(StudentRegistration.area, literal_column("''", String)),
+    "total_fee": func.coalesce(StudentRegistration.total_fee, literal_column("0.0", Float)),
+    "id": StudentRegistration.id,
+}
+
+TUTOR_SORT_KEYS = {
+    "username": func.coalesce(User.username, literal_column("''", String)),
+    "full_name": func.coalesce(User.full_name, literal_column("''", String)),
+    "id": User.id,
+}
+
+# Only the orders admin.html offers get an index ("id" is served by the primary
+# key). They do not lead with status: the "all" tab and the big matched and
+# available tabs walk them in order and filter; the small unverified and pending
+# tabs are read through the status indexes above and sorted.
+ADMIN_SORT_INDEXES = (
+    Index("ix_student_registrations_created_at_sort", LEAD_SORT_KEYS["created_at"], StudentRegistration.id),
+    Index("ix_student_registrations_full_name_sort", LEAD_SORT_KEYS["full_name"], StudentRegistration.id),
+    Index("ix_student_registrations_area_sort", LEAD_SORT_KEYS["area"], StudentRegistration.id),
+    Index("ix_student_registrations_total_fee_sort", LEAD_SORT_KEYS["total_fee"], StudentRegistration.id),
+    Index("ix_users_username_sort", TUTOR_SORT_KEYS["username"], User.id),
+    Index("ix_users_full_name_sort", TUTOR_SORT_KEYS["full_name"], User.id),
+)
+
+
+class LeadSubject(Base):
+    """One row per (lead, subject); indexed lookup for subject-filtered lead queries."""
+    __tablename__ = "lead_subjects"
+
+    lead_id = Column(
+        Integer,
+        ForeignKey("student_registrations.id", ondelete="CASCADE"),
+        primary_key=True,
+    )
+    subject = Column(String, primary_key=True)
+
+    __table_args__ = (
+        Index("ix_lead_subjects_subject_lead_id", "subject", "lead_id"),
+    )
+
+
+def split_subjects(subjects: str) -> list[str]:
+    """Turn the comma-separated StudentRegistration.subjects string into a clean list."""
+    if not subjects:
+        return []
+    return list(dict.fromkeys(s.strip() for s in subjects.split(",") if s.strip()))
+
 
 class FeeDeduction(Base):
     __tablename__ = "fee_deductions"
@@ -85,4 +184,43 @@ class FeeDeduction(Base):
     deducted_amount = Column(Float, nullable=False)
     final_fee = Column(Float, nullable=False)
     admin_id = Column(Integer, ForeignKey("users.id"), nullable=True)  # Optional: to track which admin made the change
-    created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
\ No newline at end of file
+    created_at = Column(UTCDateTime, default=lambda: datetime.now(timezone.utc))
+
+
+class TutorMonthlyEarning(Base):
+    """Precomputed income per tutor per calendar month (maintained by earnings.py)."""
+    __tablename__ = "tutor_monthly_earnings"
+
+    tutor_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    month = Column(Date, primary_key=True)  # First day of the month
+    income = Column(Float, nullable=False, default=0.0)
+
+
+class EmailStatus(str, enum.Enum):
+    PENDING = "pending"
+    SENDING = "sending"
+    SENT = "sent"
+    FAILED = "failed"
+
+
+class OutboundEmail(Base):
+    """Persisted outbound email queue, drained by the workers in email_queue.py."""
+    __tablename__ = "outbound_emails"
+
+    id = Column(Integer, primary_key=True, index=True)
+    recipient = Column(String, nullable=False)
+    kind = Column(String, nullable=False, default="otp")  # Rapid resends of the same kind are collapsed
+    subject = Column(String, nullable=False)
+    body = Column(String, nullable=True)  # Cleared once sent or failed: OTP bodies hold live codes
+    status = Column(String, nullable=False, default=EmailStatus.PENDING.value)
+    attempts = Column(Integer, nullable=False, default=0)
+    # Due time for pending rows; lease expiry for rows being sent
+    next_attempt_at = Column(UTCDateTime, nullable=False, default=lambda: datetime.now(timezone.utc))
+    last_error = Column(String, nullable=True)
+    created_at = Column(UTCDateTime, default=lambda: datetime.now(timezone.utc))
+    sent_at = Column(UTCDateTime, nullable=True)
+
+    __table_args__ = (
+        Index("ix_outbound_emails_status_next_attempt_at", "status", "next_attempt_at"),
+        Index("ix_outbound_emails_recipient_kind_status", "recipient", "kind", "status"),
+    )
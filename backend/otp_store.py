@@ -0,0 +1,261 @@
+import os
+import time
+import hmac
+import asyncio
+import hashlib
+import logging
+import enum
+from abc import ABC, abstractmethod
+from dotenv import load_dotenv
+
+# Load environment variables from .env file
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# OTP store configuration
+OTP_TTL_SECONDS = int(os.getenv("OTP_TTL_SECONDS", "300"))  # Codes are valid for 5 minutes
+OTP_MAX_ATTEMPTS = int(os.getenv("OTP_MAX_ATTEMPTS", "5"))  # Wrong guesses allowed per email...
+OTP_LOCKOUT_SECONDS = int(os.getenv("OTP_LOCKOUT_SECONDS", "900"))  # ...within this window
+# Leave unset for the in-process store (single worker). Set to a redis:// URL so
+# every worker shares codes and attempt counters.
+OTP_STORE_URL = os.getenv("OTP_STORE_URL")
+# Key for the HMAC codes are stored under. Required with OTP_STORE_URL, since every
+# worker must derive the same digest; a single worker falls back to a random key.
+OTP_HASH_SECRET = os.getenv("OTP_HASH_SECRET")
+# Worker count as uvicorn/gunicorn read it; the in-process store is refused for more than one
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", "1"))
+
+
+class OTPPurpose(str, enum.Enum):
+    TUTOR_SIGNUP = "tutor_signup"
+    STUDENT_REGISTRATION = "student_registration"
+    PASSWORD_RESET = "password_reset"
+
+
+class OTPResult(enum.Enum):
+    VALID = "valid"
+    INVALID = "invalid"
+    EXPIRED = "expired"  # No live code: never issued, already used, or timed out
+    LOCKED = "locked"    # Too many wrong guesses
+
+
+_hash_key = OTP_HASH_SECRET.encode() if OTP_HASH_SECRET else os.urandom(32)
+
+
+def _digest(code: str) -> str:
+    # Keyed, because a bare hash of a 6-digit code is reversed by trying all 10^6 values;
+    # without the key a memory or Redis dump does not reveal live OTPs
+    return hmac.new(_hash_key, code.encode(), hashlib.sha256).hexdigest()
+
+
+class OTPStore(ABC):
+    """Interface shared by the in-memory and Redis OTP stores."""
+
+    @abstractmethod
+    async def issue(self, purpose: OTPPurpose, email: str, code: str, ttl: int = OTP_TTL_SECONDS):
+        """Store a code, replacing any live one for the same purpose and email."""
+
+    @abstractmethod
+    async def verify(self, purpose: OTPPurpose, email: str, code: str) -> OTPResult:
+        """Check a code; a VALID code is consumed, a wrong one counts towards the lockout."""
+
+    @abstractmethod
+    async def discard(self, purpose: OTPPurpose, email: str):
+        """Drop the live code, if any."""
+
+    async def start(self):
+        pass
+
+    async def close(self):
+        pass
+
+
+class HashedTimerWheel:
+    """
+    Hashed timing wheel: O(1) scheduling, one bucket visited per tick.
+
+    Deadlines further out than one revolution carry a "rounds" counter that is
+    decremented each time their bucket comes around.
+    """
+
+    def __init__(self, tick_seconds: float = 1.0, slots: int = 512):
+        self.tick_seconds = tick_seconds
+        self.slots = slots
+        self._buckets = [dict() for _ in range(slots)]
+        self._cursor = 0
+        self._start = time.monotonic()
+
+    def _current_tick(self) -> int:
+        return int((time.monotonic() - self._start) / self.tick_seconds)
+
+    def schedule(self, key, deadline: float):
+        ticks = max(1, int((deadline - time.monotonic()) / self.tick_seconds) + 1)
+        target = self._current_tick() + ticks
+        self._buckets[target % self.slots][key] = (target - self._cursor - 1) // self.slots
+
+    def advance(self):
+        """Process every tick up to now, returning keys whose deadline has passed."""
+        expired = []
+        now_tick = self._current_tick()
+        while self._cursor < now_tick:
+            self._cursor += 1
+            bucket = self._buckets[self._cursor % self.slots]
+            for key, rounds in list(bucket.items()):
+                if rounds <= 0:
+                    del bucket[key]
+                    expired.append(key)
+                else:
+                    bucket[key] = rounds - 1
+        return expired
+
+
+class InMemoryOTPStore(OTPStore):
+    """Per-process TTL map with a timer-wheel sweeper. Suitable for a single worker."""
+
+    def __init__(self, max_attempts: int = OTP_MAX_ATTEMPTS, lockout_seconds: int = OTP_LOCKOUT_SECONDS):
+        self.max_attempts = max_attempts
+        self.lockout_seconds = lockout_seconds
+        self._codes = {}     # (purpose, email) -> (digest, deadline)
+        self._failures = {}  # (purpose, email) -> (count, deadline)
+        self._wheel = HashedTimerWheel()
+        self._sweeper = None
+
+    @staticmethod
+    def _key(purpose: OTPPurpose, email: str):
+        return (OTPPurpose(purpose).value, email.strip().lower())
+
+    def _live(self, table: dict, key):
+        entry = table.get(key)
+        if entry is not None and entry[1] <= time.monotonic():
+            del table[key]
+            return None
+        return entry
+
+    async def issue(self, purpose, email, code, ttl=OTP_TTL_SECONDS):
+        key = self._key(purpose, email)
+        deadline = time.monotonic() + ttl
+        self._codes[key] = (_digest(code), deadline)
+        self._wheel.schedule(("code",) + key, deadline)
+
+    async def verify(self, purpose, email, code):
+        key = self._key(purpose, email)
+        failures = self._live(self._failures, key)
+        if failures is not None and failures[0] >= self.max_attempts:
+            return OTPResult.LOCKED
+
+        entry = self._live(self._codes, key)
+        if entry is None:
+            return OTPResult.EXPIRED
+
+        if hmac.compare_digest(entry[0], _digest(code)):
+            del self._codes[key]
+            self._failures.pop(key, None)
+            return OTPResult.VALID
+
+        count = (failures[0] if failures else 0) + 1
+        deadline = failures[1] if failures else time.monotonic() + self.lockout_seconds
+        self._failures[key] = (count, deadline)
+        self._wheel.schedule(("fail",) + key, deadline)
+        if count >= self.max_attempts:
+            # Burn the code too, so the guesser cannot keep going after the lockout lifts
+            del self._codes[key]
+            return OTPResult.LOCKED
+        return OTPResult.INVALID
+
+    async def discard(self, purpose, email):
+        key = self._key(purpose, email)
+        self._codes.pop(key, None)
+
+    def sweep(self):
+        """Drop entries whose bucket has come due (re-issued entries are kept)."""
+        for kind, *key in self._wheel.advance():
+            key = tuple(key)
+            table = self._codes if kind == "code" else self._failures
+            self._live(table, key)
+
+    async def _sweep_loop(self):
+        while True:
+            await asyncio.sleep(self._wheel.tick_seconds)
+            self.sweep()
+
+    async def start(self):
+        if self._sweeper is None:
+            self._sweeper = asyncio.create_task(self._sweep_loop())
+
+    async def close(self):
+        if self._sweeper is not None:
+            self._sweeper.cancel()
+            self._sweeper = None
+
+
+class RedisOTPStore(OTPStore):
+    """Shared store for multi-worker deployments; expiry is handled by Redis TTLs."""
+
+    def __init__(self, url: str, max_attempts: int = OTP_MAX_ATTEMPTS, lockout_seconds: int = OTP_LOCKOUT_SECONDS):
+        # Imported lazily so the redis package is only needed when OTP_STORE_URL is set
+        import redis.asyncio as redis
+
+        self.max_attempts = max_attempts
+        self.lockout_seconds = lockout_seconds
+        self._redis = redis.from_url(url, decode_responses=True)
+
+    @staticmethod
+    def _keys(purpose: OTPPurpose, email: str):
+        suffix = f"{OTPPurpose(purpose).value}:{email.strip().lower()}"
+        return f"otp:code:{suffix}", f"otp:fail:{suffix}"
+
+    async def issue(self, purpose, email, code, ttl=OTP_TTL_SECONDS):
+        code_key, _ = self._keys(purpose, email)
+        await self._redis.set(code_key, _digest(code), ex=ttl)
+
+    async def verify(self, purpose, email, code):
+        code_key, fail_key = self._keys(purpose, email)
+        # Count the attempt before comparing, in one transaction with reading the
+        # code: parallel guesses each get their own count, so none of them can
+        # pass the limit check on a count the others have not incremented yet
+        async with self._redis.pipeline(transaction=True) as pipe:
+            pipe.incr(fail_key)
+            pipe.expire(fail_key, self.lockout_seconds, nx=True)
+            pipe.get(code_key)
+            attempt, _, digest = await pipe.execute()
+        if attempt > self.max_attempts:
+            return OTPResult.LOCKED
+        if digest is None:
+            return OTPResult.EXPIRED
+
+        if hmac.compare_digest(digest, _digest(code)):
+            # DELETE returns 0 if a concurrent request consumed the code first
+            if await self._redis.delete(code_key):
+                await self._redis.delete(fail_key)
+                return OTPResult.VALID
+            return OTPResult.EXPIRED
+
+        if attempt >= self.max_attempts:
+            # Burn the code too, so the guesser cannot keep going after the lockout lifts
+            await self._redis.delete(code_key)
+            return OTPResult.LOCKED
+        return OTPResult.INVALID
+
+    async def discard(self, purpose, email):
+        code_key, _ = self._keys(purpose, email)
+        await self._redis.delete(code_key)
+
+    async def close(self):
+        await self._redis.aclose()
+
+
+def create_otp_store() -> OTPStore:
+    if OTP_STORE_URL:
+        if not OTP_HASH_SECRET:
+            raise RuntimeError("OTP_STORE_URL needs OTP_HASH_SECRET, shared by every worker")
+        return RedisOTPStore(OTP_STORE_URL)
+    if WEB_CONCURRENCY > 1:
+        # A code issued by one worker would fail verification on every other one
+        raise RuntimeError(
+            f"WEB_CONCURRENCY={WEB_CONCURRENCY} needs a shared OTP store: set OTP_STORE_URL to a redis:// URL"
+        )
+    return InMemoryOTPStore()
+
+
+otp_store = create_otp_store()
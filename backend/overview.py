@@ -0,0 +1,144 @@
+import os
+import time
+import asyncio
+import logging
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database import AsyncSessionLocal
+from models import User, StudentRegistration, LeadStatus, TuitionStatus, FeeDeduction
+from events import event_hub, ADMIN_CHANNEL
+
+logger = logging.getLogger(__name__)
+
+# Admin landing-page overview: every number comes from one aggregate query,
+# and the result is cached per worker for a few seconds so that many open
+# admin tabs do not each hit the database.
+ADMIN_OVERVIEW_TTL = float(os.getenv("ADMIN_OVERVIEW_TTL", "5"))
+# Changes within this window share one pushed overview (see OverviewFeed)
+ADMIN_OVERVIEW_PUSH_DELAY = float(os.getenv("ADMIN_OVERVIEW_PUSH_DELAY", "0.5"))
+
+
+def overview_query(now: datetime):
+    lead = StudentRegistration
+    tuition_status = func.coalesce(lead.tuition_status, TuitionStatus.ONGOING.value)
+    matched = lead.status == LeadStatus.TUTOR_MATCHED
+
+    columns = [
+        func.count(lead.id).label("total_leads"),
+        func.count(lead.id).filter(lead.created_at >= now - timedelta(hours=24)).label("new_24h"),
+        func.count(lead.id).filter(lead.created_at >= now - timedelta(days=7)).label("new_7d"),
+        func.coalesce(func.sum(lead.total_fee).filter(matched), 0.0).label("matched_fee_total"),
+        func.coalesce(
+            func.sum(lead.total_fee).filter(lead.status == LeadStatus.VERIFIED_AVAILABLE), 0.0
+        ).label("available_fee_total"),
+        select(func.coalesce(func.sum(FeeDeduction.deducted_amount), 0.0))
+        .scalar_subquery().label("deducted_fee_total"),
+        select(func.count(User.id)).where(User.user_type == 'Tutor')
+        .scalar_subquery().label("tutors"),
+        select(func.count(User.id)).where(User.user_type == 'Tutor', User.is_verified == True)
+        .scalar_subquery().label("verified_tutors"),
+        # Verified by OTP but not yet reviewed by an admin (the "New Leads" queue)
+        func.count(lead.id).filter(
+            lead.status == LeadStatus.PENDING_ADMIN_VERIFICATION, lead.is_verified == True
+        ).label("awaiting_admin_verification"),
+    ]
+    columns += [
+        func.count(lead.id).filter(lead.status == lead_status).label(f"lead_{lead_status.name}")
+        for lead_status in LeadStatus
+    ]
+    columns += [
+        func.count(lead.id).filter(matched, tuition_status == t.value).label(f"tuition_{t.name}")
+        for t in TuitionStatus
+    ]
+    return select(*columns)
+
+
+async def fetch_admin_overview(db: AsyncSession) -> dict:
+    now = datetime.now(timezone.utc).replace(tzinfo=None)  # created_at is stored as naive UTC
+    row = (await db.execute(overview_query(now))).one()._mapping
+    return {
+        "lead_status": {s.value: row[f"lead_{s.name}"] for s in LeadStatus},
+        "tuition_status": {t.value: row[f"tuition_{t.name}"] for t in TuitionStatus},
+        "new_registrations": {"last_24h": row["new_24h"], "last_7d": row["new_7d"]},
+        "pending_tutor_approvals": row[f"lead_{LeadStatus.PENDING_TUTOR_APPROVAL.name}"],
+        "awaiting_admin_verification": row["awaiting_admin_verification"],
+        "total_leads": row["total_leads"],
+        "tutors": {"total": row["tutors"], "verified": row["verified_tutors"]},
+        "fees": {
+            "matched_total": row["matched_fee_total"],
+            "available_total": row["available_fee_total"],
+            "deducted_total": row["deducted_fee_total"],
+        },
+        "generated_at": datetime.now(timezone.utc).isoformat(),
+    }
+
+
+class OverviewCache:
+    """Per-worker snapshot of the admin overview, refreshed at most every ttl seconds."""
+
+    def __init__(self, ttl: float = ADMIN_OVERVIEW_TTL):
+        self.ttl = ttl
+        self._snapshot = None
+        self._expires_at = 0.0
+        self._lock = asyncio.Lock()
+
+    async def get(self, db: AsyncSession) -> dict:
+        if self._snapshot is not None and time.monotonic() < self._expires_at:
+            return self._snapshot
+        async with self._lock:
+            # Another request may have refreshed it while we waited
+            if self._snapshot is None or time.monotonic() >= self._expires_at:
+                self._snapshot = await fetch_admin_overview(db)
+                self._expires_at = time.monotonic() + self.ttl
+        return self._snapshot
+
+    def invalidate(self):
+        self._expires_at = 0.0
+
+
+class OverviewFeed:
+    """
+    Pushes fresh overview counts to the admin channel after a change.
+
+    A burst of changes is coalesced into one refresh, and the refreshed
+    snapshot is published once for every open admin tab, so the database sees
+    one aggregate query per burst however many tabs are connected (and none
+    when no tab is).
+    """
+
+    def __init__(self, cache: OverviewCache, delay: float = ADMIN_OVERVIEW_PUSH_DELAY):
+        self.cache = cache
+        self.delay = delay
+        self._pending = None
+
+    def changed(self):
+        """Call after committing anything the overview counts."""
+        self.cache.invalidate()
+        if self._pending is None and event_hub.subscriber_count(ADMIN_CHANNEL):
+            self._pending = asyncio.create_task(self._push())
+
+    async def _push(self):
+        try:
+            await asyncio.sleep(self.delay)
+            # Changes from here on schedule another push instead of joining this one
+            self._pending = None
+            async with AsyncSessionLocal() as db:
+                snapshot = await self.cache.get(db)
+            event_hub.publish(ADMIN_CHANNEL, "overview", snapshot)
+        except Exception as e:
+            logger.error(f"Admin overview push failed: {str(e)}")
+        finally:
+            if self._pending is asyncio.current_task():
+                self._pending = None
+
+    async def close(self):
+        if self._pending is not None:
+            self._pending.cancel()
+            self._pending = None
+
+
+admin_overview_cache = OverviewCache()
+overview_feed = OverviewFeed(admin_overview_cache)
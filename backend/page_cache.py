@@ -0,0 +1,198 @@
+import os
+import gzip
+import asyncio
+import hashlib
+import logging
+from collections import OrderedDict
+from urllib.parse import urlsplit
+
+from fastapi import Request
+from fastapi.responses import Response
+from fastapi.templating import Jinja2Templates
+from dotenv import load_dotenv
+
+from assets import asset_manifest, accepts_encoding, ASSET_BUILD_DIR, MANIFEST_NAME
+
+# Load environment variables from .env file
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Rendered-page cache for the public pages (home, courses, ...).
+#
+# Their only per-request input is who is logged in, so a rendered page is
+# kept per (template, variant): one shared entry for all anonymous visitors,
+# and one per logged-in user, because the navbar shows the username. Pages
+# are rendered against PUBLIC_BASE_URL rather than the request's Host header,
+# because url_for() renders absolute links and a shared entry must not carry
+# a host a client made up. Without PUBLIC_BASE_URL pages are still compressed
+# and ETagged, but rendered on every request. Each entry holds the HTML already gzipped (and brotli'd
+# when the optional `brotli` package is installed) plus an ETag, so a hit is a
+# dictionary lookup and a 304 or a byte copy. A watcher clears the cache when
+# a template or the asset manifest changes on disk; a deploy restarts the
+# process and starts empty anyway.
+PAGE_CACHE_SIZE = int(os.getenv("PAGE_CACHE_SIZE", "512"))
+PAGE_CACHE_POLL_SECONDS = float(os.getenv("PAGE_CACHE_POLL_SECONDS", "2"))  # 0 disables the watcher
+PUBLIC_BASE_URL = os.getenv("PUBLIC_BASE_URL")  # e.g. https://www.example.com; scheme and host of the rendered links
+PAGE_GZIP_LEVEL = 6
+PAGE_BROTLI_QUALITY = 6  # Pages are compressed on the request path of a miss; 11 is too slow for that
+
+ANONYMOUS = ("anonymous",)
+
+
+def session_variant(session) -> tuple:
+    """The part of the session a public page depends on."""
+    user = session.get("user")
+    if not user:
+        return ANONYMOUS
+    return (user.get("user_type"), user.get("username"))
+
+
+class CachedPage:
+    __slots__ = ("body", "gzip", "br", "etag")
+
+    def __init__(self, body: bytes):
+        self.body = body
+        self.gzip = gzip.compress(body, compresslevel=PAGE_GZIP_LEVEL, mtime=0)
+        try:
+            # Imported lazily so brotli stays optional
+            import brotli
+            self.br = brotli.compress(body, quality=PAGE_BROTLI_QUALITY)
+        except ImportError:
+            self.br = None
+        # Weak: the same tag covers the identity, gzip and br encodings of the page
+        self.etag = f'W/"{hashlib.sha256(body).hexdigest()[:16]}"'
+
+
+class PageCache:
+    def __init__(self, templates: Jinja2Templates, template_dir: str,
+                 max_entries: int = PAGE_CACHE_SIZE, poll_seconds: float = PAGE_CACHE_POLL_SECONDS,
+                 base_url: str = PUBLIC_BASE_URL):
+        self.templates = templates
+        self.template_dir = template_dir
+        self.max_entries = max_entries
+        self.poll_seconds = poll_seconds
+        self.base_url = urlsplit(base_url) if base_url else None
+        if self.base_url is not None and (self.base_url.scheme not in ("http", "https") or not self.base_url.netloc):
+            raise RuntimeError(f"PUBLIC_BASE_URL must be an http(s)://host URL, got {base_url!r}")
+        if self.base_url is None:
+            logger.info("PUBLIC_BASE_URL is not set; public pages are rendered on every request")
+        self._pages = OrderedDict()
+        self._fingerprint = self._source_fingerprint()
+        self._watcher = None
+        self.stats = {"hits": 0, "misses": 0, "not_modified": 0, "clears": 0}
+
+    def _source_fingerprint(self):
+        """mtimes of every template and of the asset manifest the pages link through."""
+        mtimes = []
+        for directory, _, filenames in os.walk(self.template_dir):
+            for filename in filenames:
+                path = os.path.join(directory, filename)
+                mtimes.append((path, os.stat(path).st_mtime_ns))
+        try:
+            mtimes.append(("manifest", os.stat(os.path.join(ASSET_BUILD_DIR, MANIFEST_NAME)).st_mtime_ns))
+        except FileNotFoundError:
+            pass
+        return tuple(sorted(mtimes))
+
+    def clear(self):
+        self._pages.clear()
+        self.stats["clears"] += 1
+
+    def check_sources(self) -> bool:
+        """Drop every rendered page if a template or the asset build changed."""
+        return self._apply_fingerprint(self._source_fingerprint())
+
+    def _apply_fingerprint(self, fingerprint) -> bool:
+        if fingerprint == self._fingerprint:
+            return False
+        self._fingerprint = fingerprint
+        asset_manifest.load()
+        self.clear()
+        logger.info("Templates or assets changed; page cache cleared")
+        return True
+
+    async def _watch_loop(self):
+        while True:
+            await asyncio.sleep(self.poll_seconds)
+            try:
+                # Stat the files off the event loop; clear the cache on it
+                self._apply_fingerprint(await asyncio.to_thread(self._source_fingerprint))
+            except OSError as e:
+                logger.error(f"Page cache source check failed: {str(e)}")
+
+    async def start(self):
+        if self.poll_seconds > 0 and self._watcher is None:
+            self._watcher = asyncio.create_task(self._watch_loop())
+
+    async def close(self):
+        if self._watcher is not None:
+            self._watcher.cancel()
+            self._watcher = None
+
+    def _canonical_request(self, request: Request) -> Request:
+        """The request as if it had arrived at PUBLIC_BASE_URL, for url_for()."""
+        base = self.base_url
+        scope = dict(request.scope)
+        scope["scheme"] = base.scheme
+        scope["server"] = (base.hostname, base.port or (443 if base.scheme == "https" else 80))
+        scope["headers"] = [(name, value) for name, value in request.scope["headers"] if name != b"host"]
+        scope["headers"].append((b"host", base.netloc.encode("latin-1")))
+        return Request(scope, request.receive)
+
+    def _render(self, request: Request, template_name: str) -> CachedPage:
+        html = self.templates.get_template(template_name).render(
+            {"request": request, "session": request.session}
+        )
+        return CachedPage(html.encode("utf-8"))
+
+    def _get(self, request: Request, template_name: str) -> CachedPage:
+        if self.base_url is None:
+            # The links would come from the client's Host header: never share them
+            self.stats["misses"] += 1
+            return self._render(request, template_name)
+
+        key = (template_name, session_variant(request.session))
+        page = self._pages.get(key)
+        if page is not None:
+            self.stats["hits"] += 1
+            self._pages.move_to_end(key)
+            return page
+        self.stats["misses"] += 1
+        page = self._render(self._canonical_request(request), template_name)
+        self._pages[key] = page
+        if len(self._pages) > self.max_entries:
+            self._pages.popitem(last=False)
+        return page
+
+    def response(self, request: Request, template_name: str) -> Response:
+        """The rendered template for this request's login state, revalidated by ETag."""
+        page = self._get(request, template_name)
+        headers = {
+            "ETag": page.etag,
+            "Vary": "Accept-Encoding, Cookie",
+            # Browsers revalidate every time, which costs a 304 when nothing changed
+            "Cache-Control": "no-cache" if session_variant(request.session) == ANONYMOUS else "private, no-cache",
+        }
+        if_none_match = request.headers.get("if-none-match", "")
+        # Weak comparison, as RFC 9110 requires for If-None-Match
+        if page.etag.removeprefix("W/") in [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]:
+            self.stats["not_modified"] += 1
+            return Response(status_code=304, headers=headers)
+
+        accept_encoding = request.headers.get("accept-encoding", "")
+        if page.br is not None and accepts_encoding(accept_encoding, "br"):
+            body, headers["Content-Encoding"] = page.br, "br"
+        elif accepts_encoding(accept_encoding, "gzip"):
+            body, headers["Content-Encoding"] = page.gzip, "gzip"
+        else:
+            body = page.body
+        return Response(content=body, media_type="text/html; charset=utf-8", headers=headers)
+
+    def metrics(self) -> dict:
+        return {
+            "entries": len(self._pages),
+            "max_entries": self.max_entries,
+            "enabled": self.base_url is not None,
+            **self.stats,
+        }
@@ -0,0 +1,106 @@
+import base64
+import json
+from datetime import datetime
+
+from sqlalchemy import tuple_
+from sqlalchemy.types import TypeDecorator
+
+# Keyset (cursor) pagination helpers for the admin list endpoints.
+#
+# Rows are ordered by (sort expression, id) and the cursor carries the last
+# row's values, so page N costs the same index range scan as page 1 instead of
+# an ever-growing OFFSET.
+
+DEFAULT_PAGE_SIZE = 25
+MAX_PAGE_SIZE = 100
+
+
+class InvalidCursor(ValueError):
+    """Raised when a client sends a cursor we did not produce."""
+
+
+def _encode_value(value):
+    if isinstance(value, datetime):
+        return {"$dt": value.isoformat()}
+    return value
+
+
+def _decode_value(value):
+    if isinstance(value, dict) and "$dt" in value:
+        return datetime.fromisoformat(value["$dt"])
+    return value
+
+
+def encode_cursor(values) -> str:
+    raw = json.dumps([_encode_value(v) for v in values], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> list:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        if not isinstance(values, list) or len(values) != 2:
+            raise InvalidCursor("Malformed cursor")
+        return [_decode_value(v) for v in values]
+    except (ValueError, TypeError) as e:
+        raise InvalidCursor("Malformed cursor") from e
+
+
+def _matches(value, python_type) -> bool:
+    if isinstance(value, bool):
+        return python_type is bool
+    if python_type is float:
+        return isinstance(value, (int, float))
+    return isinstance(value, python_type)
+
+
+def _python_type(sql_type):
+    # TypeDecorator (e.g. UTCDateTime) does not pass python_type through from its impl
+    if isinstance(sql_type, TypeDecorator):
+        sql_type = sql_type.impl_instance
+    return sql_type.python_type
+
+
+def check_cursor_types(values, sort_expr, id_col):
+    """Raise InvalidCursor unless the values fit the sort expression's and id column's types."""
+    for value, expr in zip(values, (sort_expr, id_col)):
+        if not _matches(value, _python_type(expr.type)):
+            raise InvalidCursor("Cursor does not match the sort field")
+
+
+def clamp_limit(limit: int) -> int:
+    return max(1, min(limit or DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE))
+
+
+def keyset_paginate(stmt, sort_expr, id_col, cursor=None, limit=DEFAULT_PAGE_SIZE, descending=True):
+    """
+    Apply keyset ordering, the cursor predicate and LIMIT to a select().
+
+    One extra row is fetched so the caller can tell whether a next page exists.
+    """
+    if cursor:
+        last_sort, last_id = decode_cursor(cursor)
+        # A value of the wrong type would only fail inside the query
+        check_cursor_types((last_sort, last_id), sort_expr, id_col)
+        key = tuple_(sort_expr, id_col)
+        stmt = stmt.where(key < tuple_(last_sort, last_id) if descending else key > tuple_(last_sort, last_id))
+
+    if descending:
+        stmt = stmt.order_by(sort_expr.desc(), id_col.desc())
+    else:
+        stmt = stmt.order_by(sort_expr.asc(), id_col.asc())
+    return stmt.limit(limit + 1)
+
+
+def page_from_rows(rows, limit, cursor_values):
+    """
+    Split the limit+1 rows from keyset_paginate into (page_rows, next_cursor).
+
+    cursor_values(row) must return (sort value, id) for a row.
+    """
+    rows = list(rows)
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    next_cursor = encode_cursor(cursor_values(rows[-1])) if has_more and rows else None
+    return rows, next_cursor
@@ -0,0 +1,89 @@
+import os
+import time
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from passlib.context import CryptContext
+from dotenv import load_dotenv
+
+# Load environment variables from .env file
+load_dotenv()
+
+# Hashing executor configuration
+# bcrypt releases the GIL while hashing, so a thread pool gives real parallelism.
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", "4"))
+# Maximum number of hash/verify calls allowed to wait for a worker before new ones are refused
+PASSWORD_HASH_MAX_QUEUE = int(os.getenv("PASSWORD_HASH_MAX_QUEUE", "64"))
+
+# Configure password hashing
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+
+class PasswordServiceBusy(Exception):
+    """Raised when too many hash/verify calls are already queued."""
+
+
+class PasswordService:
+    """Runs bcrypt hashing and verification on a bounded thread pool."""
+
+    def __init__(self, workers: int = PASSWORD_HASH_WORKERS, max_queue: int = PASSWORD_HASH_MAX_QUEUE):
+        self.workers = workers
+        self.max_queue = max_queue
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="pwd-hash")
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._calls = 0
+        self._rejected = 0
+        self._total_seconds = 0.0
+        self._max_seconds = 0.0
+
+    @property
+    def queue_depth(self) -> int:
+        """Number of calls waiting for a free worker."""
+        return max(self._in_flight - self.workers, 0)
+
+    async def _run(self, func, *args):
+        with self._lock:
+            if self._in_flight - self.workers >= self.max_queue:
+                self._rejected += 1
+                raise PasswordServiceBusy("Password hashing queue is full")
+            self._in_flight += 1
+
+        start = time.perf_counter()
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, func, *args)
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self._in_flight -= 1
+                self._calls += 1
+                self._total_seconds += elapsed
+                self._max_seconds = max(self._max_seconds, elapsed)
+
+    async def hash(self, password: str) -> str:
+        return await self._run(pwd_context.hash, password)
+
+    async def verify(self, password: str, hashed_password: str) -> bool:
+        return await self._run(pwd_context.verify, password, hashed_password)
+
+    def metrics(self) -> dict:
+        """Snapshot of queue depth and per-call latency."""
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "max_queue": self.max_queue,
+                "in_flight": self._in_flight,
+                "queue_depth": max(self._in_flight - self.workers, 0),
+                "calls": self._calls,
+                "rejected": self._rejected,
+                "avg_latency_ms": (self._total_seconds / self._calls * 1000) if self._calls else 0.0,
+                "max_latency_ms": self._max_seconds * 1000,
+            }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
+
+
+password_service = PasswordService()
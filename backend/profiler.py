@@ -0,0 +1,352 @@
+import os
+import sys
+import json
+import time
+import uuid
+import asyncio
+import threading
+from collections import deque
+from datetime import datetime, timezone
+from urllib.parse import parse_qs
+
+from dotenv import load_dotenv
+
+# Load environment variables from .env file
+load_dotenv()
+
+# On-demand request profiler for admins (opt-in: PROFILER_ENABLED=true).
+#
+# An admin adds ?profile=<mode> (or an "X-Profile: <mode>" header) to any
+# page or form post, e.g. /tutor_dashboard?profile=speedscope. The request
+# then runs while a thread samples the event loop's stack every
+# PROFILE_INTERVAL_MS, and each sample is attributed to the request's task:
+# its Python stack while it runs, "(waiting)" while it awaits the database,
+# SMTP or a thread pool, "(other tasks)" while the loop serves someone else.
+# That gives a wall-clock profile of one request on a busy worker without
+# slowing down the others. Modes:
+#
+#   speedscope  the response is the profile, as speedscope.app JSON
+#   collapsed   the response is the profile as folded stacks (flamegraph.pl, inferno)
+#   store       the normal response, with an X-Profile-Id header
+#
+# Pages an admin cannot open as themselves (a tutor's dashboard, the OTP
+# steps of a signup) are profiled by arming instead: an admin arms the next
+# few requests to a path, optionally only from one username, and those run
+# in store mode for whoever makes them.
+#
+# Sampling is capped at PROFILE_MAX_SECONDS: a longer speedscope or collapsed
+# request is cancelled there and answered with what was sampled, a longer
+# store request finishes unprofiled. Event streams are never profiled (they
+# only end when the client leaves); they get an "X-Profile: refused" header.
+#
+# Every profile is also kept in a bounded list, downloadable from
+# /api/admin/profiles. Without PROFILER_ENABLED the middleware is not
+# installed at all; with it, requests without the flag pay only a scan of
+# their query string and headers.
+PROFILER_ENABLED = os.getenv("PROFILER_ENABLED", "false").lower() == "true"
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "1"))
+PROFILE_KEEP = int(os.getenv("PROFILE_KEEP", "20"))
+PROFILE_MAX_SECONDS = 30  # Sampling stops here; speedscope/collapsed requests are ended
+PROFILE_MAX_DEPTH = 256
+PROFILE_ARM_SECONDS = 600  # Unused arms expire after this
+
+PROFILE_MODES = ("speedscope", "collapsed", "store")
+WAITING = ("(waiting)", "", 0)
+OTHER_TASKS = ("(other tasks)", "", 0)
+
+
+def _frame_key(frame) -> tuple:
+    code = frame.f_code
+    return (getattr(code, "co_qualname", code.co_name), code.co_filename, code.co_firstlineno)
+
+
+class Sampler(threading.Thread):
+    """Samples the calling thread's Python stack, labelled by whether `task` was the one running."""
+
+    def __init__(self, loop, task, interval: float):
+        super().__init__(name="request-profiler", daemon=True)
+        self.loop = loop
+        self.task = task
+        self.interval = interval
+        self.thread_id = threading.get_ident()
+        self.frames = {}    # (name, file, line) -> index
+        self.samples = []   # Stacks as frame indexes, root first
+        self.weights = []   # Milliseconds each sample stands for
+        self._stop_event = threading.Event()
+
+    def _index(self, key: tuple) -> int:
+        index = self.frames.get(key)
+        if index is None:
+            index = self.frames[key] = len(self.frames)
+        return index
+
+    def _stack(self) -> list:
+        current = asyncio.current_task(self.loop)
+        if current is None:
+            return [self._index(WAITING)]
+        if current is not self.task:
+            return [self._index(OTHER_TASKS)]
+        frame = sys._current_frames().get(self.thread_id)
+        stack = []
+        while frame is not None and len(stack) < PROFILE_MAX_DEPTH:
+            stack.append(self._index(_frame_key(frame)))
+            frame = frame.f_back
+        stack.reverse()
+        return stack
+
+    def run(self):
+        deadline = time.perf_counter() + PROFILE_MAX_SECONDS
+        last = time.perf_counter()
+        while not self._stop_event.wait(self.interval):
+            now = time.perf_counter()
+            stack = self._stack()
+            if self._stop_event.is_set():
+                # Taken while the request was already over, in stop()
+                return
+            self.samples.append(stack)
+            self.weights.append((now - last) * 1000)
+            last = now
+            if now > deadline:
+                return
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+
+class Profile:
+    def __init__(self, profile_id: str, method: str, path: str, sampler: Sampler, duration_ms: float):
+        self.id = profile_id
+        self.at = datetime.now(timezone.utc).isoformat()
+        self.method = method
+        self.path = path
+        self.duration_ms = duration_ms
+        self.frames = list(sampler.frames)  # Insertion order is index order
+        self.samples = sampler.samples
+        self.weights = sampler.weights
+
+    def summary(self) -> dict:
+        return {
+            "id": self.id,
+            "at": self.at,
+            "method": self.method,
+            "path": self.path,
+            "duration_ms": round(self.duration_ms, 1),
+            "samples": len(self.samples),
+        }
+
+    def speedscope(self) -> bytes:
+        """https://www.speedscope.app/file-format-schema.json, one sampled profile."""
+        return json.dumps({
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": f"{self.method} {self.path}",
+            "exporter": "tutex request profiler",
+            "shared": {"frames": [{"name": name, "file": file, "line": line} for name, file, line in self.frames]},
+            "profiles": [{
+                "type": "sampled",
+                "name": f"{self.method} {self.path} ({self.duration_ms:.0f} ms)",
+                "unit": "milliseconds",
+                "startValue": 0,
+                "endValue": sum(self.weights),
+                "samples": self.samples,
+                "weights": self.weights,
+            }],
+        }).encode()
+
+    def collapsed(self) -> bytes:
+        """Folded stacks, 'root;caller;callee <microseconds>' per line."""
+        totals = {}
+        for stack, weight in zip(self.samples, self.weights):
+            key = ";".join(self.frames[i][0] for i in stack)
+            totals[key] = totals.get(key, 0) + weight
+        return "".join(f"{stack} {round(weight * 1000)}\n" for stack, weight in totals.items()).encode()
+
+    def export(self, mode: str) -> tuple:
+        """(body, media type, download file name) for speedscope or collapsed."""
+        if mode == "collapsed":
+            return self.collapsed(), "text/plain; charset=utf-8", f"profile-{self.id}.folded"
+        return self.speedscope(), "application/json", f"profile-{self.id}.speedscope.json"
+
+
+class ProfileStore:
+    def __init__(self, keep: int = PROFILE_KEEP):
+        self.profiles = deque(maxlen=keep)
+        self.busy = False  # One profile at a time: the sampler attributes by task, not by request
+        self.armed = []
+
+    def arm(self, path: str, username: str = None, count: int = 1) -> dict:
+        """Profile the next `count` requests to `path` (from `username` only, if given)."""
+        arm = {"path": path, "username": username, "remaining": count,
+               "expires": time.monotonic() + PROFILE_ARM_SECONDS}
+        self.armed.append(arm)
+        return arm
+
+    def take_armed(self, path: str, username: str) -> bool:
+        """Use up one matching arm; False if none matches."""
+        now = time.monotonic()
+        self.armed = [arm for arm in self.armed if arm["expires"] > now]
+        for arm in self.armed:
+            if arm["path"] == path and arm["username"] in (None, username):
+                arm["remaining"] -= 1
+                if arm["remaining"] <= 0:
+                    self.armed.remove(arm)
+                return True
+        return False
+
+    def list_armed(self) -> list:
+        now = time.monotonic()
+        return [
+            {"path": arm["path"], "username": arm["username"], "remaining": arm["remaining"],
+             "expires_in_seconds": round(arm["expires"] - now)}
+            for arm in self.armed if arm["expires"] > now
+        ]
+
+    def add(self, profile: Profile):
+        self.profiles.append(profile)
+
+    def get(self, profile_id: str):
+        return next((p for p in self.profiles if p.id == profile_id), None)
+
+    def list(self) -> list:
+        return [p.summary() for p in reversed(self.profiles)]
+
+
+def requested_mode(scope):
+    """The profile mode asked for by ?profile= or X-Profile, or None."""
+    mode = None
+    if b"profile=" in scope.get("query_string", b""):
+        mode = parse_qs(scope["query_string"].decode("latin-1")).get("profile", [None])[0]
+    if mode is None:
+        for name, value in scope["headers"]:
+            if name == b"x-profile":
+                mode = value.decode("latin-1")
+                break
+    if mode is None:
+        return None
+    return mode if mode in PROFILE_MODES else "store"
+
+
+class ProfilerMiddleware:
+    """
+    ASGI middleware profiling flagged requests from admin sessions. Must run
+    inside SessionMiddleware (added before it) to see the session.
+    """
+
+    def __init__(self, app, store=None, interval_ms: float = PROFILE_INTERVAL_MS):
+        self.app = app
+        self.store = store or profile_store
+        self.interval = interval_ms / 1000
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        user = scope.get("session", {}).get("user") or {}
+        mode = requested_mode(scope) if user.get("user_type") == "admin" else None
+        if mode is not None and self.store.busy:
+            await self.app(scope, receive, _add_header(send, b"x-profile", b"busy"))
+            return
+        if mode is None:
+            if not self.store.armed or self.store.busy or not self.store.take_armed(scope["path"], user.get("username")):
+                await self.app(scope, receive, send)
+                return
+            mode = "store"
+
+        self.store.busy = True
+        profile_id = uuid.uuid4().hex[:12]
+        loop = asyncio.get_running_loop()
+        task = asyncio.current_task()
+        sampler = Sampler(loop, task, self.interval)
+        started = time.perf_counter()
+        profile = None
+        profiling = True
+        refused = False
+        timed_out = False
+
+        def finish(keep: bool = True):
+            # Runs once: at the end of the request, at the deadline, or on an event stream
+            nonlocal profile, profiling
+            if not profiling:
+                return
+            profiling = False
+            sampler.stop()
+            self.store.busy = False
+            if keep:
+                duration_ms = (time.perf_counter() - started) * 1000
+                profile = Profile(profile_id, scope["method"], scope["path"], sampler, duration_ms)
+                self.store.add(profile)
+
+        def deadline():
+            nonlocal timed_out
+            if not profiling:
+                return
+            if mode == "store":
+                # The client still gets the rest of the response, just unprofiled
+                finish()
+            else:
+                # Nobody sees this response, only the profile that replaces it
+                timed_out = True
+                task.cancel()
+
+        async def inner_send(message):
+            nonlocal refused
+            if message["type"] == "http.response.start" and _is_event_stream(message) and profiling:
+                # An event stream only ends when the client leaves, holding the
+                # profiler busy all along: send it unprofiled
+                finish(keep=False)
+                refused = True
+                message = {**message, "headers": [*message.get("headers", []), (b"x-profile", b"refused")]}
+            elif message["type"] == "http.response.start" and mode == "store":
+                # The id goes out with the response headers, before the profile exists
+                message = {**message, "headers": [*message.get("headers", []), (b"x-profile-id", profile_id.encode())]}
+            elif not refused and mode != "store":
+                # The profile replaces the response, so the page itself is dropped
+                return
+            await send(message)
+
+        timer = loop.call_later(PROFILE_MAX_SECONDS, deadline)
+        sampler.start()
+        try:
+            await self.app(scope, receive, inner_send)
+        except asyncio.CancelledError:
+            if not timed_out:
+                raise
+            if hasattr(task, "uncancel"):
+                task.uncancel()
+        finally:
+            timer.cancel()
+            finish()
+        if mode == "store" or refused:
+            return
+
+        body, media_type, filename = profile.export(mode)
+        await send({
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [
+                (b"content-type", media_type.encode()),
+                (b"content-length", str(len(body)).encode()),
+                (b"content-disposition", f'attachment; filename="{filename}"'.encode()),
+                (b"cache-control", b"no-store"),
+                (b"x-profile-id", profile.id.encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
+
+
+def _is_event_stream(message) -> bool:
+    return any(
+        name == b"content-type" and value.split(b";")[0].strip().lower() == b"text/event-stream"
+        for name, value in message.get("headers", [])
+    )
+
+
+def _add_header(send, name: bytes, value: bytes):
+    async def send_wrapper(message):
+        if message["type"] == "http.response.start":
+            message = {**message, "headers": [*message.get("headers", []), (name, value)]}
+        await send(message)
+    return send_wrapper
+
+
+profile_store = ProfileStore()
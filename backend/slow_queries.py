@@ -0,0 +1,184 @@
+import os
+import re
+import time
+import random
+import logging
+import threading
+from collections import deque
+from datetime import datetime, timezone
+
+from sqlalchemy import event
+from dotenv import load_dotenv
+
+from instrumentation import current_route
+
+# Load environment variables from .env file
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Slow-query recorder (opt-in: set SLOW_QUERY_MS).
+#
+# Every statement slower than SLOW_QUERY_MS is logged with its normalized SQL,
+# the types (never the values) of its bind parameters, the route it ran for
+# and its duration, and kept in a ring buffer for /api/admin/slow_queries.
+# A sample of slow SELECTs (SLOW_QUERY_EXPLAIN_RATE) is re-run right away as
+# EXPLAIN (ANALYZE, BUFFERS) on the same connection, inside a savepoint, so
+# the plan sees the same transaction and a failing EXPLAIN cannot abort it.
+# ANALYZE executes the query a second time, which is why only plain SELECTs
+# are explained and each distinct statement at most once per
+# SLOW_QUERY_EXPLAIN_INTERVAL seconds.
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "0"))  # 0 disables the recorder
+SLOW_QUERY_EXPLAIN_RATE = float(os.getenv("SLOW_QUERY_EXPLAIN_RATE", "0"))  # Fraction of slow SELECTs to explain
+SLOW_QUERY_EXPLAIN_INTERVAL = float(os.getenv("SLOW_QUERY_EXPLAIN_INTERVAL", "60"))
+SLOW_QUERY_BUFFER = int(os.getenv("SLOW_QUERY_BUFFER", "100"))
+SLOW_QUERY_MAX_STATEMENTS = 500  # Distinct statements tracked in the per-statement totals
+
+_WHITESPACE = re.compile(r"\s+")
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r"(?<![\w$])-?\d+(?:\.\d+)?\b")
+# Expanded IN lists: (%(id_1_1)s, %(id_1_2)s, ...) or ($3, $4, ...)
+_PLACEHOLDER_LIST = re.compile(r"\((?:\s*(?:%\(\w+\)s|%s|\$\d+|\?)\s*,)+\s*(?:%\(\w+\)s|%s|\$\d+|\?)\s*\)")
+_EXPLAINABLE = re.compile(r"^\s*SELECT\b", re.IGNORECASE)
+_LOCKING = re.compile(r"\bFOR\s+(?:UPDATE|SHARE|NO\s+KEY\s+UPDATE|KEY\s+SHARE)\b", re.IGNORECASE)
+
+
+def normalize_sql(statement: str) -> str:
+    """One line, literals replaced by ?, and IN lists of any length folded to (...)."""
+    statement = _STRING_LITERAL.sub("?", statement)
+    statement = _NUMBER_LITERAL.sub("?", statement)
+    statement = _PLACEHOLDER_LIST.sub("(...)", statement)
+    return _WHITESPACE.sub(" ", statement).strip()
+
+
+def bind_shape(parameters) -> str:
+    """Types of the bind parameters, e.g. 'id_1: int, username_1: str' or '$n: int x 40'."""
+    if isinstance(parameters, dict):
+        return ", ".join(f"{name}: {type(value).__name__}" for name, value in parameters.items())
+    if isinstance(parameters, (list, tuple)):
+        types = [type(value).__name__ for value in parameters]
+        if len(types) > 10 and len(set(types)) == 1:
+            return f"$n: {types[0]} x {len(types)}"
+        return ", ".join(f"${i}: {name}" for i, name in enumerate(types, 1))
+    return ""
+
+
+def _explain(dbapi_connection, statement: str, parameters) -> str:
+    """EXPLAIN (ANALYZE, BUFFERS) a statement inside a savepoint of the current transaction."""
+    cursor = dbapi_connection.cursor()
+    try:
+        cursor.execute("SAVEPOINT slow_query_explain")
+        try:
+            cursor.execute(f"EXPLAIN (ANALYZE, BUFFERS) {statement}", parameters)
+            plan = "\n".join(row[0] for row in cursor.fetchall())
+        except Exception:
+            cursor.execute("ROLLBACK TO SAVEPOINT slow_query_explain")
+            raise
+        cursor.execute("RELEASE SAVEPOINT slow_query_explain")
+        return plan
+    finally:
+        cursor.close()
+
+
+class SlowQueryLog:
+    def __init__(self, threshold_ms: float = SLOW_QUERY_MS, explain_rate: float = SLOW_QUERY_EXPLAIN_RATE,
+                 explain_interval: float = SLOW_QUERY_EXPLAIN_INTERVAL, buffer_size: int = SLOW_QUERY_BUFFER):
+        self.threshold_ms = threshold_ms
+        self.explain_rate = explain_rate
+        self.explain_interval = explain_interval
+        self._lock = threading.Lock()  # The sync engine records from thread-pool threads
+        self.recent = deque(maxlen=buffer_size)
+        self.statements = {}  # normalized SQL -> {"count", "total_ms", "max_ms", "last_route"}
+        self._last_explained = {}  # normalized SQL -> monotonic time of its last EXPLAIN
+        self.stats = {"slow": 0, "explained": 0, "explain_failed": 0}
+
+    @property
+    def enabled(self) -> bool:
+        return self.threshold_ms > 0
+
+    def install(self, engine):
+        """Listen on a (sync) Engine; pass async_engine.sync_engine for the async one. No-op when disabled."""
+        if not self.enabled:
+            return
+
+        @event.listens_for(engine, "before_cursor_execute")
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            if context is not None:
+                context._slow_query_started = time.perf_counter()
+
+        @event.listens_for(engine, "after_cursor_execute")
+        def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            started = getattr(context, "_slow_query_started", None)
+            if started is None:
+                return
+            duration_ms = (time.perf_counter() - started) * 1000
+            if duration_ms >= self.threshold_ms:
+                self.record(conn, statement, parameters, executemany, duration_ms)
+
+    def _should_explain(self, sql: str, statement: str, executemany: bool) -> bool:
+        if executemany or self.explain_rate <= 0 or random.random() >= self.explain_rate:
+            return False
+        if not _EXPLAINABLE.match(statement) or _LOCKING.search(statement):
+            return False
+        now = time.monotonic()
+        with self._lock:
+            if now - self._last_explained.get(sql, float("-inf")) < self.explain_interval:
+                return False
+            self._last_explained[sql] = now
+        return True
+
+    def record(self, conn, statement: str, parameters, executemany: bool, duration_ms: float):
+        sql = normalize_sql(statement)
+        route = current_route()
+        binds = "executemany" if executemany else bind_shape(parameters)
+        logger.warning(f"Slow query ({duration_ms:.0f} ms) on {route}: {sql} [{binds}]")
+
+        plan = None
+        if self._should_explain(sql, statement, executemany):
+            try:
+                plan = _explain(conn.connection.dbapi_connection, statement, parameters)
+                self.stats["explained"] += 1
+            except Exception as e:
+                self.stats["explain_failed"] += 1
+                logger.error(f"EXPLAIN of slow query failed: {str(e)}")
+
+        with self._lock:
+            self.stats["slow"] += 1
+            self.recent.append({
+                "at": datetime.now(timezone.utc).isoformat(),
+                "route": route,
+                "duration_ms": round(duration_ms, 1),
+                "sql": sql,
+                "binds": binds,
+                "plan": plan,
+            })
+            totals = self.statements.get(sql)
+            if totals is None:
+                if len(self.statements) >= SLOW_QUERY_MAX_STATEMENTS:
+                    return
+                totals = self.statements[sql] = {"count": 0, "total_ms": 0.0, "max_ms": 0.0, "last_route": route}
+            totals["count"] += 1
+            totals["total_ms"] += duration_ms
+            totals["max_ms"] = max(totals["max_ms"], duration_ms)
+            totals["last_route"] = route
+
+    def snapshot(self, limit: int = SLOW_QUERY_BUFFER) -> dict:
+        """Newest slow queries first, plus per-statement totals ordered by total time."""
+        with self._lock:
+            recent = list(self.recent)[::-1][:limit]
+            statements = sorted(
+                ({"sql": sql, **totals, "total_ms": round(totals["total_ms"], 1), "max_ms": round(totals["max_ms"], 1)}
+                 for sql, totals in self.statements.items()),
+                key=lambda s: s["total_ms"], reverse=True,
+            )[:limit]
+        return {
+            "enabled": self.enabled,
+            "threshold_ms": self.threshold_ms,
+            "explain_rate": self.explain_rate,
+            **self.stats,
+            "recent": recent,
+            "statements": statements,
+        }
+
+
+slow_query_log = SlowQueryLog()
@@ -0,0 +1,114 @@
+import os
+import time
+import logging
+
+from jinja2 import Environment, FileSystemBytecodeCache, TemplateError
+from dotenv import load_dotenv
+
+# Load environment variables from .env file
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Template compilation at startup instead of on the first request.
+#
+# Jinja compiles a template to Python bytecode the first time it is used,
+# which for the large pages (home, admin, student, login) costs tens of
+# milliseconds each, paid by the first visitors after every deploy or new
+# worker. The bytecode is cached in TEMPLATE_CACHE_DIR, shared by all workers
+# on the host: Jinja writes each entry atomically and checks it against the
+# template source, so a stale entry is simply recompiled. At startup every
+# template is loaded once, so a worker only starts accepting requests with its
+# templates compiled, from the cache when another worker already did the work.
+_FRONTEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "frontend")
+TEMPLATE_CACHE_DIR = os.getenv("TEMPLATE_CACHE_DIR", os.path.join(_FRONTEND_DIR, ".template_cache"))
+
+# Set when the worker imports this module, i.e. close to process start
+_IMPORTED_AT = time.perf_counter()
+
+
+class CountingBytecodeCache(FileSystemBytecodeCache):
+    """FileSystemBytecodeCache that counts loads from disk and fresh compiles."""
+
+    def __init__(self, directory: str):
+        super().__init__(directory, "%s.jinja.cache")
+        self.stats = {"loaded": 0, "compiled": 0}
+
+    def load_bytecode(self, bucket):
+        super().load_bytecode(bucket)
+        if bucket.code is not None:
+            self.stats["loaded"] += 1
+
+    def dump_bytecode(self, bucket):
+        self.stats["compiled"] += 1
+        super().dump_bytecode(bucket)
+
+
+def enable_bytecode_cache(env: Environment, directory: str = TEMPLATE_CACHE_DIR):
+    """Store compiled templates in `directory`; without a writable directory templates compile in memory as before."""
+    try:
+        os.makedirs(directory, exist_ok=True)
+    except OSError as e:
+        logger.warning(f"Template bytecode cache disabled, cannot create {directory}: {str(e)}")
+        return
+    env.bytecode_cache = CountingBytecodeCache(directory)
+
+
+class StartupTimer:
+    """Seconds from worker start to templates compiled, ready, and first response sent."""
+
+    def __init__(self):
+        self.marks = {}
+        self.templates = {"loaded": 0, "failed": []}
+
+    def mark(self, name: str):
+        if name not in self.marks:
+            self.marks[name] = time.perf_counter() - _IMPORTED_AT
+
+    def precompile(self, env: Environment):
+        """Load every template so its bytecode is compiled (or read from the cache) now."""
+        started = time.perf_counter()
+        for name in env.list_templates():
+            try:
+                env.get_template(name)
+                self.templates["loaded"] += 1
+            except TemplateError as e:
+                # A broken template fails its own pages at request time; it must not stop the worker
+                self.templates["failed"].append(name)
+                logger.error(f"Template {name} failed to compile: {str(e)}")
+        self.templates["seconds"] = time.perf_counter() - started
+        self.mark("templates_compiled")
+        logger.info(
+            f"Compiled {self.templates['loaded']} templates in {self.templates['seconds'] * 1000:.0f} ms"
+        )
+
+    def metrics(self, env: Environment) -> dict:
+        cache = env.bytecode_cache
+        return {
+            "seconds_since_import": self.marks,
+            "templates": self.templates,
+            "bytecode_cache": cache.stats if isinstance(cache, CountingBytecodeCache) else None,
+        }
+
+
+class FirstResponseTimer:
+    """ASGI middleware that records when the worker finishes its first HTTP response."""
+
+    def __init__(self, app, timer: StartupTimer):
+        self.app = app
+        self.timer = timer
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or "first_response" in self.timer.marks:
+            await self.app(scope, receive, send)
+            return
+
+        async def send_wrapper(message):
+            await send(message)
+            if message["type"] == "http.response.body" and not message.get("more_body", False):
+                self.timer.mark("first_response")
+
+        await self.app(scope, receive, send_wrapper)
+
+
+startup_timer = StartupTimer()
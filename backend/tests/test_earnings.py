@@ -0,0 +1,108 @@
+from datetime import datetime, timezone
+
+import pytest
+from sqlalchemy import func, select
+from sqlalchemy.orm import sessionmaker
+
+from models import User, StudentRegistration, LeadStatus, TutorMonthlyEarning
+from earnings import compute_monthly_income, monthly_income_query, parity_mismatches, rollup_statements
+
+# (tutor, created_at, end_date, total_fee, status); end_date None = ongoing
+FIXTURE_LEADS = (
+    ("month_end", datetime(2024, 1, 31, 10, 0), None, 8000, LeadStatus.TUTOR_MATCHED),
+    ("month_end", datetime(2024, 2, 29, 12, 0), datetime(2024, 2, 29, 18, 0), 1234.5, LeadStatus.TUTOR_MATCHED),
+    ("rollover", datetime(2023, 11, 15, 9, 0), datetime(2024, 2, 10, 9, 0), 6000, LeadStatus.TUTOR_MATCHED),
+    ("rollover", datetime(2023, 12, 31, 23, 59), datetime(2024, 1, 1, 0, 0), 5000, LeadStatus.TUTOR_MATCHED),
+    # Ends on the 1st before the creation time of day: that last month is not counted
+    ("time_of_day", datetime(2024, 3, 20, 23, 30), datetime(2024, 5, 1, 0, 0), 7000, LeadStatus.TUTOR_MATCHED),
+    ("time_of_day", datetime(2024, 3, 1, 0, 0), datetime(2024, 5, 1, 0, 0), 3000, LeadStatus.TUTOR_MATCHED),
+    # Bad data and leads that must not count
+    ("excluded", datetime(2024, 6, 10), datetime(2024, 5, 1), 4000, LeadStatus.TUTOR_MATCHED),
+    ("excluded", datetime(2024, 6, 10), None, None, LeadStatus.TUTOR_MATCHED),
+    ("excluded", datetime(2024, 6, 10), None, 0, LeadStatus.TUTOR_MATCHED),
+    ("excluded", datetime(2024, 6, 10), None, 9000, LeadStatus.PENDING_TUTOR_APPROVAL),
+)
+
+# Income for the fixture leads that have ended (ongoing ones grow every month)
+EXPECTED_INCOME = {
+    "rollover": {"2023-11": 6000, "2023-12": 11000, "2024-01": 6000, "2024-02": 6000},
+    "time_of_day": {"2024-03": 10000, "2024-04": 10000, "2024-05": 3000},
+}
+
+
+@pytest.fixture
+def db(sync_engine):
+    session = sessionmaker(bind=sync_engine, autoflush=False)()
+    yield session
+    session.close()
+
+
+@pytest.fixture
+def tutor_ids(db) -> dict:
+    tutors = {name: User(username=f"parity_{name}", user_type="Tutor", is_verified=True)
+              for name in dict.fromkeys(lead[0] for lead in FIXTURE_LEADS)}
+    db.add_all(tutors.values())
+    db.flush()
+    for name, created_at, end_date, total_fee, lead_status in FIXTURE_LEADS:
+        db.add(StudentRegistration(
+            full_name=f"Parity {name}", email=f"{name}@example.com", area="DHA", board="ACCA",
+            subjects="Mathematics", total_fee=total_fee, is_verified=True, status=lead_status,
+            accepted_by_tutor_id=tutors[name].id, created_at=created_at, end_date=end_date,
+        ))
+    db.commit()
+    return {name: tutor.id for name, tutor in tutors.items()}
+
+
+def sql_income(db, tutor_id: int) -> dict:
+    return {row.month: row.income for row in db.execute(monthly_income_query(tutor_id))}
+
+
+def rollup_income(db, tutor_id: int) -> dict:
+    return {
+        row.month.strftime("%Y-%m"): row.income
+        for row in db.execute(
+            select(TutorMonthlyEarning.month, TutorMonthlyEarning.income)
+            .where(TutorMonthlyEarning.tutor_id == tutor_id)
+            .order_by(TutorMonthlyEarning.month)
+        )
+    }
+
+
+def python_income(db, tutor_id: int) -> dict:
+    current_date = db.execute(select(func.now())).scalar().astimezone(timezone.utc)
+    leads = db.execute(
+        select(StudentRegistration).where(
+            StudentRegistration.accepted_by_tutor_id == tutor_id,
+            StudentRegistration.status == LeadStatus.TUTOR_MATCHED,
+        )
+    ).scalars().all()
+    return compute_monthly_income(leads, current_date)
+
+
+def test_query_matches_the_python_reference(db, tutor_ids):
+    assert parity_mismatches(db, tutor_ids.values()) == []
+
+
+def test_rollup_matches_the_python_reference(db, tutor_ids):
+    for stmt in rollup_statements():
+        db.execute(stmt)
+    db.commit()
+
+    for tutor_id in tutor_ids.values():
+        assert rollup_income(db, tutor_id) == python_income(db, tutor_id)
+
+
+@pytest.mark.parametrize("name", sorted(EXPECTED_INCOME))
+def test_finished_leads_count_each_month_up_to_the_end_date(db, tutor_ids, name):
+    assert sql_income(db, tutor_ids[name]) == EXPECTED_INCOME[name]
+
+
+def test_ongoing_lead_counts_every_month_since_creation(db, tutor_ids):
+    income = sql_income(db, tutor_ids["month_end"])
+    assert list(income.items())[:3] == [("2024-01", 8000), ("2024-02", 9234.5), ("2024-03", 8000)]
+    assert set(list(income.values())[2:]) == {8000}
+
+
+def test_excluded_leads_earn_nothing(db, tutor_ids):
+    # Only the zero-fee lead is expanded; the others are skipped by status, fee or end date
+    assert set(sql_income(db, tutor_ids["excluded"]).values()) == {0}
@@ -0,0 +1,48 @@
+from events import EventHub
+
+
+def drain(subscription) -> list:
+    events = []
+    while not subscription.queue.empty():
+        events.append(subscription.queue.get_nowait())
+    return events
+
+
+def test_reconnect_replays_events_after_the_last_id():
+    hub = EventHub(replay_size=10)
+    first = hub.publish("tutor", "lead_available", {"id": 1})
+    hub.publish("admin", "lead_deleted", {"id": 9})
+    second = hub.publish("tutor", "lead_taken", {"id": 1})
+
+    with hub.subscribe("tutor", last_event_id=first["id"]) as subscription:
+        assert drain(subscription) == [second]
+
+
+def test_id_from_another_hub_gets_a_refresh():
+    # Another worker, or this one before a restart: same sequence numbers, different epoch
+    other, hub = EventHub(), EventHub()
+    stale = other.publish("tutor", "lead_available", {"id": 1})
+    hub.publish("tutor", "lead_available", {"id": 2})
+    hub.publish("tutor", "lead_taken", {"id": 2})
+
+    for last_event_id in (stale["id"], "5", "garbage", f"{hub.epoch}-99"):
+        with hub.subscribe("tutor", last_event_id=last_event_id) as subscription:
+            assert [event["type"] for event in drain(subscription)] == ["refresh"]
+
+
+def test_id_older_than_the_replay_buffer_gets_a_refresh():
+    hub = EventHub(replay_size=2)
+    oldest = hub.publish("tutor", "lead_available", {"id": 1})
+    kept = hub.publish("tutor", "lead_available", {"id": 2})
+    for lead_id in (3, 4):
+        hub.publish("tutor", "lead_available", {"id": lead_id})
+
+    with hub.subscribe("tutor", last_event_id=oldest["id"]) as subscription:
+        [refresh] = drain(subscription)
+    assert refresh["type"] == "refresh"
+
+    # The refresh id is the current position: reconnecting with it replays nothing
+    with hub.subscribe("tutor", last_event_id=refresh["id"]) as subscription:
+        assert drain(subscription) == []
+    with hub.subscribe("tutor", last_event_id=kept["id"]) as subscription:
+        assert [event["data"]["id"] for event in drain(subscription)] == [3, 4]
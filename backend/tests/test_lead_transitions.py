@@ -0,0 +1,135 @@
+import asyncio
+
+from sqlalchemy import select, text
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from models import User, StudentRegistration, LeadStatus
+from lead_transitions import accept_lead_for_tutor, approve_match, reject_match
+
+TUTORS = 50
+ROUNDS = 3
+
+
+def seed(sync_engine, tutors: int, status: LeadStatus = LeadStatus.VERIFIED_AVAILABLE):
+    with sync_engine.begin() as conn:
+        tutor_ids = conn.execute(
+            User.__table__.insert().returning(User.id),
+            [{"username": f"tutor{i}", "user_type": "Tutor", "is_verified": True} for i in range(tutors)],
+        ).scalars().all()
+        lead_id = conn.execute(
+            StudentRegistration.__table__.insert().returning(StudentRegistration.id),
+            {"full_name": "Race Lead", "email": "race@example.com", "area": "DHA", "board": "ACCA",
+             "subjects": "Mathematics", "total_fee": 10000, "is_verified": True, "status": status},
+        ).scalar()
+    return tutor_ids, lead_id
+
+
+def lead_state(sync_engine, lead_id: int):
+    with sync_engine.connect() as conn:
+        return conn.execute(
+            select(StudentRegistration.status, StudentRegistration.accepted_by_tutor_id)
+            .where(StudentRegistration.id == lead_id)
+        ).one()
+
+
+async def race(url: str, lead_id: int, tutor_ids: list) -> list:
+    """Every tutor accepts the lead at the same moment, each on its own connection."""
+    engine = create_async_engine(url, pool_size=len(tutor_ids), max_overflow=0)
+    sessionmaker = async_sessionmaker(engine, expire_on_commit=False, autoflush=False)
+    start = asyncio.Event()
+
+    async def one(tutor_id):
+        async with sessionmaker() as db:
+            await db.execute(select(1))  # Hold a connection before the start line
+            await start.wait()
+            row = await accept_lead_for_tutor(db, lead_id, tutor_id)
+            await db.commit()
+            return tutor_id if row is not None else None
+
+    try:
+        tasks = [asyncio.create_task(one(tutor_id)) for tutor_id in tutor_ids]
+        await asyncio.sleep(0.5)
+        start.set()
+        return [winner for winner in await asyncio.gather(*tasks) if winner is not None]
+    finally:
+        await engine.dispose()
+
+
+def test_exactly_one_tutor_wins_a_concurrent_accept(sync_engine, async_database_url):
+    tutor_ids, lead_id = seed(sync_engine, TUTORS)
+    for _ in range(ROUNDS):
+        with sync_engine.begin() as conn:
+            conn.execute(
+                StudentRegistration.__table__.update()
+                .where(StudentRegistration.id == lead_id)
+                .values(status=LeadStatus.VERIFIED_AVAILABLE, accepted_by_tutor_id=None)
+            )
+
+        winners = asyncio.run(race(async_database_url, lead_id, tutor_ids))
+
+        assert len(winners) == 1
+        assert tuple(lead_state(sync_engine, lead_id)) == (LeadStatus.PENDING_TUTOR_APPROVAL, winners[0])
+
+
+def test_accept_skips_a_lead_locked_by_another_transaction(sync_engine, async_database_url):
+    tutor_ids, lead_id = seed(sync_engine, 1)
+
+    async def accept_while_locked():
+        engine = create_async_engine(async_database_url)
+        try:
+            async with engine.connect() as holder:
+                await holder.execute(
+                    select(StudentRegistration.id).where(StudentRegistration.id == lead_id).with_for_update()
+                )
+                async with async_sessionmaker(engine)() as db:
+                    # SKIP LOCKED must return at once rather than wait for the holder
+                    await db.execute(text("SET LOCAL lock_timeout = '1s'"))
+                    row = await accept_lead_for_tutor(db, lead_id, tutor_ids[0])
+                    await db.rollback()
+                await holder.rollback()
+            return row
+        finally:
+            await engine.dispose()
+
+    assert asyncio.run(accept_while_locked()) is None
+    assert tuple(lead_state(sync_engine, lead_id)) == (LeadStatus.VERIFIED_AVAILABLE, None)
+
+
+def test_accept_refuses_a_lead_that_is_not_available(sync_engine, async_database_url):
+    tutor_ids, lead_id = seed(sync_engine, 1, status=LeadStatus.PENDING_ADMIN_VERIFICATION)
+
+    async def accept():
+        engine = create_async_engine(async_database_url)
+        try:
+            async with async_sessionmaker(engine)() as db:
+                row = await accept_lead_for_tutor(db, lead_id, tutor_ids[0])
+                await db.commit()
+            return row
+        finally:
+            await engine.dispose()
+
+    assert asyncio.run(accept()) is None
+    assert tuple(lead_state(sync_engine, lead_id)) == (LeadStatus.PENDING_ADMIN_VERIFICATION, None)
+
+
+def test_reject_releases_the_lead_and_names_the_previous_tutor(sync_engine, async_database_url):
+    tutor_ids, lead_id = seed(sync_engine, 2)
+
+    async def accept_reject_approve():
+        engine = create_async_engine(async_database_url)
+        try:
+            async with async_sessionmaker(engine)() as db:
+                await accept_lead_for_tutor(db, lead_id, tutor_ids[0])
+                rejected = await reject_match(db, lead_id)
+                await accept_lead_for_tutor(db, lead_id, tutor_ids[1])
+                approved = await approve_match(db, lead_id)
+                await db.commit()
+            return rejected, approved
+        finally:
+            await engine.dispose()
+
+    rejected, approved = asyncio.run(accept_reject_approve())
+    assert rejected.previous_tutor_id == tutor_ids[0]
+    assert rejected.accepted_by_tutor_id is None
+    assert approved.accepted_by_tutor_id == tutor_ids[1]
+    assert tuple(lead_state(sync_engine, lead_id)) == (LeadStatus.TUTOR_MATCHED, tutor_ids[1])
@@ -0,0 +1,59 @@
+import asyncio
+from email.message import EmailMessage
+
+import pytest
+
+from mailer import SMTPPool
+
+
+class FakeConnection:
+    """Stands in for PooledConnection: refuses one recipient, records the rest."""
+
+    def __init__(self, refused: str):
+        self.refused = refused
+        self.sent = []
+        self.closes = 0
+
+    async def send(self, message):
+        if message["To"] == self.refused:
+            raise ConnectionError(f"{self.refused} refused")
+        self.sent.append(message["To"])
+
+    async def close(self):
+        self.closes += 1
+
+
+def message(recipient: str) -> EmailMessage:
+    msg = EmailMessage()
+    msg["To"] = recipient
+    msg.set_content("hello")
+    return msg
+
+
+def pool_with(connection) -> SMTPPool:
+    pool = SMTPPool(size=1)
+    pool._connections = [connection]
+    return pool
+
+
+def test_send_many_reports_each_message_and_keeps_going():
+    connection = FakeConnection(refused="b@example.com")
+    pool = pool_with(connection)
+
+    async def run():
+        errors = await pool.send_many([message(f"{name}@example.com") for name in "abc"])
+        return errors, pool._idle_queue().qsize()
+
+    errors, idle = asyncio.run(run())
+    assert [error is None for error in errors] == [True, False, True]
+    assert isinstance(errors[1], ConnectionError)
+    assert connection.sent == ["a@example.com", "c@example.com"]
+    assert connection.closes == 1
+    assert idle == 1  # The session is back in the pool
+
+
+def test_send_raises_the_error_of_its_message():
+    pool = pool_with(FakeConnection(refused="b@example.com"))
+
+    with pytest.raises(ConnectionError):
+        asyncio.run(pool.send(message("b@example.com")))
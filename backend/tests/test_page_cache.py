@@ -0,0 +1,37 @@
+from fastapi import FastAPI, Request
+from fastapi.templating import Jinja2Templates
+from fastapi.testclient import TestClient
+from starlette.middleware.sessions import SessionMiddleware
+
+from page_cache import PageCache
+
+
+def make_client(tmp_path, base_url):
+    (tmp_path / "home.html").write_text('<a href="{{ url_for(\'home\') }}">Home</a>')
+    cache = PageCache(Jinja2Templates(directory=str(tmp_path)), str(tmp_path), poll_seconds=0, base_url=base_url)
+    app = FastAPI()
+    app.add_middleware(SessionMiddleware, secret_key="test")
+
+    @app.get("/", name="home")
+    async def home(request: Request):
+        return cache.response(request, "home.html")
+
+    return TestClient(app), cache
+
+
+def test_links_use_the_public_base_url_whatever_the_host_header(tmp_path):
+    client, cache = make_client(tmp_path, "https://www.example.com")
+
+    for host in ("www.example.com", "evil.example.net", "127.0.0.1:8000"):
+        response = client.get("/", headers={"Host": host})
+        assert response.text == '<a href="https://www.example.com/">Home</a>'
+    assert cache.metrics()["entries"] == 1
+    assert cache.stats["hits"] == 2
+
+
+def test_pages_are_not_cached_without_a_public_base_url(tmp_path):
+    client, cache = make_client(tmp_path, None)
+
+    assert client.get("/", headers={"Host": "evil.example.net"}).text == '<a href="http://evil.example.net/">Home</a>'
+    assert client.get("/", headers={"Host": "www.example.com"}).text == '<a href="http://www.example.com/">Home</a>'
+    assert cache.metrics()["entries"] == 0
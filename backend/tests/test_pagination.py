@@ -0,0 +1,76 @@
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import select
+
+from models import StudentRegistration, User, LEAD_SORT_KEYS, TUTOR_SORT_KEYS
+from pagination import (
+    InvalidCursor,
+    decode_cursor,
+    encode_cursor,
+    keyset_paginate,
+    page_from_rows,
+)
+
+
+def test_cursor_round_trips_datetimes():
+    values = [datetime(2024, 3, 1, 12, 30), 17]
+    assert decode_cursor(encode_cursor(values)) == values
+
+
+@pytest.mark.parametrize("cursor", ["not-base64!", encode_cursor([1]), "eyJhIjoxfQ", encode_cursor([{"$dt": "soon"}, 1])])
+def test_malformed_cursor_is_rejected(cursor):
+    with pytest.raises(InvalidCursor):
+        decode_cursor(cursor)
+
+
+@pytest.mark.parametrize("sort, values", [
+    ("created_at", [datetime(2024, 3, 1), 5]),
+    ("full_name", ["Ali", 5]),
+    ("total_fee", [8000, 5]),  # JSON turns 8000.0 into an int
+    ("id", [5, 5]),
+])
+def test_cursor_of_the_sort_type_is_accepted(sort, values):
+    stmt = select(StudentRegistration)
+    keyset_paginate(stmt, LEAD_SORT_KEYS[sort], StudentRegistration.id, encode_cursor(values), limit=10)
+
+
+@pytest.mark.parametrize("sort, values", [
+    ("created_at", ["2024-03-01", 5]),
+    ("full_name", [3, 5]),
+    ("total_fee", [True, 5]),
+    ("id", [5, "5"]),
+])
+def test_cursor_of_another_type_is_rejected(sort, values):
+    stmt = select(StudentRegistration)
+    with pytest.raises(InvalidCursor):
+        keyset_paginate(stmt, LEAD_SORT_KEYS[sort], StudentRegistration.id, encode_cursor(values), limit=10)
+
+
+def test_pages_cover_every_row_once(sync_engine):
+    start = datetime(2024, 1, 1)
+    with sync_engine.begin() as conn:
+        conn.execute(StudentRegistration.__table__.insert(), [
+            # Repeated timestamps and NULLs exercise the id tie-break and the coalesce
+            {"full_name": f"Student {i}", "created_at": None if i % 7 == 0 else start + timedelta(days=i // 3)}
+            for i in range(40)
+        ])
+        conn.execute(User.__table__.insert(), [{"username": f"tutor{i}"} for i in range(12)])
+
+    def walk(sort_expr, id_col, descending):
+        seen, cursor = [], None
+        with sync_engine.connect() as conn:
+            while True:
+                stmt = keyset_paginate(select(id_col, sort_expr), sort_expr, id_col, cursor, limit=6,
+                                       descending=descending)
+                rows, cursor = page_from_rows(conn.execute(stmt).all(), 6, lambda row: (row[1], row[0]))
+                seen += [row[0] for row in rows]
+                if cursor is None:
+                    return seen
+
+    for sort_expr in LEAD_SORT_KEYS.values():
+        seen = walk(sort_expr, StudentRegistration.id, descending=True)
+        assert sorted(seen) == list(range(1, 41))
+    for sort_expr in TUTOR_SORT_KEYS.values():
+        seen = walk(sort_expr, User.id, descending=False)
+        assert sorted(seen) == list(range(1, 13))
@@ -0,0 +1,102 @@
+import asyncio
+import json
+
+import pytest
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+
+import profiler
+from profiler import ProfileStore, ProfilerMiddleware
+
+
+async def endless(media_type: str):
+    async def chunks():
+        while True:
+            yield "data: tick\n\n"
+            await asyncio.sleep(0.01)
+    return StreamingResponse(chunks(), media_type=media_type)
+
+
+app = FastAPI()
+
+
+@app.get("/events")
+async def events():
+    return await endless("text/event-stream")
+
+
+@app.get("/download")
+async def download():
+    return await endless("text/plain")
+
+
+def call(store, path: str, mode: str, messages: list):
+    """Run one admin request through the profiler; returns the coroutine."""
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+        "scheme": "http", "server": ("testserver", 80), "client": ("127.0.0.1", 1), "root_path": "",
+        "path": path, "raw_path": path.encode(), "query_string": f"profile={mode}".encode(),
+        "headers": [(b"host", b"testserver")], "session": {"user": {"user_type": "admin", "username": "admin"}},
+    }
+    disconnected = asyncio.Event()
+
+    async def receive():
+        await disconnected.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        messages.append(message)
+
+    return ProfilerMiddleware(app, store=store)(scope, receive, send)
+
+
+def headers(messages) -> dict:
+    return dict(messages[0]["headers"])
+
+
+@pytest.fixture(autouse=True)
+def short_deadline(monkeypatch):
+    monkeypatch.setattr(profiler, "PROFILE_MAX_SECONDS", 0.3)
+
+
+@pytest.mark.parametrize("mode", ["speedscope", "store"])
+def test_event_stream_is_sent_unprofiled(mode):
+    store, messages = ProfileStore(), []
+
+    async def run():
+        request = asyncio.create_task(call(store, "/events", mode, messages))
+        await asyncio.sleep(0.1)
+        busy = store.busy
+        request.cancel()
+        return busy
+
+    assert asyncio.run(run()) is False
+    assert headers(messages)[b"x-profile"] == b"refused"
+    assert b"tick" in messages[1]["body"]
+    assert store.list() == []
+
+
+def test_export_mode_ends_a_long_request_at_the_deadline():
+    store, messages = ProfileStore(), []
+
+    asyncio.run(asyncio.wait_for(call(store, "/download", "speedscope", messages), 5))
+
+    assert headers(messages)[b"content-type"] == b"application/json"
+    assert json.loads(messages[1]["body"])["profiles"][0]["samples"]
+    assert store.busy is False
+    assert len(store.list()) == 1
+
+
+def test_store_mode_releases_the_profiler_at_the_deadline():
+    store, messages = ProfileStore(), []
+
+    async def run():
+        request = asyncio.create_task(call(store, "/download", "store", messages))
+        await asyncio.sleep(0.6)
+        try:
+            return store.busy, request.done()
+        finally:
+            request.cancel()
+
+    assert asyncio.run(run()) == (False, False)
+    assert headers(messages)[b"x-profile-id"] == store.list()[0]["id"].encode()
@@ -0,0 +1,47 @@
+import os
+import uuid
+
+from PIL import Image, ImageOps
+
+# WebP derivatives of uploaded CNIC scans, rendered in worker processes (see
+# image_worker.py). This module only needs Pillow, so the pool's processes do
+# not import the web app, the database layer or its configuration.
+
+# kind -> (longest side in pixels, WebP quality); largest first, each is made from the previous
+DERIVATIVES = (
+    ("preview", 1280, 80),  # What an admin reviews on the tutor page
+    ("thumb", 240, 70),     # Table rows
+)
+
+
+def derivative_path(path: str, kind: str) -> str:
+    """uploads/cnic/<sha256>.jpg -> uploads/cnic/<sha256>.<kind>.webp"""
+    return f"{os.path.splitext(path)[0]}.{kind}.webp"
+
+
+def render_derivatives(root: str, path: str) -> dict:
+    """
+    Write every derivative of root/path that does not exist yet and return
+    {kind: path relative to root}. Runs in a worker process.
+    """
+    paths = {kind: derivative_path(path, kind) for kind, _, _ in DERIVATIVES}
+    if all(os.path.exists(os.path.join(root, p)) for p in paths.values()):
+        return paths
+
+    largest = DERIVATIVES[0][1]
+    with Image.open(os.path.join(root, path)) as original:
+        # JPEG scans decode at a reduced scale when that is still large enough
+        original.draft("RGB", (largest, largest))
+        image = ImageOps.exif_transpose(original).convert("RGB")
+
+    for kind, size, quality in DERIVATIVES:
+        image.thumbnail((size, size), Image.LANCZOS)
+        target = os.path.join(root, paths[kind])
+        temp = f"{target}.{uuid.uuid4().hex}.part"
+        try:
+            image.save(temp, "WEBP", quality=quality, method=4)
+            os.replace(temp, target)
+        finally:
+            if os.path.exists(temp):
+                os.remove(temp)
+    return paths
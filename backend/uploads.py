@@ -0,0 +1,257 @@
+import os
+import json
+import uuid
+import asyncio
+import hashlib
+import logging
+from dataclasses import dataclass
+
+import aiofiles
+from fastapi import HTTPException, UploadFile, status
+from sqlalchemy import func, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from dotenv import load_dotenv
+
+from database import AsyncSessionLocal
+from models import User
+
+# Load environment variables from .env file
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Streaming storage for user uploads (CNIC images).
+#
+# Files are copied to disk in fixed-size chunks, never read whole into memory,
+# and hashed on the way through. The content hash names the stored file, so an
+# identical re-upload (a retried signup) is stored once, and the name doubles
+# as an integrity check. Each file is written to a temporary name next to its
+# destination, fsynced and then renamed into place, so a half-written image is
+# never visible under /static.
+#
+# Because identical content shares one file, a failed request may only remove
+# a file it created if no user row references it by then. The check and the
+# removal run under a per-path advisory lock that a request saving a user row
+# also takes (UploadBatch.claim), so a file cannot vanish under a committing
+# signup that found it already stored.
+UPLOAD_ROOT = os.getenv("UPLOAD_ROOT", "static")  # Served at /static; stored paths are relative to it
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", str(64 * 1024)))
+CNIC_MAX_BYTES = int(os.getenv("CNIC_MAX_BYTES", str(5 * 1024 * 1024)))
+# Allowance for the non-file form fields and multipart framing of a request
+FORM_OVERHEAD_BYTES = 64 * 1024
+# First key of the two-key advisory lock on a stored path
+UPLOAD_LOCK_NAMESPACE = 6018
+
+# Leading bytes -> stored extension. CNIC scans are shown in an <img> on the
+# admin panel, so only formats every browser renders are accepted.
+IMAGE_SIGNATURES = (
+    (b"\xff\xd8\xff", ".jpg"),
+    (b"\x89PNG\r\n\x1a\n", ".png"),
+)
+
+
+class UploadRejected(ValueError):
+    """Raised when an upload is not an accepted image."""
+
+
+class UploadTooLarge(UploadRejected):
+    """Raised as soon as an upload passes its size limit."""
+
+
+class UploadGone(UploadRejected):
+    """Raised by UploadBatch.claim when a concurrent failed request removed shared content."""
+
+
+def sniff_image(head: bytes):
+    """Return the extension for the image format of these leading bytes, or None."""
+    for signature, extension in IMAGE_SIGNATURES:
+        if head.startswith(signature):
+            return extension
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return ".webp"
+    return None
+
+
+@dataclass
+class StoredUpload:
+    path: str       # Relative to UPLOAD_ROOT, as stored in the database
+    sha256: str
+    size: int
+    created: bool   # False when identical content was already stored
+
+    @property
+    def abs_path(self) -> str:
+        return os.path.join(UPLOAD_ROOT, self.path)
+
+
+async def save_upload(upload: UploadFile, folder: str, max_bytes: int = CNIC_MAX_BYTES) -> StoredUpload:
+    """
+    Stream an uploaded image to UPLOAD_ROOT/uploads/<folder>/<sha256><ext>.
+
+    Raises UploadTooLarge as soon as more than max_bytes have been read and
+    UploadRejected if the content is not a JPEG, PNG or WebP image; nothing is
+    left on disk in either case.
+    """
+    directory = os.path.join(UPLOAD_ROOT, "uploads", folder)
+    os.makedirs(directory, exist_ok=True)
+    # Same directory as the destination, so the final rename cannot cross filesystems
+    temp_path = os.path.join(directory, f".upload-{uuid.uuid4().hex}.part")
+    digest = hashlib.sha256()
+    size = 0
+    extension = None
+    try:
+        async with aiofiles.open(temp_path, "wb") as f:
+            while True:
+                chunk = await upload.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                if extension is None:
+                    extension = sniff_image(chunk)
+                    if extension is None:
+                        raise UploadRejected("Only JPEG, PNG or WebP images are accepted")
+                size += len(chunk)
+                if size > max_bytes:
+                    raise UploadTooLarge(f"Images must be at most {max_bytes // (1024 * 1024)} MB")
+                digest.update(chunk)
+                await f.write(chunk)
+            if extension is None:
+                raise UploadRejected("The uploaded file is empty")
+            await f.flush()
+            await asyncio.to_thread(os.fsync, f.fileno())
+
+        sha256 = digest.hexdigest()
+        path = os.path.join("uploads", folder, f"{sha256}{extension}")
+        final_path = os.path.join(UPLOAD_ROOT, path)
+        if os.path.exists(final_path):
+            os.remove(temp_path)
+            return StoredUpload(path, sha256, size, created=False)
+        os.replace(temp_path, final_path)
+        return StoredUpload(path, sha256, size, created=True)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def lock_path_statement(path: str):
+    return select(func.pg_advisory_xact_lock(UPLOAD_LOCK_NAMESPACE, func.hashtext(path)))
+
+
+class UploadBatch:
+    """
+    The files saved for one request, removed again if the request fails.
+
+    Only files this batch created are removed, and only while no user row
+    references them: the same content may have been stored for another request
+    in the meantime.
+    """
+
+    def __init__(self):
+        self.stored = []
+
+    async def save(self, upload: UploadFile, folder: str, max_bytes: int = CNIC_MAX_BYTES) -> StoredUpload:
+        stored = await save_upload(upload, folder, max_bytes)
+        self.stored.append(stored)
+        return stored
+
+    async def claim(self, db: AsyncSession):
+        """
+        Lock the stored paths in the caller's transaction (held until it commits)
+        and check the files are still there. Call before adding the rows that
+        reference them; raises UploadGone if a failed request removed one.
+        """
+        for path in sorted({stored.path for stored in self.stored}):
+            await db.execute(lock_path_statement(path))
+        for stored in self.stored:
+            if not os.path.exists(stored.abs_path):
+                raise UploadGone("The upload was interrupted, please try again")
+
+    async def discard(self):
+        for path in sorted({stored.path for stored in self.stored if stored.created}):
+            try:
+                async with AsyncSessionLocal() as db:
+                    await db.execute(lock_path_statement(path))
+                    referenced = (await db.execute(
+                        select(User.id).where(or_(User.cnic_front_path == path, User.cnic_back_path == path)).limit(1)
+                    )).first()
+                    if referenced is None:
+                        os.remove(os.path.join(UPLOAD_ROOT, path))
+                    await db.commit()
+            except Exception as e:
+                logger.error(f"Failed to remove upload {path}: {str(e)}")
+        self.stored = []
+
+
+class RequestTooLarge(HTTPException):
+    """
+    Raised from the body stream once it passes the limit. An HTTPException,
+    because FastAPI passes those through body parsing unchanged (anything else
+    is reported as a generic 400 parse error).
+    """
+
+    def __init__(self, limit: int):
+        super().__init__(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"Request body exceeds {limit} bytes"
+        )
+
+
+class RequestSizeLimitMiddleware:
+    """
+    Refuse oversized request bodies on upload routes before they are parsed.
+
+    The multipart parser spools every file part to a temporary file before the
+    route handler runs, so a per-file check in the handler alone would still
+    accept gigabytes. A declared Content-Length over the limit is refused
+    without reading the body; a body that turns out longer is cut off once the
+    limit is crossed.
+    """
+
+    def __init__(self, app, limits: dict):
+        self.app = app
+        self.limits = limits  # path -> max body bytes
+
+    async def __call__(self, scope, receive, send):
+        limit = self.limits.get(scope["path"]) if scope["type"] == "http" else None
+        if limit is None:
+            await self.app(scope, receive, send)
+            return
+
+        content_length = dict(scope["headers"]).get(b"content-length")
+        if content_length is not None and content_length.isdigit() and int(content_length) > limit:
+            await self._reject(send, limit)
+            return
+
+        received = 0
+        response_started = False
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    raise RequestTooLarge(limit)
+            return message
+
+        async def tracking_send(message):
+            nonlocal response_started
+            if message["type"] == "http.response.start":
+                response_started = True
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, tracking_send)
+        except RequestTooLarge:
+            if not response_started:
+                await self._reject(send, limit)
+
+    @staticmethod
+    async def _reject(send, limit: int):
+        body = json.dumps({"detail": f"Request body exceeds {limit} bytes"}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+        })
+        await send({"type": "http.response.body", "body": body})